@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+ADS-B模拟数据生成器
+模拟N架飞机的航迹（巡航、转弯、爬升/下降），按真实的发送节奏生成DF17扩展电文：
+空中位置（TC 11，CPR编码，偶/奇帧交替）、空中速度（TC 19）和识别（TC 4），
+带正确的CRC-24校验；可混入短帧（DF11/DF4）噪声和误码/截断帧，
+输出AVR文本（*8D...;，与接收机串口输出和nav.py的输入一致）或Beast二进制格式。
+
+用法：
+    python adsb_simulator.py --aircraft 50 --duration 60 > traffic.avr
+    python adsb_simulator.py --format beast --realtime | nc -l 30005
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+# 参考中心（与nav.py的ENU参考点一致）
+CENTER_LATITUDE = 39.9
+CENTER_LONGITUDE = 116.4
+
+EARTH_RADIUS = 6371000.0  # 米
+KNOT = 0.514444           # 米/秒
+
+CPR_SCALE = 131072  # 2^17
+NZ = 15
+
+# 各类电文的发送间隔（秒）：位置和速度约每秒2次，识别约每5秒1次
+POSITION_INTERVAL = 0.5
+VELOCITY_INTERVAL = 0.5
+IDENT_INTERVAL = 5.0
+
+# Mode S CRC-24生成多项式
+CRC24_GENERATOR = 0xFFF409
+
+# 识别电文的6位字符集
+CALLSIGN_CHARSET = '#ABCDEFGHIJKLMNOPQRSTUVWXYZ##### ###############0123456789######'
+AIRLINES = ('CCA', 'CES', 'CSN', 'CHH', 'CXA', 'CSC', 'CDG', 'CSZ')
+
+BEAST_ESCAPE = 0x1A
+BEAST_CLOCK = 12000000  # Beast时间戳为12 MHz计数
+
+
+def _build_crc_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte << 16
+        for _ in range(8):
+            crc = ((crc << 1) ^ CRC24_GENERATOR) if crc & 0x800000 else crc << 1
+        table.append(crc & 0xFFFFFF)
+    return table
+
+
+CRC_TABLE = _build_crc_table()
+
+
+def crc24(data: bytes) -> int:
+    """Mode S CRC-24（对整帧计算时，校验正确的帧结果为0）"""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFF) ^ CRC_TABLE[(crc >> 16) ^ byte]
+    return crc
+
+
+def with_parity(payload: bytes) -> bytes:
+    """在报文后附加24位校验（DF17/DF18的PI字段，地址/询问码为0）"""
+    return payload + crc24(payload).to_bytes(3, 'big')
+
+
+def cpr_nl(latitude: float) -> int:
+    """纬度对应的经度区域数NL（标准公式）"""
+    abs_lat = abs(latitude)
+    if abs_lat > 87.0:
+        return 1
+    if abs_lat == 87.0:
+        return 2
+    if abs_lat < 1e-9:
+        return 59
+    a = 1 - math.cos(math.pi / (2 * NZ))
+    return int(2 * math.pi / math.acos(1 - a / math.cos(math.radians(abs_lat)) ** 2))
+
+
+def cpr_encode(latitude: float, longitude: float, odd: bool) -> Tuple[int, int]:
+    """空中位置的CPR编码（17位），返回(纬度编码, 经度编码)"""
+    i = 1 if odd else 0
+    dlat = 360.0 / (4 * NZ - i)
+    yz = math.floor(CPR_SCALE * (latitude % dlat) / dlat + 0.5)
+    rlat = dlat * (yz / CPR_SCALE + math.floor(latitude / dlat))
+    dlon = 360.0 / max(cpr_nl(rlat) - i, 1)
+    xz = math.floor(CPR_SCALE * (longitude % dlon) / dlon + 0.5)
+    return yz % CPR_SCALE, xz % CPR_SCALE
+
+
+def encode_altitude(altitude: int) -> int:
+    """12位气压高度字段（Q位=1，25英尺精度）"""
+    n = max(0, min(0x7FF, round((altitude + 1000) / 25)))
+    return ((n >> 4) << 5) | 0x10 | (n & 0x0F)
+
+
+def df17(icao: int, me: int, capability: int = 5) -> bytes:
+    """组装DF17扩展电文（112位）：DF | CA | ICAO | ME(56位) | PI"""
+    payload = ((17 << 3 | capability) << 80 | icao << 56 | me).to_bytes(11, 'big')
+    return with_parity(payload)
+
+
+def position_me(latitude: float, longitude: float, altitude: int, odd: bool, type_code: int = 11) -> int:
+    """空中位置ME字段：TC | SS | SAF | ALT | T | F | LAT-CPR | LON-CPR"""
+    lat_cpr, lon_cpr = cpr_encode(latitude, longitude, odd)
+    return (type_code << 51 | encode_altitude(altitude) << 36 | int(odd) << 34 |
+            lat_cpr << 17 | lon_cpr)
+
+
+def velocity_me(speed_kt: float, heading: float, vertical_rate_fpm: float) -> int:
+    """空中速度ME字段（TC 19，子类型1：地速的东西/南北分量和垂直速率）"""
+    v_ew = speed_kt * math.sin(math.radians(heading))
+    v_ns = speed_kt * math.cos(math.radians(heading))
+    ew = min(1022, round(abs(v_ew))) + 1
+    ns = min(1022, round(abs(v_ns))) + 1
+    vr = min(510, round(abs(vertical_rate_fpm) / 64)) + 1
+    return (19 << 51 | 1 << 48 | (v_ew < 0) << 42 | ew << 32 | (v_ns < 0) << 31 | ns << 21 |
+            (vertical_rate_fpm < 0) << 19 | vr << 10)
+
+
+def ident_me(callsign: str, category: int = 3) -> int:
+    """识别ME字段（TC 4，航班号8个字符，每个6位）"""
+    me = 4 << 51 | category << 48
+    for index, char in enumerate(callsign.upper().ljust(8)[:8]):
+        code = CALLSIGN_CHARSET.find(char)
+        me |= (code if code > 0 else 32) << (42 - 6 * index)
+    return me
+
+
+def short_frame(df: int, icao: int, rng: random.Random) -> bytes:
+    """56位短帧（DF11全呼应答或DF4高度应答），作为非DF17噪声"""
+    if df == 11:
+        payload = (11 << 3 | 5) << 24 | icao
+        return with_parity(payload.to_bytes(4, 'big'))
+    payload = (4 << 27 | rng.getrandbits(27)).to_bytes(4, 'big')
+    return payload + rng.getrandbits(24).to_bytes(3, 'big')  # PI与地址异或，不能直接校验
+
+
+class SimulatedAircraft:
+    """一架模拟飞机：匀速飞行，偶尔转弯或改变高度，离开范围时转向中心"""
+
+    def __init__(self, rng: random.Random, center: Tuple[float, float], radius: float):
+        self.rng = rng
+        self.center = center
+        self.radius = radius
+        self.icao = rng.randrange(0x780000, 0x7BFFFF)  # 中国地址段
+        self.callsign = f"{rng.choice(AIRLINES)}{rng.randrange(100, 9999)}"
+        distance = radius * math.sqrt(rng.random())
+        bearing = rng.uniform(0, 360)
+        self.latitude, self.longitude = self._offset(center[0], center[1], distance, bearing)
+        self.altitude = float(rng.randrange(3000, 39000, 100))
+        self.speed = rng.uniform(220, 480)     # 节
+        self.heading = rng.uniform(0, 360)     # 度
+        self.turn_rate = 0.0                   # 度/秒
+        self.vertical_rate = 0.0               # 英尺/分
+        self.target_altitude = self.altitude
+        self.odd = rng.random() < 0.5
+        # 各类电文的下次发送时间（错开，避免所有飞机同一时刻发送）
+        self.next_position = rng.uniform(0, POSITION_INTERVAL)
+        self.next_velocity = rng.uniform(0, VELOCITY_INTERVAL)
+        self.next_ident = rng.uniform(0, IDENT_INTERVAL)
+
+    @staticmethod
+    def _offset(latitude: float, longitude: float, distance: float, bearing: float) -> Tuple[float, float]:
+        """从给定点沿方位角移动distance米后的位置（球面近似）"""
+        d = distance / EARTH_RADIUS
+        lat1, lon1, theta = math.radians(latitude), math.radians(longitude), math.radians(bearing)
+        lat2 = math.asin(math.sin(lat1) * math.cos(d) + math.cos(lat1) * math.sin(d) * math.cos(theta))
+        lon2 = lon1 + math.atan2(math.sin(theta) * math.sin(d) * math.cos(lat1),
+                                 math.cos(d) - math.sin(lat1) * math.sin(lat2))
+        return math.degrees(lat2), (math.degrees(lon2) + 540) % 360 - 180
+
+    def _bearing_to_center(self) -> Tuple[float, float]:
+        """(距中心的距离（米）, 指向中心的方位角)"""
+        lat1, lat2 = math.radians(self.latitude), math.radians(self.center[0])
+        dlon = math.radians(self.center[1] - self.longitude)
+        y = math.sin(dlon) * math.cos(lat2)
+        x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
+        a = (math.sin((lat2 - lat1) / 2) ** 2 +
+             math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2)
+        return 2 * EARTH_RADIUS * math.asin(math.sqrt(a)), math.degrees(math.atan2(y, x)) % 360
+
+    def step(self, dt: float):
+        """推进dt秒"""
+        rng = self.rng
+        distance, to_center = self._bearing_to_center()
+        if distance > self.radius:
+            # 以标准转弯率（3度/秒）转向中心
+            delta = (to_center - self.heading + 540) % 360 - 180
+            self.turn_rate = math.copysign(3.0, delta) if abs(delta) > 5 else 0.0
+        elif rng.random() < dt / 120:
+            self.turn_rate = rng.choice((-3.0, -1.5, 0.0, 0.0, 1.5, 3.0))
+        if rng.random() < dt / 300:
+            self.target_altitude = float(rng.randrange(3000, 39000, 1000))
+        if abs(self.target_altitude - self.altitude) > 50:
+            self.vertical_rate = math.copysign(rng.uniform(800, 2500) if not self.vertical_rate
+                                               else abs(self.vertical_rate),
+                                               self.target_altitude - self.altitude)
+        else:
+            self.vertical_rate = 0.0
+
+        self.heading = (self.heading + self.turn_rate * dt) % 360
+        self.altitude += self.vertical_rate / 60 * dt
+        self.latitude, self.longitude = self._offset(self.latitude, self.longitude,
+                                                     self.speed * KNOT * dt, self.heading)
+
+    def frames_until(self, t: float) -> List[Tuple[float, bytes]]:
+        """发送时间不晚于t的各类电文，[(发送时间, 帧)]"""
+        frames = []
+        while self.next_position <= t:
+            me = position_me(self.latitude, self.longitude, int(self.altitude), self.odd)
+            frames.append((self.next_position, df17(self.icao, me)))
+            self.odd = not self.odd
+            self.next_position += POSITION_INTERVAL * self.rng.uniform(0.8, 1.2)
+        while self.next_velocity <= t:
+            me = velocity_me(self.speed, self.heading, self.vertical_rate)
+            frames.append((self.next_velocity, df17(self.icao, me)))
+            self.next_velocity += VELOCITY_INTERVAL * self.rng.uniform(0.8, 1.2)
+        while self.next_ident <= t:
+            frames.append((self.next_ident, df17(self.icao, ident_me(self.callsign))))
+            self.next_ident += IDENT_INTERVAL * self.rng.uniform(0.8, 1.2)
+        return frames
+
+
+class TrafficSimulator:
+    """多架飞机的模拟数据流（给定种子时结果可重复）
+
+    Args:
+        aircraft: 飞机数
+        seed: 随机种子
+        center: 空域中心(纬度, 经度)
+        radius_km: 空域半径（千米）
+        noise: 每个DF17帧附带一个短帧（DF11/DF4）的概率
+        corruption: 每帧被破坏（随机翻转1位使CRC失败，或截断）的概率
+        step: 航迹推进的时间步长（秒）
+    """
+
+    def __init__(self, aircraft: int = 50, seed: Optional[int] = 1,
+                 center: Tuple[float, float] = (CENTER_LATITUDE, CENTER_LONGITUDE),
+                 radius_km: float = 250.0, noise: float = 0.0, corruption: float = 0.0,
+                 step: float = 0.1):
+        self.rng = random.Random(seed)
+        self.noise = noise
+        self.corruption = corruption
+        self.step_seconds = step
+        self.time = 0.0
+        self.aircraft = [SimulatedAircraft(self.rng, center, radius_km * 1000) for _ in range(aircraft)]
+
+    def _corrupt(self, frame: bytes) -> bytes:
+        rng = self.rng
+        if rng.random() < 0.5:
+            return frame[:rng.randrange(1, len(frame))]  # 截断
+        bit = rng.randrange(len(frame) * 8)
+        data = bytearray(frame)
+        data[bit // 8] ^= 0x80 >> (bit % 8)
+        return bytes(data)
+
+    def frames(self, duration: float) -> Iterator[Tuple[float, bytes]]:
+        """按时间顺序生成duration秒内的帧，(相对时间（秒）, 帧)"""
+        end = self.time + duration
+        rng = self.rng
+        while self.time < end:
+            self.time = min(self.time + self.step_seconds, end)
+            batch = []
+            for plane in self.aircraft:
+                plane.step(self.step_seconds)
+                frames = plane.frames_until(self.time)
+                batch.extend(frames)
+                for _ in range(len(frames) if self.noise else 0):
+                    if rng.random() < self.noise:
+                        batch.append((self.time - rng.uniform(0, self.step_seconds),
+                                      short_frame(rng.choice((4, 11)), plane.icao, rng)))
+            batch.sort(key=lambda item: item[0])
+            for timestamp, frame in batch:
+                if self.corruption and rng.random() < self.corruption:
+                    frame = self._corrupt(frame)
+                yield timestamp, frame
+
+    def truth(self) -> dict:
+        """当前各飞机的真实状态，ICAO（6位十六进制大写）-> (纬度, 经度, 高度（英尺）)"""
+        return {f"{plane.icao:06X}": (plane.latitude, plane.longitude, int(plane.altitude))
+                for plane in self.aircraft}
+
+
+def format_avr(frame: bytes) -> str:
+    """AVR文本格式：*<十六进制>;"""
+    return f"*{frame.hex().upper()};"
+
+
+def format_beast(frame: bytes, timestamp: float, signal: int = 0x80) -> bytes:
+    """Beast二进制格式：0x1A | 类型（'2'短帧/'3'长帧）| 48位12MHz时间戳 | 信号强度 | 帧，
+    正文中的0x1A重复一次转义"""
+    kind = b'3' if len(frame) == 14 else b'2' if len(frame) == 7 else b'1'
+    body = (int(timestamp * BEAST_CLOCK) & 0xFFFFFFFFFFFF).to_bytes(6, 'big') + bytes((signal,)) + frame
+    return bytes((BEAST_ESCAPE,)) + kind + body.replace(b'\x1a', b'\x1a\x1a')
+
+
+def generate_lines(aircraft: int = 50, duration: float = 60.0, seed: Optional[int] = 1,
+                   noise: float = 0.0, corruption: float = 0.0) -> List[Tuple[float, str]]:
+    """生成AVR文本行列表[(相对时间, 行)]，供基准测试和压测使用"""
+    simulator = TrafficSimulator(aircraft, seed, noise=noise, corruption=corruption)
+    return [(timestamp, format_avr(frame)) for timestamp, frame in simulator.frames(duration)]
+
+
+def verify_decoding(aircraft: int = 20, duration: float = 30.0, seed: int = 1) -> dict:
+    """用nav.py的解码器解码模拟数据，统计解码出的位置与真实航迹的偏差
+
+    返回{'frames', 'positions', 'aircraft', 'max_error_m', 'crc_ok'}；
+    与解码时刻的真实位置比较，偏差应在CPR量化误差（约5米）以内
+    """
+    from nav import ADSBDecoder
+
+    simulator = TrafficSimulator(aircraft, seed)
+    decoder = ADSBDecoder()
+    start = time.monotonic()
+    frames = positions = crc_ok = 0
+    max_error = 0.0
+    decoded_icaos = set()
+    for timestamp, frame in simulator.frames(duration):
+        frames += 1
+        crc_ok += crc24(frame) == 0
+        position = decoder.process_position_message(frame.hex().upper(), start + timestamp)
+        if position is None:
+            continue
+        positions += 1
+        decoded_icaos.add(position.icao)
+        lat, lon, _ = simulator.truth()[position.icao]
+        dy = math.radians(position.latitude - lat) * EARTH_RADIUS
+        dx = math.radians(position.longitude - lon) * EARTH_RADIUS * math.cos(math.radians(lat))
+        max_error = max(max_error, math.hypot(dx, dy))
+    return {'frames': frames, 'positions': positions, 'aircraft': len(decoded_icaos),
+            'max_error_m': max_error, 'crc_ok': crc_ok}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ADS-B模拟数据生成器（AVR文本或Beast二进制）')
+    parser.add_argument('--aircraft', type=int, default=50, help='飞机数')
+    parser.add_argument('--duration', type=float, default=60.0, help='模拟时长（秒）')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子（相同种子生成相同的数据）')
+    parser.add_argument('--radius', type=float, default=250.0, help='空域半径（千米）')
+    parser.add_argument('--center', type=float, nargs=2, default=(CENTER_LATITUDE, CENTER_LONGITUDE),
+                        metavar=('LAT', 'LON'), help='空域中心')
+    parser.add_argument('--noise', type=float, default=0.0, help='混入DF11/DF4短帧的概率（每帧）')
+    parser.add_argument('--corruption', type=float, default=0.0, help='帧被翻转1位或截断的概率')
+    parser.add_argument('--format', choices=('avr', 'beast'), default='avr', help='输出格式')
+    parser.add_argument('--output', default='-', help='输出文件（默认标准输出）')
+    parser.add_argument('--realtime', action='store_true', help='按模拟时间实时输出（可接到串口或网络）')
+    parser.add_argument('--verify', action='store_true', help='用nav.py的解码器校验生成的数据后退出')
+    args = parser.parse_args()
+
+    if args.verify:
+        result = verify_decoding(seed=args.seed)
+        print(f"{result['frames']} 帧（CRC正确 {result['crc_ok']}），解码出 {result['positions']} 个位置、"
+              f"{result['aircraft']} 架飞机，最大偏差 {result['max_error_m']:.0f} 米")
+        return
+
+    simulator = TrafficSimulator(args.aircraft, args.seed, tuple(args.center), args.radius,
+                                 args.noise, args.corruption)
+    binary = args.format == 'beast'
+    if args.output == '-':
+        output = sys.stdout.buffer
+    else:
+        output = open(args.output, 'wb')
+    started = time.monotonic()
+    count = 0
+    try:
+        for timestamp, frame in simulator.frames(args.duration):
+            if args.realtime:
+                delay = started + timestamp - time.monotonic()
+                if delay > 0:
+                    output.flush()
+                    time.sleep(delay)
+            if binary:
+                output.write(format_beast(frame, timestamp))
+            else:
+                output.write(format_avr(frame).encode('ascii') + b'\n')
+            count += 1
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+            print(f"已写入 {count} 帧到 {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
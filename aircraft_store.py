@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+实时飞机状态存储
+按ICAO索引飞机最新状态，并在ENU平面上维护均匀网格空间索引，
+支持矩形范围、圆形半径和高度层查询，查询开销与结果规模成正比
+"""
+
+import json
+import math
+import random
+import struct
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from coord_converter import CoordinateConverter
+
+# API输出的飞机字段（to_dict的键，按输出顺序）
+AIRCRAFT_FIELDS = ('icao', 'lat', 'lon', 'alt', 'timestamp', 'time_diff',
+                   'ecef_x', 'ecef_y', 'ecef_z', 'enu_e', 'enu_n', 'enu_u')
+
+# 二进制响应格式（小端序）
+# 头部40字节：魔数'ADSB'、格式版本、每条记录字节数、数据版本、服务端时间（Unix）、
+#   本次记录数、分页前总数、移除的飞机数、标志（bit0为全量）
+# 每架飞机56字节：ICAO(uint32)、高度ft(int32)、纬度、经度、位置时间(float64)、
+#   ECEF x/y/z、ENU e/n/u(float32，缺少的坐标为NaN)；time_diff = 服务端时间 - 位置时间
+# 记录之后是移除的飞机ICAO(uint32)
+BINARY_MAGIC = b'ADSB'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sHHddIIII')
+BINARY_RECORD = struct.Struct('<Iidddffffff')
+BINARY_ICAO = struct.Struct('<I')
+BINARY_FULL = 1
+INVALID_ICAO = 0xFFFFFFFF  # 不是24位十六进制地址的ICAO
+
+
+@dataclass
+class AircraftState:
+    """单架飞机的最新状态"""
+    icao: str
+    lat: float
+    lon: float
+    alt: int
+    time: float            # 位置时间（Unix时间戳）
+    timestamp: str = ''    # 日志中的原始时间字符串
+    ecef_x: Optional[float] = None
+    ecef_y: Optional[float] = None
+    ecef_z: Optional[float] = None
+    enu_e: float = 0.0
+    enu_n: float = 0.0
+    enu_u: float = 0.0
+    # 预序列化的JSON片段（除time_diff外的所有字段）。状态更新时整体替换为新对象，缓存随之失效
+    _json_prefix: Optional[bytes] = field(default=None, init=False, repr=False, compare=False)
+    # 预编码的二进制记录（不含随时间变化的字段，编码一次即可一直复用）
+    _binary: Optional[bytes] = field(default=None, init=False, repr=False, compare=False)
+
+    def to_dict(self, now: Optional[float] = None, fields: Optional[Tuple[str, ...]] = None) -> dict:
+        """转换为API输出格式（time_diff按当前时间计算），fields指定时只输出这些字段"""
+        if now is None:
+            now = time.time()
+        if fields is not None:
+            return {name: now - self.time if name == 'time_diff' else getattr(self, name)
+                    for name in fields}
+        return {
+            'icao': self.icao,
+            'lat': self.lat,
+            'lon': self.lon,
+            'alt': self.alt,
+            'timestamp': self.timestamp,
+            'time_diff': now - self.time,
+            'ecef_x': self.ecef_x,
+            'ecef_y': self.ecef_y,
+            'ecef_z': self.ecef_z,
+            'enu_e': self.enu_e,
+            'enu_n': self.enu_n,
+            'enu_u': self.enu_u
+        }
+
+    def json_fragment(self, now: Optional[float] = None) -> bytes:
+        """API输出格式的JSON字节：字段部分只序列化一次，每次只追加按当前时间计算的time_diff"""
+        if now is None:
+            now = time.time()
+        prefix = self._json_prefix
+        if prefix is None:
+            data = {name: getattr(self, name) for name in AIRCRAFT_FIELDS if name != 'time_diff'}
+            text = json.dumps(data, ensure_ascii=False)
+            prefix = self._json_prefix = (text[:-1] + ', "time_diff": ').encode('utf-8')
+        return prefix + repr(now - self.time).encode('ascii') + b'}'
+
+    def binary_record(self) -> bytes:
+        """二进制格式的记录（见BINARY_RECORD）"""
+        record = self._binary
+        if record is None:
+            nan = float('nan')
+            record = self._binary = BINARY_RECORD.pack(
+                icao_number(self.icao), self.alt, self.lat, self.lon, self.time,
+                nan if self.ecef_x is None else self.ecef_x,
+                nan if self.ecef_y is None else self.ecef_y,
+                nan if self.ecef_z is None else self.ecef_z,
+                self.enu_e, self.enu_n, self.enu_u)
+        return record
+
+
+def icao_number(icao: str) -> int:
+    """ICAO地址字符串转换为整数（无效时为INVALID_ICAO）"""
+    try:
+        number = int(icao, 16)
+    except ValueError:
+        return INVALID_ICAO
+    return number if 0 <= number <= 0xFFFFFF else INVALID_ICAO
+
+
+def states_json(states: Iterable[AircraftState], now: Optional[float] = None) -> bytes:
+    """拼接多架飞机的JSON片段为JSON数组"""
+    if now is None:
+        now = time.time()
+    return b'[' + b', '.join([state.json_fragment(now) for state in states]) + b']'
+
+
+def states_binary(states: List[AircraftState], now: float, version: int = 0,
+                  total: Optional[int] = None, removed: Optional[List[str]] = None,
+                  full: bool = True) -> bytes:
+    """按二进制格式编码飞机列表（头部 + 每架飞机的缓存记录 + 移除的ICAO）"""
+    removed = removed or []
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, BINARY_RECORD.size, float(version), now,
+                                len(states), len(states) if total is None else total, len(removed),
+                                BINARY_FULL if full else 0)
+    return b''.join([header] + [state.binary_record() for state in states] +
+                    [BINARY_ICAO.pack(icao_number(icao)) for icao in removed])
+
+
+def decode_binary(data: bytes) -> dict:
+    """解码二进制响应（与页面中的DataView解码器相同，用于测试和基准）"""
+    magic, layout, record_size, version, now, count, total, removed_count, flags = \
+        BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC or layout != BINARY_VERSION:
+        raise ValueError('不是ADS-B二进制响应')
+    aircraft = []
+    offset = BINARY_HEADER.size
+    for _ in range(count):
+        icao, alt, lat, lon, t, *coords = BINARY_RECORD.unpack_from(data, offset)
+        item = {'icao': f'{icao:06X}', 'lat': lat, 'lon': lon, 'alt': alt, 'time': t,
+                'time_diff': now - t}
+        item.update((name, None if math.isnan(value) else value)
+                    for name, value in zip(AIRCRAFT_FIELDS[6:], coords))
+        aircraft.append(item)
+        offset += record_size
+    removed = [f'{icao:06X}' for (icao,) in BINARY_ICAO.iter_unpack(data[offset:offset + 4 * removed_count])]
+    return {'version': int(version), 'full': bool(flags & BINARY_FULL), 'count': count, 'total': total,
+            'aircraft': aircraft, 'removed': removed}
+
+
+class GridIndex:
+    """ENU水平面上的均匀网格索引"""
+
+    def __init__(self, cell_size_km: float = 20.0):
+        self.cell_size = cell_size_km * 1000.0  # 单元格边长，单位：米
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}
+        self.cell_of: Dict[str, Tuple[int, int]] = {}
+
+    def cell_key(self, enu_e: float, enu_n: float) -> Tuple[int, int]:
+        """计算ENU坐标所在的单元格"""
+        return math.floor(enu_e / self.cell_size), math.floor(enu_n / self.cell_size)
+
+    def insert(self, icao: str, enu_e: float, enu_n: float):
+        """插入或移动飞机，仅在跨越单元格时修改索引"""
+        key = self.cell_key(enu_e, enu_n)
+        old_key = self.cell_of.get(icao)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self._discard(icao, old_key)
+        self.cells.setdefault(key, set()).add(icao)
+        self.cell_of[icao] = key
+
+    def remove(self, icao: str):
+        """移除飞机"""
+        key = self.cell_of.pop(icao, None)
+        if key is not None:
+            self._discard(icao, key)
+
+    def _discard(self, icao: str, key: Tuple[int, int]):
+        cell = self.cells.get(key)
+        if cell is not None:
+            cell.discard(icao)
+            if not cell:
+                del self.cells[key]
+
+    def query_rect(self, e_min: float, n_min: float, e_max: float, n_max: float) -> Iterator[str]:
+        """返回与矩形相交的单元格中的所有飞机（候选集，需调用方精确过滤）"""
+        i_min, j_min = self.cell_key(e_min, n_min)
+        i_max, j_max = self.cell_key(e_max, n_max)
+
+        # 矩形覆盖的单元格比已占用单元格还多时，改为遍历已占用单元格
+        if (i_max - i_min + 1) * (j_max - j_min + 1) > len(self.cells):
+            for (i, j), cell in self.cells.items():
+                if i_min <= i <= i_max and j_min <= j <= j_max:
+                    yield from cell
+            return
+
+        for i in range(i_min, i_max + 1):
+            for j in range(j_min, j_max + 1):
+                cell = self.cells.get((i, j))
+                if cell:
+                    yield from cell
+
+
+class AltitudeIndex:
+    """按固定高度层分桶的高度索引（单位：英尺）"""
+
+    def __init__(self, band_ft: int = 1000):
+        self.band_ft = band_ft
+        self.bands: Dict[int, Set[str]] = {}
+        self.band_of: Dict[str, int] = {}
+
+    def insert(self, icao: str, altitude: float):
+        """插入或更新飞机高度"""
+        band = int(altitude // self.band_ft)
+        old_band = self.band_of.get(icao)
+        if old_band == band:
+            return
+        if old_band is not None:
+            self._discard(icao, old_band)
+        self.bands.setdefault(band, set()).add(icao)
+        self.band_of[icao] = band
+
+    def remove(self, icao: str):
+        """移除飞机"""
+        band = self.band_of.pop(icao, None)
+        if band is not None:
+            self._discard(icao, band)
+
+    def _discard(self, icao: str, band: int):
+        bucket = self.bands.get(band)
+        if bucket is not None:
+            bucket.discard(icao)
+            if not bucket:
+                del self.bands[band]
+
+    def query(self, alt_min: Optional[float], alt_max: Optional[float]) -> Iterator[str]:
+        """返回与高度区间相交的高度层中的所有飞机（候选集）"""
+        for band, bucket in self.bands.items():
+            low = band * self.band_ft
+            if alt_max is not None and low > alt_max:
+                continue
+            if alt_min is not None and low + self.band_ft <= alt_min:
+                continue
+            yield from bucket
+
+
+class AircraftStore:
+    """实时飞机状态存储，增量更新，支持空间和高度查询"""
+
+    def __init__(self, cell_size_km: float = 20.0, altitude_band_ft: int = 1000,
+                 converter: Optional[CoordinateConverter] = None):
+        self.aircraft: Dict[str, AircraftState] = {}
+        self.grid = GridIndex(cell_size_km)
+        self.altitude_index = AltitudeIndex(altitude_band_ft)
+        self.converter = converter or CoordinateConverter()
+
+    def __len__(self) -> int:
+        return len(self.aircraft)
+
+    def __contains__(self, icao: str) -> bool:
+        return icao in self.aircraft
+
+    def get(self, icao: str) -> Optional[AircraftState]:
+        """按ICAO获取飞机状态"""
+        return self.aircraft.get(icao)
+
+    def values(self) -> Iterable[AircraftState]:
+        """所有飞机状态"""
+        return self.aircraft.values()
+
+    def update(self, state: AircraftState) -> AircraftState:
+        """写入一架飞机的最新状态，同时维护空间和高度索引"""
+        self.aircraft[state.icao] = state
+        self.grid.insert(state.icao, state.enu_e, state.enu_n)
+        self.altitude_index.insert(state.icao, state.alt)
+        return state
+
+    def update_position(self, position) -> AircraftState:
+        """从nav.py的AircraftPosition更新状态"""
+        return self.update(AircraftState(
+            icao=position.icao,
+            lat=position.latitude,
+            lon=position.longitude,
+            alt=position.altitude,
+            time=position.timestamp,
+            timestamp=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(position.timestamp)),
+            ecef_x=position.ecef_x,
+            ecef_y=position.ecef_y,
+            ecef_z=position.ecef_z,
+            enu_e=position.enu_e,
+            enu_n=position.enu_n,
+            enu_u=position.enu_u
+        ))
+
+    def make_state(self, icao: str, lat: float, lon: float, alt: int, timestamp: float,
+                   timestamp_str: str = '', ecef=None, enu=None) -> AircraftState:
+        """构造飞机状态，缺少ENU坐标时（旧格式日志）根据经纬度补算"""
+        if enu is None:
+            enu = self.converter.lla_to_enu(lat, lon, alt * 0.3048)
+        ecef_x, ecef_y, ecef_z = ecef if ecef is not None else (None, None, None)
+        return AircraftState(
+            icao=icao, lat=lat, lon=lon, alt=alt, time=timestamp, timestamp=timestamp_str,
+            ecef_x=ecef_x, ecef_y=ecef_y, ecef_z=ecef_z,
+            enu_e=enu[0], enu_n=enu[1], enu_u=enu[2]
+        )
+
+    def remove(self, icao: str) -> Optional[AircraftState]:
+        """移除飞机"""
+        state = self.aircraft.pop(icao, None)
+        if state is not None:
+            self.grid.remove(icao)
+            self.altitude_index.remove(icao)
+        return state
+
+    def expire(self, max_age: float, now: Optional[float] = None) -> List[str]:
+        """移除超过max_age秒未更新的飞机"""
+        if now is None:
+            now = time.time()
+        expired = [icao for icao, state in self.aircraft.items() if now - state.time > max_age]
+        for icao in expired:
+            self.remove(icao)
+        return expired
+
+    @staticmethod
+    def _in_band(state: AircraftState, alt_min: Optional[float], alt_max: Optional[float]) -> bool:
+        if alt_min is not None and state.alt < alt_min:
+            return False
+        if alt_max is not None and state.alt > alt_max:
+            return False
+        return True
+
+    def query_altitude(self, alt_min: Optional[float] = None,
+                       alt_max: Optional[float] = None) -> List[AircraftState]:
+        """高度层查询（英尺，闭区间）"""
+        result = []
+        for icao in self.altitude_index.query(alt_min, alt_max):
+            state = self.aircraft[icao]
+            if self._in_band(state, alt_min, alt_max):
+                result.append(state)
+        return result
+
+    def query_enu_rect(self, e_min: float, n_min: float, e_max: float, n_max: float,
+                       alt_min: Optional[float] = None,
+                       alt_max: Optional[float] = None) -> List[AircraftState]:
+        """ENU矩形查询（米）"""
+        result = []
+        for icao in self.grid.query_rect(e_min, n_min, e_max, n_max):
+            state = self.aircraft[icao]
+            if (e_min <= state.enu_e <= e_max and n_min <= state.enu_n <= n_max
+                    and self._in_band(state, alt_min, alt_max)):
+                result.append(state)
+        return result
+
+    def query_bbox(self, lat_min: float, lon_min: float, lat_max: float, lon_max: float,
+                   alt_min: Optional[float] = None,
+                   alt_max: Optional[float] = None) -> List[AircraftState]:
+        """经纬度矩形查询"""
+        # 经纬度矩形在ENU平面上不是严格的矩形，取边界上的采样点外包并留出余量
+        samples = []
+        for lat in (lat_min, (lat_min + lat_max) / 2, lat_max):
+            for lon in (lon_min, (lon_min + lon_max) / 2, lon_max):
+                samples.append(self.converter.lla_to_enu(lat, lon, 0.0))
+        e_values = [s[0] for s in samples]
+        n_values = [s[1] for s in samples]
+        margin = 0.02 * max(max(e_values) - min(e_values), max(n_values) - min(n_values))
+
+        result = []
+        candidates = self.grid.query_rect(min(e_values) - margin, min(n_values) - margin,
+                                          max(e_values) + margin, max(n_values) + margin)
+        for icao in candidates:
+            state = self.aircraft[icao]
+            if (lat_min <= state.lat <= lat_max and lon_min <= state.lon <= lon_max
+                    and self._in_band(state, alt_min, alt_max)):
+                result.append(state)
+        return result
+
+    def query_radius(self, lat: float, lon: float, radius_km: float,
+                     alt_min: Optional[float] = None,
+                     alt_max: Optional[float] = None) -> List[AircraftState]:
+        """以经纬度为圆心的水平半径查询（公里）"""
+        center_e, center_n, _ = self.converter.lla_to_enu(lat, lon, 0.0)
+        radius = radius_km * 1000.0
+        radius_sq = radius * radius
+
+        result = []
+        candidates = self.grid.query_rect(center_e - radius, center_n - radius,
+                                          center_e + radius, center_n + radius)
+        for icao in candidates:
+            state = self.aircraft[icao]
+            de = state.enu_e - center_e
+            dn = state.enu_n - center_n
+            if de * de + dn * dn <= radius_sq and self._in_band(state, alt_min, alt_max):
+                result.append(state)
+        return result
+
+
+def test_aircraft_store():
+    """测试实时飞机状态存储"""
+    print("测试实时飞机状态存储...")
+
+    store = AircraftStore(cell_size_km=10.0)
+    now = time.time()
+    samples = [
+        ('781FAA', 39.128, 117.344, 225),
+        ('780D81', 39.500, 116.900, 12000),
+        ('7810B6', 40.100, 116.300, 35000),
+    ]
+    for icao, lat, lon, alt in samples:
+        store.update(store.make_state(icao, lat, lon, alt, now))
+
+    print(f"飞机总数: {len(store)}")
+    print(f"矩形查询(39.0~39.6, 116.8~117.5): {[s.icao for s in store.query_bbox(39.0, 116.8, 39.6, 117.5)]}")
+    print(f"半径查询(天津 39.1,117.2 60km): {[s.icao for s in store.query_radius(39.1, 117.2, 60)]}")
+    print(f"高度查询(10000~33000ft): {[s.icao for s in store.query_altitude(10000, 33000)]}")
+
+
+def benchmark_json_fragments(aircraft_count: int = 2000, rounds: int = 50, moved: int = 20):
+    """比较每次请求构造字典并json.dumps与拼接缓存片段的响应构建耗时"""
+    print(f"JSON片段缓存基准测试: {aircraft_count} 架飞机, 每次请求前 {moved} 架更新")
+    rng = random.Random(11)
+    store = AircraftStore()
+    now = time.time()
+    for i in range(aircraft_count):
+        store.update(store.make_state(f"{i:06X}", rng.uniform(39.0, 40.8), rng.uniform(115.4, 117.4),
+                                      rng.randrange(1000, 40000, 25), now, '2025-06-27 22:11:06',
+                                      (-2277970.7, 4402276.4, 4001390.9)))
+
+    def update_some():
+        for _ in range(moved):
+            old = store.get(f"{rng.randrange(aircraft_count):06X}")
+            store.update(store.make_state(old.icao, old.lat + 0.001, old.lon, old.alt, now,
+                                          old.timestamp, (old.ecef_x, old.ecef_y, old.ecef_z)))
+
+    dict_time = fragment_time = 0.0
+    for _ in range(rounds):
+        update_some()
+        start = time.perf_counter()
+        body = json.dumps({'status': 'success', 'aircraft': [state.to_dict(now) for state in store.values()]},
+                          ensure_ascii=False).encode('utf-8')
+        dict_time += time.perf_counter() - start
+
+        update_some()
+        start = time.perf_counter()
+        body = b'{"status": "success", "aircraft": ' + states_json(store.values(), now) + b'}'
+        fragment_time += time.perf_counter() - start
+
+    print(f"字典+json.dumps: {dict_time / rounds * 1000:.2f} ms/次")
+    print(f"拼接缓存片段:   {fragment_time / rounds * 1000:.2f} ms/次 ({dict_time / fragment_time:.1f}x)")
+    print(f"响应大小: {len(body) / 1024:.1f} KB")
+
+
+def benchmark_binary(aircraft_count: int = 2000, rounds: int = 50):
+    """比较JSON与二进制格式的响应大小、编码和解码耗时（首次编码与使用缓存记录分别计时）"""
+    print(f"二进制格式基准测试: {aircraft_count} 架飞机")
+    rng = random.Random(12)
+    store = AircraftStore()
+    now = time.time()
+    states = [store.make_state(f"{i:06X}", rng.uniform(39.0, 40.8), rng.uniform(115.4, 117.4),
+                               rng.randrange(1000, 40000, 25), now, '2025-06-27 22:11:06',
+                               (-2277970.7, 4402276.4, 4001390.9))
+              for i in range(aircraft_count)]
+
+    start = time.perf_counter()
+    json_body = b'{"status": "success", "aircraft": ' + states_json(states, now) + b'}'
+    json_cold = time.perf_counter() - start
+    start = time.perf_counter()
+    binary_body = states_binary(states, now)
+    binary_cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        states_json(states, now)
+    json_time = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        states_binary(states, now)
+    binary_time = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        json.loads(json_body)
+    json_decode = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decoded = decode_binary(binary_body)
+    binary_decode = (time.perf_counter() - start) / rounds
+    assert decoded['aircraft'][0]['icao'] == states[0].icao
+
+    print(f"JSON:   {len(json_body) / 1024:7.1f} KB (deflate {len(zlib.compress(json_body, 6)) / 1024:6.1f} KB), "
+          f"首次编码 {json_cold * 1000:.2f} ms, 缓存后 {json_time * 1000:.2f} ms, 解码 {json_decode * 1000:.2f} ms")
+    print(f"二进制: {len(binary_body) / 1024:7.1f} KB (deflate {len(zlib.compress(binary_body, 6)) / 1024:6.1f} KB), "
+          f"首次编码 {binary_cold * 1000:.2f} ms, 缓存后 {binary_time * 1000:.2f} ms, 解码 {binary_decode * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    test_aircraft_store()
+    benchmark_json_fragments()
+    benchmark_binary()
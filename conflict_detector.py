@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+间隔冲突检测
+基于ENU水平坐标构建KD树，在O(n log n)时间内找出水平和垂直间隔同时小于阈值的飞机对，
+并支持k近邻查询
+"""
+
+import heapq
+import math
+import random
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+NM_TO_METERS = 1852.0  # 1海里 = 1852米
+
+
+class KDTree:
+    """二维KD树（叶子节点按桶存储，减少Python层递归开销）"""
+
+    LEAF_SIZE = 16
+
+    def __init__(self, points: Sequence[Tuple[float, float]]):
+        self.points = list(points)
+        self.root = self._build(list(range(len(self.points))), 0) if self.points else None
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def _build(self, indices: List[int], depth: int):
+        """递归构建：按当前维度排序后取中位数划分"""
+        if len(indices) <= self.LEAF_SIZE:
+            return (None, indices)
+
+        axis = depth % 2
+        points = self.points
+        indices.sort(key=lambda i: points[i][axis])
+        mid = len(indices) // 2
+        split = points[indices[mid]][axis]
+        return (axis, split,
+                self._build(indices[:mid], depth + 1),
+                self._build(indices[mid:], depth + 1))
+
+    def query_radius(self, x: float, y: float, radius: float) -> List[int]:
+        """返回与(x, y)水平距离不超过radius的所有点的下标"""
+        result = []
+        if self.root is None:
+            return result
+
+        points = self.points
+        radius_sq = radius * radius
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node[0] is None:
+                for i in node[1]:
+                    px, py = points[i]
+                    dx = px - x
+                    dy = py - y
+                    if dx * dx + dy * dy <= radius_sq:
+                        result.append(i)
+                continue
+
+            axis, split, left, right = node
+            value = x if axis == 0 else y
+            if value - radius <= split:
+                stack.append(left)
+            if value + radius >= split:
+                stack.append(right)
+        return result
+
+    def query_pairs(self, radius: float) -> List[Tuple[int, int]]:
+        """返回所有距离不超过radius的点对 (i < j)"""
+        pairs = []
+        for i, (x, y) in enumerate(self.points):
+            for j in self.query_radius(x, y, radius):
+                if j > i:
+                    pairs.append((i, j))
+        return pairs
+
+    def query_knn(self, x: float, y: float, k: int,
+                  accept: Optional[Callable[[int], bool]] = None) -> List[Tuple[float, int]]:
+        """返回距离(x, y)最近的k个点，格式为 [(距离, 下标)]，按距离升序
+
+        accept不为None时只考虑accept(下标)为真的点
+        """
+        if self.root is None or k <= 0:
+            return []
+
+        points = self.points
+        heap = []  # 最大堆（存负距离平方）
+
+        def search(node):
+            if node[0] is None:
+                for i in node[1]:
+                    if accept is not None and not accept(i):
+                        continue
+                    px, py = points[i]
+                    d_sq = (px - x) ** 2 + (py - y) ** 2
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d_sq, i))
+                    elif d_sq < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d_sq, i))
+                return
+
+            axis, split, left, right = node
+            diff = (x if axis == 0 else y) - split
+            near, far = (left, right) if diff <= 0 else (right, left)
+            search(near)
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                search(far)
+
+        search(self.root)
+        return sorted((math.sqrt(-d_sq), i) for d_sq, i in heap)
+
+
+class ConflictDetector:
+    """间隔冲突检测器：数据版本变化时重建KD树（没有版本号时按时间间隔重建）
+
+    KD树包含当前所有飞机，查询时只配对active_since之后有更新的飞机：已降落或离开
+    覆盖范围的飞机在状态存储中保留较长时间，其最后位置不应与实时交通配对
+    """
+
+    def __init__(self, lateral_nm: float = 5.0, vertical_ft: float = 1000.0,
+                 rebuild_interval: float = 1.0, active_within: float = 60.0):
+        self.lateral_nm = lateral_nm
+        self.vertical_ft = vertical_ft
+        self.active_within = active_within  # 默认只考虑该时间（秒）内有更新的飞机
+        self.rebuild_interval = rebuild_interval  # 重建间隔（秒）
+        self.tree: Optional[KDTree] = None
+        self.states: list = []
+        self.last_build = 0.0
+        self.built_version: Optional[int] = None  # 构建KD树时的数据版本
+
+    def rebuild(self, states, now: Optional[float] = None, version: Optional[int] = None):
+        """用当前飞机状态（需含enu_e/enu_n/alt/icao/time）重建KD树"""
+        self.states = list(states)
+        self.tree = KDTree([(s.enu_e, s.enu_n) for s in self.states])
+        self.last_build = time.time() if now is None else now
+        self.built_version = version
+
+    def maybe_rebuild(self, states_provider, version: Optional[int] = None,
+                      now: Optional[float] = None) -> bool:
+        """按需重建KD树，states_provider为返回飞机状态的可调用对象
+
+        给出version时只要版本与构建时不同就重建（版本相同则树仍是最新的，不重建）；
+        未给出版本时退回按时间节流，距上次重建超过rebuild_interval才重建
+        """
+        if now is None:
+            now = time.time()
+        if self.tree is None:
+            stale = True
+        elif version is not None:
+            stale = version != self.built_version
+        else:
+            stale = now - self.last_build >= self.rebuild_interval
+        if stale:
+            self.rebuild(states_provider(), now, version)
+        return stale
+
+    def find_conflicts(self, lateral_nm: Optional[float] = None,
+                       vertical_ft: Optional[float] = None,
+                       active_since: Optional[float] = None) -> List[dict]:
+        """找出水平间隔和垂直间隔同时小于阈值的飞机对（active_since为None时不按更新时间筛选）"""
+        if self.tree is None:
+            return []
+        if lateral_nm is None:
+            lateral_nm = self.lateral_nm
+        if vertical_ft is None:
+            vertical_ft = self.vertical_ft
+
+        states = self.states
+        radius = lateral_nm * NM_TO_METERS
+        conflicts = []
+        for i, a in enumerate(states):
+            if active_since is not None and a.time < active_since:
+                continue
+            for j in self.tree.query_radius(a.enu_e, a.enu_n, radius):
+                if j <= i:
+                    continue
+                b = states[j]
+                if active_since is not None and b.time < active_since:
+                    continue
+                vertical = abs(a.alt - b.alt)
+                if vertical < vertical_ft:
+                    lateral = math.hypot(a.enu_e - b.enu_e, a.enu_n - b.enu_n)
+                    conflicts.append({
+                        'icao_a': a.icao,
+                        'icao_b': b.icao,
+                        'lateral_nm': lateral / NM_TO_METERS,
+                        'vertical_ft': vertical
+                    })
+        conflicts.sort(key=lambda c: c['lateral_nm'])
+        return conflicts
+
+    def nearest_neighbors(self, icao: str, k: int = 5,
+                          active_since: Optional[float] = None) -> List[dict]:
+        """返回指定飞机水平距离最近的k架飞机（active_since同find_conflicts）"""
+        if self.tree is None:
+            return []
+        for target in self.states:
+            if target.icao == icao:
+                break
+        else:
+            return []
+
+        states = self.states
+        accept = None if active_since is None else (lambda i: states[i].time >= active_since)
+        neighbors = []
+        for distance, i in self.tree.query_knn(target.enu_e, target.enu_n, k + 1, accept):
+            other = self.states[i]
+            if other.icao == icao:
+                continue
+            neighbors.append({
+                'icao': other.icao,
+                'lateral_nm': distance / NM_TO_METERS,
+                'vertical_ft': abs(other.alt - target.alt)
+            })
+        return neighbors[:k]
+
+
+def _naive_pairs(points: Sequence[Tuple[float, float]], radius: float) -> List[Tuple[int, int]]:
+    """O(n²)两两比较，作为基准"""
+    radius_sq = radius * radius
+    pairs = []
+    n = len(points)
+    for i in range(n):
+        xi, yi = points[i]
+        for j in range(i + 1, n):
+            dx = points[j][0] - xi
+            dy = points[j][1] - yi
+            if dx * dx + dy * dy <= radius_sq:
+                pairs.append((i, j))
+    return pairs
+
+
+def benchmark_conflict_detection(aircraft_count: int = 5000, area_km: float = 600.0,
+                                 lateral_nm: float = 5.0):
+    """在area_km见方的区域内随机生成飞机，对比KD树与两两比较的耗时"""
+    print(f"冲突检测基准测试: {aircraft_count} 架飞机, 区域 {area_km:.0f}km, 水平阈值 {lateral_nm}NM")
+
+    rng = random.Random(42)
+    half = area_km * 500.0
+    points = [(rng.uniform(-half, half), rng.uniform(-half, half)) for _ in range(aircraft_count)]
+    radius = lateral_nm * NM_TO_METERS
+
+    start = time.perf_counter()
+    tree = KDTree(points)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree_pairs = tree.query_pairs(radius)
+    query_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for x, y in points[:1000]:
+        tree.query_knn(x, y, 5)
+    knn_time = (time.perf_counter() - start) / 1000
+
+    start = time.perf_counter()
+    naive_pairs = _naive_pairs(points, radius)
+    naive_time = time.perf_counter() - start
+
+    print(f"KD树构建: {build_time * 1000:.1f} ms")
+    print(f"KD树近距对查询: {query_time * 1000:.1f} ms ({len(tree_pairs)} 对)")
+    print(f"k近邻查询(k=5): {knn_time * 1e6:.1f} us/次")
+    print(f"两两比较: {naive_time * 1000:.1f} ms ({len(naive_pairs)} 对)")
+    print(f"加速比: {naive_time / (build_time + query_time):.1f}x")
+    assert sorted(tree_pairs) == naive_pairs, "KD树结果与两两比较不一致"
+
+
+if __name__ == '__main__':
+    benchmark_conflict_detection()
@@ -132,6 +132,56 @@ class CoordinateConverter:
         # 再转换为ENU
         return self.ecef_to_enu(ecef_x, ecef_y, ecef_z)
     
+    def enu_to_ecef(self, enu_e, enu_n, enu_u):
+        """
+        将ENU坐标转换回ECEF坐标（旋转矩阵的转置）
+        
+        Args:
+            enu_e, enu_n, enu_u: 东北天坐标 (米)
+            
+        Returns:
+            (X, Y, Z): ECEF坐标 (米)
+        """
+        delta_x = (-self.sin_lon * enu_e
+                   - self.sin_lat * self.cos_lon * enu_n
+                   + self.cos_lat * self.cos_lon * enu_u)
+        delta_y = (self.cos_lon * enu_e
+                   - self.sin_lat * self.sin_lon * enu_n
+                   + self.cos_lat * self.sin_lon * enu_u)
+        delta_z = self.cos_lat * enu_n + self.sin_lat * enu_u
+        
+        return self.ref_x + delta_x, self.ref_y + delta_y, self.ref_z + delta_z
+    
+    @classmethod
+    def ecef_to_lla(cls, ecef_x, ecef_y, ecef_z, iterations=5):
+        """
+        将ECEF坐标转换为经纬度高度（迭代法）
+        
+        Returns:
+            (latitude, longitude, altitude): 纬度、经度（度），高度（米）
+        """
+        longitude = math.atan2(ecef_y, ecef_x)
+        p = math.sqrt(ecef_x * ecef_x + ecef_y * ecef_y)
+        
+        # 以球面纬度为初值迭代
+        latitude = math.atan2(ecef_z, p * (1 - cls.WGS84_E2))
+        altitude = 0.0
+        for _ in range(iterations):
+            N = cls.calculate_prime_vertical_radius(latitude)
+            altitude = p / math.cos(latitude) - N
+            latitude = math.atan2(ecef_z, p * (1 - cls.WGS84_E2 * N / (N + altitude)))
+        
+        return math.degrees(latitude), math.degrees(longitude), altitude
+    
+    def enu_to_lla(self, enu_e, enu_n, enu_u):
+        """
+        直接将ENU坐标转换为经纬度高度
+        
+        Returns:
+            (latitude, longitude, altitude): 纬度、经度（度），高度（米）
+        """
+        return self.ecef_to_lla(*self.enu_to_ecef(enu_e, enu_n, enu_u))
+    
     def get_reference_info(self):
         """获取参考点信息"""
         return {
@@ -177,6 +227,10 @@ def test_coordinate_converter():
     enu_e, enu_n, enu_u = converter.lla_to_enu(lat, lon, alt)
     print(f"ENU坐标: ({enu_e:.1f}, {enu_n:.1f}, {enu_u:.1f}) m")
     
+    # 逆变换
+    back_lat, back_lon, back_alt = converter.enu_to_lla(enu_e, enu_n, enu_u)
+    print(f"ENU逆变换: ({back_lat:.6f}°, {back_lon:.6f}°, {back_alt:.1f}m)")
+    
     # 计算距离和方位
     distance = converter.calculate_distance(enu_e, enu_n, enu_u)
     h_distance = converter.calculate_horizontal_distance(enu_e, enu_n)
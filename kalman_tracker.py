@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+卡尔曼滤波航迹跟踪
+每架飞机在ENU空间中使用匀速(CV)模型，三个轴相互独立，各自维护[位置, 速度]状态和2x2协方差；
+用新息的马氏距离门限剔除CPR解码异常点；可在任意时刻推算位置和速度
+所有飞机的状态按列存放在array('d')中，安装了NumPy时批量推算使用向量化计算
+"""
+
+import math
+import random
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from coord_converter import CoordinateConverter
+
+# 可选：NumPy向量化批量推算
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# 每个轴的状态列：位置、速度、协方差(P00, P01, P11)
+AXES = ('e', 'n', 'u')
+STATE_COLUMNS = ['t'] + [f"{name}_{axis}" for axis in AXES
+                         for name in ('p', 'v', 'p00', 'p01', 'p11')]
+
+
+class KalmanTracker:
+    """多飞机匀速模型卡尔曼滤波跟踪器"""
+
+    def __init__(self, position_std: float = 50.0, vertical_std: float = 8.0,
+                 accel_std: float = 3.0, vertical_accel_std: float = 1.0,
+                 velocity_std: float = 150.0, vertical_velocity_std: float = 30.0,
+                 gate: float = 13.8, max_misses: int = 3, reinit_gap: float = 60.0):
+        # 测量噪声方差（米²）：CPR位置误差、高度量化误差
+        self.meas_var = {'e': position_std ** 2, 'n': position_std ** 2, 'u': vertical_std ** 2}
+        # 过程噪声谱密度（加速度方差）
+        self.accel_var = {'e': accel_std ** 2, 'n': accel_std ** 2, 'u': vertical_accel_std ** 2}
+        # 初始速度方差
+        self.init_vel_var = {'e': velocity_std ** 2, 'n': velocity_std ** 2,
+                             'u': vertical_velocity_std ** 2}
+        self.gate = gate                # 水平新息马氏距离平方门限（2自由度卡方，99.9%）
+        self.max_misses = max_misses    # 连续被拒绝次数超过该值时重新初始化
+        self.reinit_gap = reinit_gap    # 超过该时间（秒）没有更新时重新初始化
+
+        self.columns = {name: array('d') for name in STATE_COLUMNS}
+        self.icaos: List[str] = []
+        self.slots: Dict[str, int] = {}
+        self.misses: List[int] = []
+
+        self.accepted = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self.icaos)
+
+    def __contains__(self, icao: str) -> bool:
+        return icao in self.slots
+
+    def _init_slot(self, slot: int, t: float, e: float, n: float, u: float):
+        """用测量值初始化状态"""
+        c = self.columns
+        c['t'][slot] = t
+        for axis, z in zip(AXES, (e, n, u)):
+            c[f'p_{axis}'][slot] = z
+            c[f'v_{axis}'][slot] = 0.0
+            c[f'p00_{axis}'][slot] = self.meas_var[axis]
+            c[f'p01_{axis}'][slot] = 0.0
+            c[f'p11_{axis}'][slot] = self.init_vel_var[axis]
+        self.misses[slot] = 0
+
+    def _predict_slot(self, slot: int, t: float):
+        """将单架飞机的状态和协方差推进到时刻t"""
+        c = self.columns
+        dt = t - c['t'][slot]
+        if dt <= 0:
+            return
+        for axis in AXES:
+            q = self.accel_var[axis]
+            p01 = c[f'p01_{axis}'][slot]
+            p11 = c[f'p11_{axis}'][slot]
+            c[f'p_{axis}'][slot] += c[f'v_{axis}'][slot] * dt
+            c[f'p00_{axis}'][slot] += dt * (2 * p01 + dt * p11) + q * dt ** 3 / 3
+            c[f'p01_{axis}'][slot] = p01 + dt * p11 + q * dt ** 2 / 2
+            c[f'p11_{axis}'][slot] = p11 + q * dt
+        c['t'][slot] = t
+
+    def _innovation_distance(self, slot: int, e: float, n: float) -> float:
+        """水平新息的马氏距离平方"""
+        c = self.columns
+        d_sq = 0.0
+        for axis, z in (('e', e), ('n', n)):
+            y = z - c[f'p_{axis}'][slot]
+            d_sq += y * y / (c[f'p00_{axis}'][slot] + self.meas_var[axis])
+        return d_sq
+
+    def _correct_slot(self, slot: int, e: float, n: float, u: float):
+        """用位置测量值修正状态"""
+        c = self.columns
+        for axis, z in zip(AXES, (e, n, u)):
+            p00 = c[f'p00_{axis}'][slot]
+            p01 = c[f'p01_{axis}'][slot]
+            s = p00 + self.meas_var[axis]
+            k0 = p00 / s
+            k1 = p01 / s
+            y = z - c[f'p_{axis}'][slot]
+            c[f'p_{axis}'][slot] += k0 * y
+            c[f'v_{axis}'][slot] += k1 * y
+            c[f'p00_{axis}'][slot] = (1 - k0) * p00
+            c[f'p01_{axis}'][slot] = (1 - k0) * p01
+            c[f'p11_{axis}'][slot] -= k1 * p01
+
+    def update(self, icao: str, t: float, e: float, n: float, u: float) -> bool:
+        """输入一次位置测量（ENU米），返回是否被接受（门限外的异常点返回False）"""
+        slot = self.slots.get(icao)
+        if slot is None:
+            slot = len(self.icaos)
+            self.slots[icao] = slot
+            self.icaos.append(icao)
+            self.misses.append(0)
+            for column in self.columns.values():
+                column.append(0.0)
+            self._init_slot(slot, t, e, n, u)
+            self.accepted += 1
+            return True
+
+        if t - self.columns['t'][slot] > self.reinit_gap:
+            self._init_slot(slot, t, e, n, u)
+            self.accepted += 1
+            return True
+
+        self._predict_slot(slot, t)
+        if self._innovation_distance(slot, e, n) > self.gate:
+            self.misses[slot] += 1
+            if self.misses[slot] > self.max_misses:
+                # 连续多次不一致，认为是真实机动或航迹丢失，重新初始化
+                self._init_slot(slot, t, e, n, u)
+                self.accepted += 1
+                return True
+            self.rejected += 1
+            return False
+
+        self.misses[slot] = 0
+        self._correct_slot(slot, e, n, u)
+        self.accepted += 1
+        return True
+
+    def update_position(self, position) -> bool:
+        """从nav.py的AircraftPosition更新"""
+        return self.update(position.icao, position.timestamp,
+                           position.enu_e, position.enu_n, position.enu_u)
+
+    def update_state(self, state) -> bool:
+        """从aircraft_store.AircraftState更新"""
+        return self.update(state.icao, state.time, state.enu_e, state.enu_n, state.enu_u)
+
+    def remove(self, icao: str):
+        """移除飞机：用最后一个槽位填补空位，保持列紧凑"""
+        slot = self.slots.pop(icao, None)
+        if slot is None:
+            return
+        last = len(self.icaos) - 1
+        if slot != last:
+            moved = self.icaos[last]
+            for column in self.columns.values():
+                column[slot] = column[last]
+            self.icaos[slot] = moved
+            self.misses[slot] = self.misses[last]
+            self.slots[moved] = slot
+        for column in self.columns.values():
+            column.pop()
+        self.icaos.pop()
+        self.misses.pop()
+
+    def last_update(self, icao: str) -> Optional[float]:
+        """滤波器状态对应的时刻"""
+        slot = self.slots.get(icao)
+        return None if slot is None else self.columns['t'][slot]
+
+    def predict(self, icao: str, t: float) -> Optional[dict]:
+        """推算单架飞机在时刻t的位置和速度（不修改滤波器状态）
+
+        t早于最近一次更新时不向过去外推，返回当前的估计
+        """
+        slot = self.slots.get(icao)
+        if slot is None:
+            return None
+        c = self.columns
+        dt = max(0.0, t - c['t'][slot])
+        result = {}
+        for axis in AXES:
+            v = c[f'v_{axis}'][slot]
+            result[f'enu_{axis}'] = c[f'p_{axis}'][slot] + v * dt
+            result[f'vel_{axis}'] = v
+        return result
+
+    def predict_all(self, t: float) -> dict:
+        """批量推算所有飞机在时刻t的位置和速度，返回按列的结果（同predict，不向过去外推）"""
+        c = self.columns
+        result = {'icao': list(self.icaos)}
+        if HAS_NUMPY and self.icaos:
+            dt = np.maximum(t - np.frombuffer(c['t'], dtype=np.float64), 0.0)
+            for axis in AXES:
+                v = np.frombuffer(c[f'v_{axis}'], dtype=np.float64)
+                result[f'enu_{axis}'] = np.frombuffer(c[f'p_{axis}'], dtype=np.float64) + v * dt
+                result[f'vel_{axis}'] = v.copy()
+            return result
+
+        times = c['t']
+        for axis in AXES:
+            p = c[f'p_{axis}']
+            v = c[f'v_{axis}']
+            result[f'enu_{axis}'] = [p[i] + v[i] * max(0.0, t - times[i]) for i in range(len(times))]
+            result[f'vel_{axis}'] = list(v)
+        return result
+
+
+def predicted_lla(tracker: KalmanTracker, converter: CoordinateConverter,
+                  icao: str, t: float) -> Optional[dict]:
+    """推算位置并转换为经纬度和高度（英尺）"""
+    predicted = tracker.predict(icao, t)
+    if predicted is None:
+        return None
+    lat, lon, alt_m = converter.enu_to_lla(predicted['enu_e'], predicted['enu_n'], predicted['enu_u'])
+    predicted.update({'lat': lat, 'lon': lon, 'alt': int(round(alt_m / 0.3048))})
+    return predicted
+
+
+def benchmark_tracker(aircraft_count: int = 5000, updates_per_aircraft: int = 20,
+                      outlier_rate: float = 0.02):
+    """模拟匀速飞行并注入CPR异常点，测试更新吞吐、批量推算耗时和异常点剔除率"""
+    print(f"卡尔曼跟踪基准测试: {aircraft_count} 架飞机, 每架 {updates_per_aircraft} 次更新"
+          f", 异常点比例 {outlier_rate:.0%}, NumPy: {'是' if HAS_NUMPY else '否'}")
+
+    rng = random.Random(7)
+    tracker = KalmanTracker()
+    aircraft = [(rng.uniform(-2e5, 2e5), rng.uniform(-2e5, 2e5), rng.uniform(0, 1e4),
+                 rng.uniform(-250, 250), rng.uniform(-250, 250), rng.uniform(-10, 10))
+                for _ in range(aircraft_count)]
+
+    measurements = []
+    injected = 0
+    for k in range(updates_per_aircraft):
+        for i, (e, n, u, ve, vn, vu) in enumerate(aircraft):
+            t = 1000.0 + k + i * 1e-4
+            dt = t - 1000.0
+            me = e + ve * dt + rng.gauss(0, 30)
+            mn = n + vn * dt + rng.gauss(0, 30)
+            if k > 2 and rng.random() < outlier_rate:
+                me += rng.choice((-1, 1)) * 20000.0  # CPR解码错误造成的跳点
+                injected += 1
+            measurements.append((f"{i:06X}", t, me, mn, u + vu * dt))
+
+    start = time.perf_counter()
+    for m in measurements:
+        tracker.update(*m)
+    update_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predicted = tracker.predict_all(1000.0 + updates_per_aircraft + 2.0)
+    predict_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for icao in tracker.icaos:
+        tracker.predict(icao, 1000.0 + updates_per_aircraft + 2.0)
+    loop_time = time.perf_counter() - start
+
+    errors = []
+    for i, (e, n, u, ve, vn, vu) in enumerate(aircraft):
+        dt = updates_per_aircraft + 2.0
+        errors.append(math.hypot(predicted['enu_e'][i] - (e + ve * dt),
+                                 predicted['enu_n'][i] - (n + vn * dt)))
+    errors.sort()
+
+    print(f"更新: {len(measurements) / update_time:,.0f} 次/秒")
+    print(f"批量推算: {predict_time * 1000:.2f} ms, 逐架推算: {loop_time * 1000:.2f} ms")
+    print(f"异常点: 注入 {injected}, 剔除 {tracker.rejected}")
+    print(f"推算位置误差(2秒外推): 中位数 {errors[len(errors) // 2]:.1f} m, "
+          f"P99 {errors[int(len(errors) * 0.99)]:.1f} m")
+
+
+if __name__ == '__main__':
+    benchmark_tracker()
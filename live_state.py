@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+服务端实时飞机状态
+由一个后台采集线程基于SafeADSBDataReader增量读取解码日志并更新，
+HTTP请求只读取内存中的状态，不再访问日志文件
+"""
+
+import json
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+from aircraft_store import AircraftState, AircraftStore
+from conflict_detector import ConflictDetector
+from kalman_tracker import KalmanTracker
+from metrics import REGISTRY
+from safe_file_reader import SafeADSBDataReader
+from sampling_profiler import checkpoint
+from track_history import TrackHistory
+from traffic_stats import TrafficStatistics
+
+
+# 数据链路各阶段：接收→解码→写入日志→服务端采集→首次响应，total为接收到首次响应
+LATENCY_STAGES = ('decode', 'persist', 'ingest', 'serve', 'total')
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0,
+                   10.0, 30.0, 60.0)
+PIPELINE_LATENCY = REGISTRY.histogram('adsb_pipeline_latency_seconds',
+                                      '位置数据在各阶段的延迟（decode/persist由nav.py写入日志，其余由服务端测量）',
+                                      ('stage',), LATENCY_BUCKETS, threadsafe=True)
+
+
+class LatencyTracker:
+    """按阶段统计位置数据的延迟
+
+    nav.py在日志中记录接收时间（微秒）以及解码完成、写入日志距接收的毫秒数；
+    采集时据此得到解码、写入和采集三个阶段的延迟。每批数据的接收时间按版本号暂存，
+    该版本（或更新的版本）第一次出现在响应中时记录响应阶段和端到端延迟。
+    """
+
+    def __init__(self, max_pending: int = 1000):
+        self.lock = threading.Lock()
+        self.pending = deque(maxlen=max_pending)  # (版本号, 采集时间, 接收时间列表)
+        self.served_version = 0
+        self.histograms = {stage: PIPELINE_LATENCY.labels(stage) for stage in LATENCY_STAGES}
+
+    def record_ingest(self, version: int, records: list, now: Optional[float] = None):
+        """记录一批日志记录的解码、写入和采集延迟（旧格式日志的记录没有延迟信息，跳过）"""
+        if now is None:
+            now = time.time()
+        decode, persist, ingest = (self.histograms[stage] for stage in ('decode', 'persist', 'ingest'))
+        received = []
+        for record in records:
+            decode_ms = record.get('decode_ms')
+            if decode_ms is None:
+                continue
+            write_ms = record['write_ms']
+            decode.observe(decode_ms / 1000)
+            persist.observe((write_ms - decode_ms) / 1000)
+            ingest.observe(now - record['nav_time_unix'] - write_ms / 1000)
+            received.append(record['nav_time_unix'])
+        if received:
+            with self.lock:
+                self.pending.append((version, now, received))
+
+    def record_serve(self, version: int, now: Optional[float] = None):
+        """版本号不超过version、尚未响应过的数据第一次被响应时，记录响应阶段和端到端延迟"""
+        if version <= self.served_version or not self.pending:
+            return
+        if now is None:
+            now = time.time()
+        serve, total = self.histograms['serve'], self.histograms['total']
+        with self.lock:
+            self.served_version = max(self.served_version, version)
+            while self.pending and self.pending[0][0] <= version:
+                _, ingested, received = self.pending.popleft()
+                for receive_time in received:
+                    serve.observe(now - ingested)
+                    total.observe(now - receive_time)
+
+    def summary(self) -> dict:
+        """各阶段的样本数和P50/P99（毫秒，按直方图分桶估计）"""
+        result = {}
+        for stage, histogram in self.histograms.items():
+            count = histogram.count
+            if count:
+                result[stage] = {'count': count, 'p50_ms': histogram.quantile(0.5) * 1000,
+                                 'p99_ms': histogram.quantile(0.99) * 1000}
+        return result
+
+
+class LiveAircraftState:
+    """服务端共享的实时状态：飞机状态存储、航迹历史、卡尔曼跟踪和冲突检测
+
+    写入只来自采集线程；读取方访问store/tracks/tracker时需持有lock。
+    """
+
+    def __init__(self, max_age: float = 86400):
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)  # 状态变化时通知等待方（如SSE推送）
+        self.store = AircraftStore()
+        self.tracks = TrackHistory()
+        self.tracker = KalmanTracker()
+        self.conflicts = ConflictDetector()
+        self.stats = TrafficStatistics()
+        self.latency = LatencyTracker()
+        self.max_age = max_age  # 超过该时间（秒）未更新的飞机被移除，默认24小时
+        self.last_ingest = 0.0  # 最近一次采集的时间
+
+        # 版本号：每批有变化的更新（新位置或移除）递增一次。初值取毫秒时间戳，
+        # 服务重启后版本号仍然递增，客户端持有的旧版本号会得到全量响应
+        self.version = int(time.time() * 1000)
+        # 按最近更新顺序记录每架飞机的版本
+        self.change_order: 'OrderedDict[str, int]' = OrderedDict()
+        # 已移除的飞机及移除时的版本，最多保留max_removed条；
+        # removed_floor为已丢弃记录的最大版本，更早的增量请求只能返回全量
+        self.removed: 'OrderedDict[str, int]' = OrderedDict()
+        self.removed_floor = self.version
+        self.max_removed = 10000
+        self.listeners = []  # 状态变化回调（在采集线程中调用，需自行保证线程安全）
+
+    def state_from_record(self, record: dict) -> AircraftState:
+        """将SafeADSBDataReader解析的记录转换为飞机状态"""
+        ecef = enu = None
+        if record['ecef_x'] is not None:
+            ecef = (record['ecef_x'], record['ecef_y'], record['ecef_z'])
+        if record['enu_e'] is not None:
+            enu = (record['enu_e'], record['enu_n'], record['enu_u'])
+        return self.store.make_state(
+            record['icao'], record['latitude'], record['longitude'], record['altitude'],
+            record['nav_time_unix'], record['nav_timestamp'][:19], ecef, enu
+        )
+
+    def apply(self, states: list, now: Optional[float] = None, messages: Optional[int] = None,
+              replayed: bool = False):
+        """批量写入新状态并清理过期飞机
+
+        messages为本批读取的消息（日志行）数，默认与状态数相同；
+        replayed为True表示启动时读取的历史数据，不计入消息和解码速率
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            self.stats.record_messages(len(states) if messages is None else messages, now, replayed)
+            version = self.version + 1
+            for state in states:
+                self.store.update(state)
+                self.tracks.append_state(state)
+                self.tracker.update_state(state)
+                self.stats.record_state(state, now, replayed)
+                self.change_order[state.icao] = version
+                self.change_order.move_to_end(state.icao)
+                self.removed.pop(state.icao, None)
+            expired = self.store.expire(self.max_age, now)
+            for icao in expired:
+                self.tracks.remove(icao)
+                self.tracker.remove(icao)
+                self.stats.remove(icao)
+                self.change_order.pop(icao, None)
+                self.removed[icao] = version
+            while len(self.removed) > self.max_removed:
+                self.removed_floor = self.removed.popitem(last=False)[1]
+            self.last_ingest = now
+            changed = bool(states or expired)
+            if changed:
+                self.version = version
+                self.changed.notify_all()
+        if changed:
+            for listener in list(self.listeners):
+                listener()
+
+    def changes_since(self, version: int) -> List[str]:
+        """返回版本号大于version的飞机ICAO（开销与变化数量成正比，调用方需持有lock）"""
+        changed = []
+        for icao in reversed(self.change_order):
+            if self.change_order[icao] <= version:
+                break
+            changed.append(icao)
+        changed.reverse()
+        return changed
+
+    def removed_since(self, version: int) -> List[str]:
+        """返回版本号大于version时被移除的飞机ICAO（调用方需持有lock）"""
+        removed = []
+        for icao in reversed(self.removed):
+            if self.removed[icao] <= version:
+                break
+            removed.append(icao)
+        removed.reverse()
+        return removed
+
+    def delta_available(self, version: int) -> bool:
+        """能否给出从version开始的完整增量（否则调用方应返回全量）"""
+        return self.removed_floor <= version <= self.version
+
+    def add_listener(self, callback):
+        """注册状态变化回调"""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """注销状态变化回调"""
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+
+class LogIngester(threading.Thread):
+    """后台采集线程：定期读取解码日志的新增行并更新实时状态"""
+
+    def __init__(self, state: LiveAircraftState, log_path: str = 'adsb_decoded.log',
+                 interval: float = 0.5, initial_lines: int = 100):
+        super().__init__(name='adsb-ingester', daemon=True)
+        self.state = state
+        self.reader = SafeADSBDataReader(log_path, initial_lines=initial_lines)
+        self.interval = interval  # 轮询间隔（秒）
+        self.batches = 0
+        self._stop_event = threading.Event()
+
+    def ingest_once(self) -> int:
+        """读取并应用一次新增数据，返回新记录数
+
+        启动时读取的日志末尾是历史数据，不计入延迟统计和速率窗口
+        """
+        lines_before = self.reader.lines_read
+        records = self.reader.read_new_records()
+        states = [self.state.state_from_record(record) for record in records]
+        now = time.time()
+        self.state.apply(states, now, messages=self.reader.lines_read - lines_before,
+                         replayed=not self.batches)
+        if self.batches and records:
+            self.state.latency.record_ingest(self.state.version, records, now)
+        self.batches += 1
+        return len(states)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            checkpoint()
+            try:
+                self.ingest_once()
+            except Exception as e:
+                print(f"采集线程出错: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        """停止采集线程"""
+        self._stop_event.set()
+
+
+def benchmark_delta(aircraft_count: int = 500, moved: int = 2, rounds: int = 200):
+    """对比全量列表和增量（只含有变化的飞机）的JSON编码耗时和大小"""
+    print(f"增量响应基准测试: {aircraft_count} 架飞机, 每批 {moved} 架更新")
+    rng = random.Random(3)
+    live = LiveAircraftState()
+    now = time.time()
+    live.apply([live.store.make_state(f"{i:06X}", rng.uniform(39.0, 40.8), rng.uniform(115.4, 117.4),
+                                      rng.randrange(1000, 40000, 25), now)
+                for i in range(aircraft_count)], now)
+
+    full_time = delta_time = 0.0
+    full_bytes = delta_bytes = 0
+    for _ in range(rounds):
+        since = live.version
+        states = []
+        for _ in range(moved):
+            old = live.store.get(f"{rng.randrange(aircraft_count):06X}")
+            states.append(live.store.make_state(old.icao, old.lat + 0.001, old.lon, old.alt, now))
+        live.apply(states, now)
+
+        start = time.perf_counter()
+        with live.lock:
+            body = json.dumps([state.to_dict(now) for state in live.store.values()])
+        full_time += time.perf_counter() - start
+        full_bytes += len(body)
+
+        start = time.perf_counter()
+        with live.lock:
+            changed = [live.store.get(icao).to_dict(now) for icao in live.changes_since(since)]
+            body = json.dumps({'aircraft': changed, 'removed': live.removed_since(since)})
+        delta_time += time.perf_counter() - start
+        delta_bytes += len(body)
+
+    print(f"全量: {full_time / rounds * 1000:.3f} ms, {full_bytes / rounds / 1024:.1f} KB")
+    print(f"增量: {delta_time / rounds * 1000:.3f} ms, {delta_bytes / rounds / 1024:.2f} KB")
+
+
+if __name__ == '__main__':
+    benchmark_delta()
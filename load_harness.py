@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+仪表盘负载测试（asyncio）
+模拟多个打开可视化页面的浏览器：按客户端组合（轮询、SSE推送、页面访问、直接压API）
+在一个事件循环中运行大量虚拟客户端，服务器读取模拟日志（load_test.LogWriter持续写入），
+依次测试各并发级别，报告吞吐量、各接口的延迟分位数、错误率和服务器内存（RSS），
+结果可保存为JSON并与之前的结果比较（不依赖外部服务，只连接本机）。
+
+用法：
+    python load_harness.py --mix poll=70,stream=20,page=10 --concurrency 10 50 200 --json run.json
+    python load_harness.py --compare run.json --json run2.json
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from load_test import LogWriter, PREFORK_SCRIPT, SERVER_SCRIPT, ServerProcess, percentile
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+# 客户端类型：
+#   poll   - 页面加载后每interval秒轮询/api/aircraft/（首次全量，之后带since增量），并请求统计
+#   stream - 页面加载后保持/api/stream/推送连接，每interval秒请求统计
+#   page   - 新访客：每interval秒加载一次页面（新连接）
+#   api    - 不等待，连续请求/api/aircraft/全量（测最大吞吐）
+CLIENT_TYPES = ('poll', 'stream', 'page', 'api')
+DEFAULT_MIX = 'poll=70,stream=20,page=10'
+
+VERSION_PATTERN = re.compile(rb'"version":\s*(\d+)')
+REQUEST_TIMEOUT = 30.0
+
+
+class ClientError(Exception):
+    """响应不完整或格式错误"""
+
+
+class AsyncHTTPClient:
+    """最小的HTTP/1.1客户端（长连接，支持Content-Length、分块和读到关闭三种响应体）"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def send(self, path: str, headers: Optional[dict] = None):
+        """发送请求并读取状态行和响应头，返回(状态码, 响应头)"""
+        if self.writer is None:
+            await self.connect()
+        lines = [f"GET {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Accept-Encoding: gzip"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ClientError('连接已关闭')
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise ClientError(f'无效的状态行: {status_line[:80]!r}')
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        return int(parts[1]), response_headers
+
+    async def read_body(self, status: int, headers: dict) -> bytes:
+        if status in (204, 304):
+            body = b''
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b''.join(chunks)
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return body
+
+    async def get(self, path: str, headers: Optional[dict] = None) -> Tuple[int, dict, bytes]:
+        """完整的GET请求；复用的连接已被服务器关闭时重连一次"""
+        reused = self.writer is not None
+        try:
+            status, response_headers = await self.send(path, headers)
+        except (ClientError, ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            if not reused:
+                raise
+            status, response_headers = await self.send(path, headers)
+        return status, response_headers, await self.read_body(status, response_headers)
+
+
+class Recorder:
+    """按接口汇总请求结果；measuring为False（预热期）时不记录"""
+
+    def __init__(self):
+        self.measuring = False
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.bytes = 0
+        self.stream_events = 0
+        self.error_samples: List[str] = []
+
+    def ok(self, endpoint: str, latency: float, size: int = 0):
+        if self.measuring:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            self.errors.setdefault(endpoint, 0)
+            self.bytes += size
+
+    def error(self, endpoint: str, reason: str):
+        if self.measuring:
+            self.latencies.setdefault(endpoint, [])
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            if len(self.error_samples) < 5:
+                self.error_samples.append(f"{endpoint}: {reason}")
+
+
+async def timed_get(client: AsyncHTTPClient, recorder: Recorder, endpoint: str, path: str,
+                    headers: Optional[dict] = None) -> Optional[bytes]:
+    """请求并记录延迟，出错时关闭连接并返回None"""
+    start = time.perf_counter()
+    try:
+        status, response_headers, body = await asyncio.wait_for(client.get(path, headers), REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        client.close()
+        recorder.error(endpoint, '超时')
+        return None
+    except (OSError, ClientError, asyncio.IncompleteReadError, ValueError) as e:
+        client.close()
+        recorder.error(endpoint, f'{type(e).__name__}: {e}')
+        return None
+    if status >= 400:
+        recorder.error(endpoint, f'HTTP {status}')
+        return None
+    recorder.ok(endpoint, time.perf_counter() - start, len(body))
+    if response_headers.get('content-encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return body
+
+
+async def page_load(client: AsyncHTTPClient, recorder: Recorder):
+    await timed_get(client, recorder, '/', '/')
+
+
+async def poll_client(host: str, port: int, recorder: Recorder, interval: float, stop: asyncio.Event):
+    """轮询页面：首次全量，之后带since增量（数据未变化时为304），每次刷新同时请求统计"""
+    client = AsyncHTTPClient(host, port)
+    await page_load(client, recorder)
+    version = None
+    while not stop.is_set():
+        if version is None:
+            body = await timed_get(client, recorder, '/api/aircraft/ (full)', '/api/aircraft/')
+        else:
+            body = await timed_get(client, recorder, '/api/aircraft/ (since)',
+                                   f'/api/aircraft/?since={version}')
+        if body:
+            match = VERSION_PATTERN.search(body)
+            version = int(match.group(1)) if match else None
+        await timed_get(client, recorder, '/api/statistics/', '/api/statistics/')
+        await sleep_or_stop(stop, interval)
+    client.close()
+
+
+async def stream_client(host: str, port: int, recorder: Recorder, interval: float, stop: asyncio.Event):
+    """推送页面：一个连接保持SSE，另一个连接每interval秒请求统计"""
+    client = AsyncHTTPClient(host, port)
+    await page_load(client, recorder)
+    stats = asyncio.ensure_future(stats_loop(client, recorder, interval, stop))
+    stream = AsyncHTTPClient(host, port)
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            status, headers = await asyncio.wait_for(stream.send('/api/stream/'), REQUEST_TIMEOUT)
+            if status != 200:
+                raise ClientError(f'HTTP {status}')
+            recorder.ok('/api/stream/ (connect)', time.perf_counter() - start)
+            read_line = stream.reader.readline
+            while not stop.is_set():
+                line = await read_line()
+                if not line:
+                    raise ClientError('推送连接被关闭')
+                if recorder.measuring:
+                    recorder.bytes += len(line)
+                    if line.startswith(b'event:'):
+                        recorder.stream_events += 1
+        except (OSError, ClientError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            recorder.error('/api/stream/ (connect)', f'{type(e).__name__}: {e}')
+            await sleep_or_stop(stop, 1.0)
+        finally:
+            stream.close()
+    await stats
+    client.close()
+
+
+async def stats_loop(client: AsyncHTTPClient, recorder: Recorder, interval: float, stop: asyncio.Event):
+    while not stop.is_set():
+        await timed_get(client, recorder, '/api/statistics/', '/api/statistics/')
+        await sleep_or_stop(stop, interval)
+
+
+async def page_client(host: str, port: int, recorder: Recorder, interval: float, stop: asyncio.Event):
+    """新访客：每次新建连接加载页面"""
+    while not stop.is_set():
+        client = AsyncHTTPClient(host, port)
+        await timed_get(client, recorder, '/', '/', {'Connection': 'close'})
+        client.close()
+        await sleep_or_stop(stop, interval)
+
+
+async def api_client(host: str, port: int, recorder: Recorder, interval: float, stop: asyncio.Event):
+    """不等待的API客户端（长连接）"""
+    client = AsyncHTTPClient(host, port)
+    while not stop.is_set():
+        if await timed_get(client, recorder, '/api/aircraft/ (full)', '/api/aircraft/') is None:
+            await sleep_or_stop(stop, 0.1)  # 出错时稍等，避免连接失败时空转
+    client.close()
+
+
+CLIENTS = {'poll': poll_client, 'stream': stream_client, 'page': page_client, 'api': api_client}
+
+
+async def sleep_or_stop(stop: asyncio.Event, seconds: float):
+    if seconds <= 0:
+        await asyncio.sleep(0)
+        return
+    try:
+        await asyncio.wait_for(stop.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """解析客户端组合，如"poll=70,stream=20,page=10"（权重，不要求和为100）"""
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in CLIENTS:
+            raise ValueError(f"未知的客户端类型: {name}（可选 {', '.join(CLIENT_TYPES)}）")
+        mix[name] = float(weight or 1)
+    if sum(mix.values()) <= 0:
+        raise ValueError('客户端组合的权重之和需要大于0')
+    return mix
+
+
+def assign_clients(mix: Dict[str, float], count: int) -> Dict[str, int]:
+    """按权重把count个客户端分配到各类型（最大余数法）"""
+    total = sum(mix.values())
+    exact = {name: count * weight / total for name, weight in mix.items()}
+    counts = {name: int(value) for name, value in exact.items()}
+    for name in sorted(exact, key=lambda n: exact[n] - counts[n], reverse=True)[:count - sum(counts.values())]:
+        counts[name] += 1
+    return counts
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """进程及其子进程（prefork工作进程）的常驻内存（字节），无法读取时为None"""
+    if HAS_PSUTIL:
+        try:
+            process = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+        except psutil.Error:
+            return None
+    total = 0
+    pending = [pid]
+    try:
+        while pending:
+            current = pending.pop()
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+            try:
+                with open(f'/proc/{current}/task/{current}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+    except OSError:
+        return None
+    return total
+
+
+async def sample_rss(pid: Optional[int], samples: List[int], stop: asyncio.Event, interval: float = 0.5):
+    while pid is not None and not stop.is_set():
+        rss = process_tree_rss(pid)
+        if rss is not None:
+            samples.append(rss)
+        await sleep_or_stop(stop, interval)
+
+
+async def run_level(host: str, port: int, mix: Dict[str, float], concurrency: int, duration: float,
+                    warmup: float, interval: float, server_pid: Optional[int], seed: int) -> dict:
+    """以concurrency个客户端运行warmup + duration秒，只统计预热之后的请求"""
+    counts = assign_clients(mix, concurrency)
+    recorder = Recorder()
+    stop = asyncio.Event()
+    rng = random.Random(seed)
+    rss_samples: List[int] = []
+
+    async def start_client(kind: str):
+        # 各客户端在一个刷新间隔内随机错开启动，避免同时请求
+        await sleep_or_stop(stop, rng.uniform(0, min(interval, warmup)) if interval > 0 else 0)
+        if not stop.is_set():
+            await CLIENTS[kind](host, port, recorder, interval, stop)
+
+    tasks = [asyncio.ensure_future(start_client(kind)) for kind, count in counts.items() for _ in range(count)]
+    rss_task = asyncio.ensure_future(sample_rss(server_pid, rss_samples, stop))
+    await asyncio.sleep(warmup)
+    rss_start = process_tree_rss(server_pid) if server_pid else None
+    recorder.measuring = True
+    cpu_start = time.process_time()
+    started = time.perf_counter()
+    await asyncio.sleep(duration)
+    recorder.measuring = False
+    elapsed = time.perf_counter() - started
+    client_cpu = time.process_time() - cpu_start
+    stop.set()
+    await asyncio.wait(tasks + [rss_task], timeout=REQUEST_TIMEOUT)
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+
+    endpoints = {}
+    total_ok = total_errors = 0
+    all_latencies: List[float] = []
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        latencies.sort()
+        errors = recorder.errors.get(endpoint, 0)
+        total_ok += len(latencies)
+        total_errors += errors
+        all_latencies.extend(latencies)
+        endpoints[endpoint] = summarize(latencies, errors, elapsed)
+    all_latencies.sort()
+    result = {
+        'concurrency': concurrency,
+        'clients': counts,
+        'duration': elapsed,
+        'requests': total_ok + total_errors,
+        'errors': total_errors,
+        'error_rate': total_errors / (total_ok + total_errors) if total_ok + total_errors else 0.0,
+        'rps': total_ok / elapsed,
+        'p50_ms': percentile(all_latencies, 50) * 1000,
+        'p90_ms': percentile(all_latencies, 90) * 1000,
+        'p99_ms': percentile(all_latencies, 99) * 1000,
+        'mb_per_s': recorder.bytes / elapsed / 1024 / 1024,
+        'stream_events': recorder.stream_events,
+        'client_cpu': client_cpu / elapsed,  # 压测客户端自身占用的CPU（核），与服务器同机时会挤占服务器
+        'endpoints': endpoints,
+        'error_samples': recorder.error_samples,
+    }
+    if rss_samples:
+        result['rss_mb'] = {'start': (rss_start or rss_samples[0]) / 1024 / 1024,
+                            'peak': max(rss_samples) / 1024 / 1024,
+                            'end': rss_samples[-1] / 1024 / 1024}
+    return result
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    """一个接口的统计（latencies已排序）"""
+    count = len(latencies)
+    return {
+        'requests': count + errors,
+        'errors': errors,
+        'rps': count / elapsed,
+        'mean_ms': sum(latencies) / count * 1000 if count else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': latencies[-1] * 1000 if count else 0.0,
+    }
+
+
+def print_level(result: dict, baseline: Optional[dict] = None):
+    clients = ', '.join(f"{kind} {count}" for kind, count in result['clients'].items() if count)
+    line = (f"\n并发 {result['concurrency']}（{clients}）: {result['rps']:.0f} req/s, "
+            f"P50 {result['p50_ms']:.1f} ms, P99 {result['p99_ms']:.1f} ms, "
+            f"错误 {result['errors']}/{result['requests']} ({result['error_rate'] * 100:.2f}%)")
+    if baseline is not None:
+        line += (f"  [吞吐 {change(result['rps'], baseline['rps']):+.1f}%, "
+                 f"P99 {change(result['p99_ms'], baseline['p99_ms']):+.1f}%]")
+    print(line)
+    rss = result.get('rss_mb')
+    extra = f"  流量 {result['mb_per_s']:.2f} MB/s, 推送事件 {result['stream_events']}, " \
+            f"客户端CPU {result['client_cpu'] * 100:.0f}%"
+    if rss:
+        extra += f", 服务器RSS {rss['start']:.1f} -> 峰值 {rss['peak']:.1f} MB"
+    print(extra)
+    for endpoint, item in result['endpoints'].items():
+        print(f"  {endpoint:<26} {item['rps']:8.1f} req/s  P50 {item['p50_ms']:7.1f}  "
+              f"P90 {item['p90_ms']:7.1f}  P99 {item['p99_ms']:7.1f}  max {item['max_ms']:7.1f} ms"
+              f"  错误 {item['errors']}")
+    for sample in result['error_samples']:
+        print(f"  错误示例: {sample}")
+
+
+def change(value: float, base: float) -> float:
+    return (value / base - 1) * 100 if base else 0.0
+
+
+def environment() -> dict:
+    """运行环境（比较不同版本的结果时参考）"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+async def sweep(args, server_pid: Optional[int], baseline: Optional[dict]) -> List[dict]:
+    mix = parse_mix(args.mix)
+    previous = {level['concurrency']: level for level in (baseline or {}).get('levels', [])}
+    results = []
+    for index, concurrency in enumerate(args.concurrency):
+        result = await run_level(args.host, args.port, mix, concurrency, args.duration, args.warmup,
+                                 args.interval, server_pid, args.seed + index)
+        print_level(result, previous.get(concurrency))
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='仪表盘负载测试（asyncio虚拟客户端，并发级别扫描）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f'客户端组合及权重（{"/".join(CLIENT_TYPES)}，默认 {DEFAULT_MIX}）')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 100], help='各并发级别的客户端数')
+    parser.add_argument('--duration', type=float, default=20.0, help='每个级别的统计时长（秒）')
+    parser.add_argument('--warmup', type=float, default=3.0, help='每个级别开始统计前的预热时间（秒）')
+    parser.add_argument('--interval', type=float, default=3.0,
+                        help='页面刷新间隔（秒，与页面的轮询间隔一致；调小可模拟更多页面）')
+    parser.add_argument('--seed', type=int, default=1, help='客户端错开启动的随机种子')
+    parser.add_argument('--mode', choices=('threaded', 'asyncio', 'single'), default='threaded', help='服务模式')
+    parser.add_argument('--workers', type=int, help='以prefork_server.py启动的工作进程数')
+    parser.add_argument('--fleet', type=int, default=200, help='模拟日志的飞机数')
+    parser.add_argument('--update-interval', type=float, default=5.0, help='每架飞机的更新间隔（秒）')
+    parser.add_argument('--server-arg', action='append', default=[], metavar='ARG',
+                        help='传给服务器的附加参数（可重复，如 --server-arg=--cache-ttl=0）')
+    parser.add_argument('--attach', action='store_true',
+                        help='不启动服务器，测试已在--host/--port运行的服务（配合--server-pid统计RSS）')
+    parser.add_argument('--server-pid', type=int, help='--attach时服务器的进程号')
+    parser.add_argument('--json', metavar='PATH', help='保存结果（JSON）')
+    parser.add_argument('--compare', metavar='PATH', help='与之前保存的结果比较（按并发级别）')
+    args = parser.parse_args()
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        env = baseline.get('environment', {})
+        print(f"比较基准: {args.compare}（{env.get('date')} commit {env.get('commit') or '?'}）")
+
+    print(f"CPU核数: {os.cpu_count()}（客户端与服务器在同一台机器上运行，相互挤占CPU）")
+    config = {key: getattr(args, key) for key in ('mix', 'concurrency', 'duration', 'warmup', 'interval',
+                                                  'mode', 'workers', 'fleet', 'update_interval', 'server_arg')}
+    if args.attach:
+        levels = asyncio.run(sweep(args, args.server_pid, baseline))
+    else:
+        log_file = tempfile.NamedTemporaryFile('w', suffix='.log', delete=False)
+        log_file.close()
+        writer = LogWriter(log_file.name, args.fleet, args.update_interval)
+        script, extra = SERVER_SCRIPT, list(args.server_arg)
+        if args.workers:
+            script, extra = PREFORK_SCRIPT, ['--workers', str(args.workers)] + extra
+        try:
+            writer.start()
+            with ServerProcess(args.mode, args.host, args.port, log_file.name, extra, script) as server:
+                levels = asyncio.run(sweep(args, server.process.pid, baseline))
+        finally:
+            writer.stop()
+            os.unlink(log_file.name)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'config': config, 'levels': levels},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.json}")
+    if any(level['error_rate'] > 0.01 for level in levels):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
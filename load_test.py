@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+本地HTTP压测工具
+多个并发客户端反复请求同一URL，统计吞吐量和延迟分位数；
+可依次以不同服务模式启动minimal_server.py进行对比，或比较prefork_server.py不同工作进程数的扩展性；
+也可对比SSE推送和轮询的端到端延迟与流量，或测量流式导出的吞吐量
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Dict, List
+
+from coord_converter import CoordinateConverter
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'minimal_server.py')
+PREFORK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prefork_server.py')
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """计算已排序数据的分位数（最近秩法）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def open_slow_clients(host: str, port: int, count: int) -> List[socket.socket]:
+    """打开count个只发送半个请求就停住的慢客户端连接"""
+    sockets = []
+    for _ in range(count):
+        try:
+            sock = socket.create_connection((host, port), timeout=5)
+            sock.sendall(b'GET / HTTP/1.1\r\nHost: localhost\r\n')  # 请求头未结束
+            sockets.append(sock)
+        except OSError:
+            pass
+    return sockets
+
+
+def run_load(host: str = '127.0.0.1', port: int = 8000, path: str = '/api/aircraft/',
+             clients: int = 50, requests_per_client: int = 20, keep_alive: bool = False,
+             timeout: float = 30.0, headers: dict = None) -> dict:
+    """启动clients个并发客户端，每个依次发送requests_per_client个请求
+
+    keep_alive为True时每个客户端复用同一个连接，否则每个请求新建连接；
+    headers为附加的请求头（如If-None-Match）。
+    """
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients)
+
+    def client():
+        local_latencies = []
+        local_errors = 0
+        connection = None
+        start_barrier.wait()
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+                connection.request('GET', path, headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+                if not keep_alive or response.will_close:
+                    connection.close()
+                    connection = None
+                if response.status >= 400:
+                    local_errors += 1
+                    continue
+            except Exception:
+                local_errors += 1
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                continue
+            local_latencies.append(time.perf_counter() - start)
+        if connection is not None:
+            connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'path': path,
+        'clients': clients,
+        'keep_alive': keep_alive,
+        'requests': len(latencies) + errors[0],
+        'errors': errors[0],
+        'elapsed': elapsed,
+        'rps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def print_report(result: dict, label: str = ''):
+    """打印压测结果"""
+    prefix = f"[{label}] " if label else ''
+    print(f"{prefix}{result['path']} 并发 {result['clients']}"
+          f"{' 长连接' if result.get('keep_alive') else ''}: "
+          f"{result['rps']:.0f} req/s, 平均 {result['mean_ms']:.1f} ms, "
+          f"P50 {result['p50_ms']:.1f} ms, P99 {result['p99_ms']:.1f} ms, "
+          f"错误 {result['errors']}/{result['requests']}")
+
+
+def measure_export(host: str = '127.0.0.1', port: int = 8000,
+                   path: str = '/api/export?format=ndjson', headers: dict = None,
+                   probe_path: str = '/api/aircraft/', probe_interval: float = 0.1) -> dict:
+    """下载流式导出并测量吞吐量（MB/s），同时周期性请求probe_path，检查导出期间其他请求的延迟"""
+    done = threading.Event()
+    probe_latencies: List[float] = []
+
+    def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                connection.request('GET', probe_path)
+                connection.getresponse().read()
+                connection.close()
+                probe_latencies.append(time.perf_counter() - start)
+            except Exception:
+                pass
+            done.wait(probe_interval)
+
+    prober = threading.Thread(target=probe, daemon=True)
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    start = time.perf_counter()
+    prober.start()
+    try:
+        connection.request('GET', path, headers=headers or {})
+        response = connection.getresponse()
+        content_encoding = response.getheader('Content-Encoding')
+        # 压缩的响应解压后统计行数（gzip/deflate）
+        decoder = zlib.decompressobj(47) if content_encoding in ('gzip', 'deflate') else None
+        first_byte = None
+        total = lines = 0
+        while True:
+            data = response.read(64 * 1024)  # http.client负责解码分块
+            if not data:
+                break
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            total += len(data)
+            lines += (decoder.decompress(data) if decoder else data).count(b'\n')
+        elapsed = time.perf_counter() - start
+    finally:
+        done.set()
+        connection.close()
+    prober.join()
+
+    probe_latencies.sort()
+    return {
+        'path': path,
+        'status': response.status,
+        'transfer_encoding': response.getheader('Transfer-Encoding'),
+        'content_encoding': content_encoding,
+        'bytes': total,
+        'lines': lines,
+        'elapsed': elapsed,
+        'first_byte_ms': (first_byte or 0.0) * 1000,
+        'mb_per_s': total / 1024 / 1024 / elapsed if elapsed > 0 else 0.0,
+        'probe_requests': len(probe_latencies),
+        'probe_p50_ms': percentile(probe_latencies, 50) * 1000,
+        'probe_p99_ms': percentile(probe_latencies, 99) * 1000,
+    }
+
+
+def print_export_report(result: dict):
+    """打印导出吞吐量测试结果"""
+    encoding = f", {result['content_encoding']}" if result['content_encoding'] else ''
+    print(f"{result['path']} -> {result['status']} ({result['transfer_encoding'] or '无分块'}{encoding})")
+    print(f"  {result['bytes'] / 1024 / 1024:.1f} MB, {result['lines']} 行, {result['elapsed']:.2f} s, "
+          f"{result['mb_per_s']:.1f} MB/s, 首字节 {result['first_byte_ms']:.1f} ms")
+    print(f"  导出期间其他请求 {result['probe_requests']} 次: "
+          f"P50 {result['probe_p50_ms']:.1f} ms, P99 {result['probe_p99_ms']:.1f} ms")
+
+
+def wait_for_port(host: str, port: int, timeout: float = 10.0) -> bool:
+    """等待服务器开始监听"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+class ServerProcess:
+    """以子进程方式启动minimal_server.py（或prefork_server.py）"""
+
+    def __init__(self, mode: str, host: str = '127.0.0.1', port: int = 8000,
+                 log_path: str = 'adsb_decoded.log', extra_args: list = None,
+                 script: str = SERVER_SCRIPT):
+        self.host = host
+        self.port = port
+        self.command = [sys.executable, script, '--mode', mode, '--host', host,
+                        '--port', str(port), '--log', log_path, '--quiet'] + (extra_args or [])
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, stdout=subprocess.DEVNULL)
+        if not wait_for_port(self.host, self.port):
+            self.process.kill()
+            raise RuntimeError(f"服务器启动失败: {' '.join(self.command)}")
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+def compare_modes(modes=('single', 'threaded', 'asyncio'), host: str = '127.0.0.1',
+                  port: int = 8000, path: str = '/api/aircraft/', clients: int = 50,
+                  requests_per_client: int = 20, keep_alive: bool = False,
+                  slow_clients: int = 0, log_path: str = 'adsb_decoded.log') -> list:
+    """依次以各模式启动服务器并压测"""
+    results = []
+    for mode in modes:
+        with ServerProcess(mode, host, port, log_path):
+            slow = open_slow_clients(host, port, slow_clients)
+            result = run_load(host, port, path, clients, requests_per_client, keep_alive,
+                              timeout=5.0 if slow_clients else 30.0)
+            for sock in slow:
+                sock.close()
+        result['mode'] = mode
+        print_report(result, mode)
+        results.append(result)
+    return results
+
+
+def compare_workers(worker_counts=(1, 2, 4), host: str = '127.0.0.1', port: int = 8000,
+                    path: str = '/api/aircraft/', clients: int = 50, requests_per_client: int = 20,
+                    keep_alive: bool = False, log_path: str = 'adsb_decoded.log',
+                    headers: dict = None) -> list:
+    """先压测单进程threaded模式作为基准，再依次以不同工作进程数启动prefork_server.py"""
+    print(f"CPU核数: {os.cpu_count()}（工作进程数超过核数时不会再有加速）")
+    runs = [('单进程', SERVER_SCRIPT, [])]
+    runs += [(f'{count} 进程', PREFORK_SCRIPT, ['--workers', str(count)]) for count in worker_counts]
+    results = []
+    for label, script, extra_args in runs:
+        with ServerProcess('threaded', host, port, log_path, extra_args, script):
+            run_load(host, port, path, 4, 5, keep_alive, headers=headers)  # 预热，等待首次快照发布
+            result = run_load(host, port, path, clients, requests_per_client, keep_alive,
+                              headers=headers)
+        result['label'] = label
+        result['speedup'] = result['rps'] / results[0]['rps'] if results and results[0]['rps'] else 1.0
+        print_report(result, label)
+        results.append(result)
+    print("\n相对单进程的吞吐量:")
+    for result in results:
+        print(f"  {result['label']:>6}: {result['rps']:8.0f} req/s  {result['speedup']:.2f}x")
+    return results
+
+
+# 推送/轮询对比中用于测量延迟的探针飞机，高度字段写入序号
+PROBE_ICAO = 'FFF001'
+
+
+class LogWriter(threading.Thread):
+    """模拟nav.py向解码日志追加数据
+
+    fleet架背景飞机每update_interval秒各更新一次；探针飞机每probe_interval秒更新一次，
+    高度字段为递增序号，written记录每个序号的写入时间（time.monotonic）
+    """
+
+    def __init__(self, log_path: str, fleet: int = 100, update_interval: float = 5.0,
+                 probe_interval: float = 0.5):
+        super().__init__(name='log-writer', daemon=True)
+        self.log_path = log_path
+        self.fleet = fleet
+        self.update_interval = update_interval
+        self.probe_interval = probe_interval
+        self.written: Dict[int, float] = {}
+        self.converter = CoordinateConverter()
+        self._stop_event = threading.Event()
+
+    def format_line(self, icao: str, lat: float, lon: float, alt: int) -> str:
+        """按nav.py的日志格式生成一行（接收时间为当前时间，解码和写入延迟记为0）"""
+        seconds, micros = divmod(int(time.time() * 1000000), 1000000)
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds))
+        ecef = CoordinateConverter.lla_to_ecef(lat, lon, alt * 0.3048)
+        enu = self.converter.lla_to_enu(lat, lon, alt * 0.3048)
+        return (f"{timestamp}.{micros:06d},{icao},{lat:.6f},{lon:.6f},{alt},"
+                f"{ecef[0]:.1f},{ecef[1]:.1f},{ecef[2]:.1f},"
+                f"{enu[0]:.1f},{enu[1]:.1f},{enu[2]:.1f},0.000,0.000\n")
+
+    def run(self):
+        rng = random.Random(1)
+        fleet = [(f"{i:06X}", rng.uniform(39.0, 40.8), rng.uniform(115.4, 117.4),
+                  rng.randrange(1000, 40000, 25)) for i in range(self.fleet)]
+        per_round = min(self.fleet, int(round(self.fleet * self.probe_interval / self.update_interval)))
+        cursor = 0
+        sequence = 0
+        if not fleet:
+            per_round = 0
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            while not self._stop_event.is_set():
+                lines = []
+                for _ in range(per_round):
+                    icao, lat, lon, alt = fleet[cursor]
+                    lat += rng.uniform(-0.002, 0.002)
+                    lon += rng.uniform(-0.002, 0.002)
+                    fleet[cursor] = (icao, lat, lon, alt)
+                    lines.append(self.format_line(icao, lat, lon, alt))
+                    cursor = (cursor + 1) % len(fleet)
+                sequence += 1
+                lines.append(self.format_line(PROBE_ICAO, 39.9, 116.4, sequence))
+                self.written[sequence] = time.monotonic()
+                f.write(''.join(lines))
+                f.flush()
+                self._stop_event.wait(self.probe_interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def update_latencies(written: Dict[int, float], observations: List[tuple]) -> List[float]:
+    """计算每次探针更新的端到端延迟：从写入日志到客户端第一次看到该序号或更新的序号
+
+    observations为按时间排列的(收到时间, 看到的最大序号)
+    """
+    latencies = []
+    index = 0
+    for sequence in sorted(written):
+        while index < len(observations) and observations[index][1] < sequence:
+            index += 1
+        if index == len(observations):
+            break
+        latencies.append(observations[index][0] - written[sequence])
+    return latencies
+
+
+class PushClient(threading.Thread):
+    """SSE客户端：记录看到的探针序号和收到的字节数"""
+
+    def __init__(self, host: str, port: int, writer: LogWriter, coalesce: float):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.writer = writer
+        self.coalesce = coalesce
+        self.observations: List[tuple] = []
+        self.bytes = 0
+        self.connection = None
+
+    def run(self):
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        self.connection.request('GET', f'/api/stream/?coalesce={self.coalesce}')
+        response = self.connection.getresponse()
+        try:
+            for line in response:
+                self.bytes += len(line)
+                if not line.startswith(b'data: '):
+                    continue
+                received = time.monotonic()
+                for aircraft in json.loads(line[6:])['aircraft']:
+                    if aircraft['icao'] == PROBE_ICAO:
+                        self.observations.append((received, aircraft['alt']))
+        except (OSError, ValueError, AttributeError):
+            pass  # 测试结束时连接被关闭
+
+    def stop(self):
+        if self.connection is not None and self.connection.sock is not None:
+            self.connection.sock.shutdown(socket.SHUT_RDWR)
+
+
+class PollClient(threading.Thread):
+    """轮询客户端：按固定间隔请求/api/aircraft/（长连接）"""
+
+    def __init__(self, host: str, port: int, writer: LogWriter, interval: float = 3.0):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.writer = writer
+        self.interval = interval
+        self.observations: List[tuple] = []
+        self.bytes = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        while not self._stop_event.is_set():
+            connection.request('GET', '/api/aircraft/')
+            body = connection.getresponse().read()
+            received = time.monotonic()
+            self.bytes += len(body)
+            for aircraft in json.loads(body)['aircraft']:
+                if aircraft['icao'] == PROBE_ICAO:
+                    self.observations.append((received, aircraft['alt']))
+            self._stop_event.wait(self.interval)
+        connection.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def compare_push_poll(mode: str = 'threaded', host: str = '127.0.0.1', port: int = 8000,
+                      duration: float = 60.0, fleet: int = 100, update_interval: float = 5.0,
+                      coalesce: float = 1.0, poll_interval: float = 3.0) -> dict:
+    """启动服务器和模拟日志写入，同时运行一个SSE客户端和一个轮询客户端
+
+    延迟为探针飞机的一行写入日志到客户端第一次看到该位置（或更新的位置）的时间，
+    包含采集线程的轮询间隔；流量只统计响应体
+    """
+    print(f"推送/轮询对比: {mode}模式, {fleet} 架飞机每 {update_interval} 秒更新, "
+          f"时长 {duration:.0f} 秒, "
+          f"合并窗口 {coalesce} 秒, 轮询间隔 {poll_interval} 秒")
+    log_file = tempfile.NamedTemporaryFile('w', suffix='.log', delete=False)
+    log_file.close()
+    writer = LogWriter(log_file.name, fleet, update_interval)
+    try:
+        with ServerProcess(mode, host, port, log_file.name):
+            writer.start()
+            push = PushClient(host, port, writer, coalesce)
+            poll = PollClient(host, port, writer, poll_interval)
+            push.start()
+            poll.start()
+            time.sleep(duration)
+            push.stop()
+            poll.stop()
+            writer.stop()
+            push.join(5)
+            poll.join(5)
+    finally:
+        os.unlink(log_file.name)
+
+    results = {}
+    for name, client in (('推送(SSE)', push), ('轮询', poll)):
+        latencies = sorted(update_latencies(writer.written, client.observations))
+        results[name] = {
+            'updates': len(latencies),
+            'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'bytes_per_minute': client.bytes / duration * 60,
+        }
+        r = results[name]
+        print(f"[{name}] 探针更新 {r['updates']}/{len(writer.written)} 次, "
+              f"延迟 平均 {r['mean_ms']:.0f} ms, P50 {r['p50_ms']:.0f} ms, P99 {r['p99_ms']:.0f} ms, "
+              f"流量 {r['bytes_per_minute'] / 1024:.1f} KB/分钟")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ADS-B服务器本地压测')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--path', default='/api/aircraft/')
+    parser.add_argument('--clients', type=int, default=50, help='并发客户端数')
+    parser.add_argument('--requests', type=int, default=20, help='每个客户端的请求数')
+    parser.add_argument('--keep-alive', action='store_true', help='客户端复用连接')
+    parser.add_argument('--header', action='append', default=[], metavar='NAME:VALUE',
+                        help='附加请求头，可重复（如 "If-None-Match: W/\"123\""）')
+    parser.add_argument('--slow-clients', type=int, default=0,
+                        help='压测期间保持的慢客户端数（只发送半个请求）')
+    parser.add_argument('--compare-modes', nargs='*', metavar='MODE',
+                        help='依次启动指定模式的服务器进行对比（默认 single threaded asyncio）')
+    parser.add_argument('--compare-workers', nargs='*', type=int, metavar='N',
+                        help='比较单进程与prefork_server.py各工作进程数的吞吐量（默认 1 2 4）')
+    parser.add_argument('--log', default='adsb_decoded.log',
+                        help='--compare-modes/--compare-workers时服务器读取的日志')
+    parser.add_argument('--push-vs-poll', action='store_true',
+                        help='对比SSE推送与3秒轮询的端到端延迟和流量（自动启动服务器和模拟数据）')
+    parser.add_argument('--mode', default='threaded', help='--push-vs-poll时的服务模式')
+    parser.add_argument('--duration', type=float, default=60.0, help='--push-vs-poll测试时长（秒）')
+    parser.add_argument('--fleet', type=int, default=100, help='--push-vs-poll模拟的飞机数')
+    parser.add_argument('--update-interval', type=float, default=5.0,
+                        help='--push-vs-poll每架飞机的更新间隔（秒）')
+    parser.add_argument('--coalesce', type=float, default=1.0, help='--push-vs-poll推送合并窗口（秒）')
+    parser.add_argument('--export', metavar='PATH', nargs='?', const='/api/export?format=ndjson',
+                        help='测量流式导出的吞吐量（默认 /api/export?format=ndjson），同时用--path探测其他请求的延迟')
+    args = parser.parse_args()
+
+    if args.push_vs_poll:
+        compare_push_poll(args.mode, args.host, args.port, args.duration, args.fleet,
+                          args.update_interval, args.coalesce)
+        return
+
+    if args.compare_modes is not None:
+        compare_modes(args.compare_modes or ('single', 'threaded', 'asyncio'), args.host, args.port,
+                      args.path, args.clients, args.requests, args.keep_alive, args.slow_clients,
+                      args.log)
+        return
+
+    headers = dict(item.split(':', 1) for item in args.header)
+    headers = {name.strip(): value.strip() for name, value in headers.items()}
+    if args.compare_workers is not None:
+        compare_workers(args.compare_workers or (1, 2, 4), args.host, args.port, args.path,
+                        args.clients, args.requests, args.keep_alive, args.log, headers)
+        return
+
+    if args.export:
+        print_export_report(measure_export(args.host, args.port, args.export, headers, args.path))
+        return
+
+    slow = open_slow_clients(args.host, args.port, args.slow_clients)
+    print_report(run_load(args.host, args.port, args.path, args.clients, args.requests,
+                          args.keep_alive, headers=headers))
+    for sock in slow:
+        sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+解码日志的时间和ICAO索引
+日志按行分块（每块最多BLOCK_LINES行），每块记录所在文件、字节范围和最早/最晚时间，
+每架飞机记录出现过的块号。按时间或按飞机查询时只读取可能包含结果的块，
+查询开销与结果数量成正比，与日志总长度无关；只追加写入的日志可增量索引
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from track_history import TRACK_FIELDS
+
+# 每个索引块的最大行数（块越小，按飞机查询时读入的无关行越少，索引越大）
+BLOCK_LINES = 64
+
+# 每次从文件读取并建立索引的字节数
+READ_CHUNK = 4 * 1024 * 1024
+
+# 读取块时每次从索引取出的块数、合并读取的最大字节数
+BLOCK_BATCH = 256
+MAX_READ = 1024 * 1024
+
+# 导出格式和字段（CSV列与日志列一致）
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_FIELDS = ('timestamp', 'icao', 'lat', 'lon', 'alt',
+                 'ecef_x', 'ecef_y', 'ecef_z', 'enu_e', 'enu_n', 'enu_u', 'decode_ms', 'write_ms')
+# 各版本日志的列数：只有位置、含ECEF/ENU坐标、另含解码和写入延迟
+LOG_COLUMNS = (5, 11, 13)
+
+# 日志时间戳格式（可带小数秒）
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+                '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S.%f')
+
+
+def parse_time_value(value: str, latest: Optional[float] = None) -> float:
+    """解析查询参数中的时间：Unix时间、'YYYY-MM-DD HH:MM:SS'（本地时间），
+    或负数秒（相对于日志中最新记录的时间，如-3600为最近一小时）"""
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        for fmt in TIME_FORMATS:
+            try:
+                return datetime.strptime(value, fmt).timestamp()
+            except ValueError:
+                continue
+        raise ValueError(f"无法解析时间: {value}")
+    if seconds < 0:
+        return (latest if latest is not None else time.time()) + seconds
+    return seconds
+
+
+class LogTimeParser:
+    """日志时间戳转换为Unix时间（同一秒内的多行共用一次strptime）"""
+
+    def __init__(self):
+        self.last_second = None
+        self.last_unix = 0.0
+
+    def __call__(self, timestamp: bytes) -> float:
+        second = timestamp[:19]
+        if second != self.last_second:
+            self.last_unix = datetime.strptime(second.decode('ascii'), '%Y-%m-%d %H:%M:%S').timestamp()
+            self.last_second = second
+        if len(timestamp) > 19:
+            return self.last_unix + float(timestamp[19:])
+        return self.last_unix
+
+
+def parse_record(line: bytes, parse_time: LogTimeParser) -> Optional[tuple]:
+    """解析一行日志为(时间, ICAO, 纬度, 经度, 高度, enu_e, enu_n, enu_u, 时间戳字符串（精确到秒）)
+
+    旧格式日志没有ENU坐标，对应值为None；无法解析的行返回None
+    """
+    parts = line.split(b',')
+    if len(parts) < 5:
+        return None
+    try:
+        enu = (float(parts[8]), float(parts[9]), float(parts[10])) if len(parts) >= 11 else (None,) * 3
+        return (parse_time(parts[0]), parts[1].decode('ascii'), float(parts[2]), float(parts[3]),
+                int(parts[4])) + enu + (parts[0][:19].decode('ascii'),)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def line_in_range(line: bytes, start: float, end: float, parse_time: LogTimeParser) -> bool:
+    """日志行的时间是否在[start, end]内（无法解析的行返回False）"""
+    try:
+        return start <= parse_time(line.split(b',', 1)[0]) <= end
+    except ValueError:
+        return False
+
+
+class LogIndex:
+    """日志文件的分块时间/ICAO索引（线程安全）
+
+    paths为按时间先后排列的日志分段，最后一个为正在写入的日志，refresh()增量索引
+    其新增的完整行；之前的分段只索引一次。日志基本按时间顺序写入，少量乱序不影响结果：
+    prefix_max（块最晚时间的前缀最大值）和suffix_min（块最早时间的后缀最小值）
+    都是单调的，二分即可得到可能包含某时间段的块区间
+    """
+
+    def __init__(self, paths: Sequence[str], block_lines: int = BLOCK_LINES):
+        self.paths = list(paths)
+        self.block_lines = block_lines
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清空索引（日志被截断或替换时重建）"""
+        with self.lock:
+            self.indexed = [0] * len(self.paths)  # 每个分段已索引到的字节偏移
+            self.block_segment = array('H')
+            self.block_start = array('q')
+            self.block_end = array('q')
+            self.block_tmin = array('d')
+            self.block_tmax = array('d')
+            self.prefix_max = array('d')
+            self.suffix_min = array('d')
+            self.icao_blocks: Dict[str, array] = {}  # ICAO -> 出现过的块号（递增）
+            self.records = 0
+            self.latest_time: Optional[float] = None
+
+    def refresh(self) -> int:
+        """索引各分段新增的完整行，返回新增的记录数"""
+        added = 0
+        for segment, path in enumerate(self.paths):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if size < self.indexed[segment]:
+                # 日志被截断或替换，重建全部索引
+                self.reset()
+                return self.refresh()
+            if size > self.indexed[segment]:
+                added += self._index_segment(segment, path, size)
+        return added
+
+    def _index_segment(self, segment: int, path: str, size: int) -> int:
+        added = 0
+        parse_time = LogTimeParser()
+        with open(path, 'rb') as f:
+            offset = self.indexed[segment]
+            f.seek(offset)
+            while offset < size:
+                data = f.read(min(READ_CHUNK, size - offset))
+                if not data:
+                    break
+                end = data.rfind(b'\n') + 1
+                if end == 0:
+                    if len(data) < READ_CHUNK:
+                        break  # 只剩未写完的行
+                    end = len(data)  # 超长行，整块跳过
+                else:
+                    f.seek(offset + end)
+                added += self._index_lines(segment, offset, data[:end], parse_time)
+                offset += end
+                self.indexed[segment] = offset
+        return added
+
+    def _index_lines(self, segment: int, base: int, data: bytes, parse_time: LogTimeParser) -> int:
+        """为一段完整行建立索引块（调用方保证data以换行结尾）"""
+        lines = data.split(b'\n')
+        lines.pop()  # 结尾换行后的空串
+        added = 0
+        position = base
+        for first in range(0, len(lines), self.block_lines):
+            start = position
+            tmin = float('inf')
+            tmax = float('-inf')
+            icaos = set()
+            for line in lines[first:first + self.block_lines]:
+                position += len(line) + 1
+                parts = line.split(b',', 2)
+                if len(parts) < 3:
+                    continue
+                try:
+                    t = parse_time(parts[0])
+                    icao = parts[1].decode('ascii')
+                except (ValueError, UnicodeDecodeError):
+                    continue
+                if t < tmin:
+                    tmin = t
+                if t > tmax:
+                    tmax = t
+                icaos.add(icao)
+                added += 1
+            if not icaos:
+                continue
+            self._append_block(segment, start, position, tmin, tmax, icaos)
+        with self.lock:
+            self.records += added
+        return added
+
+    def _append_block(self, segment: int, start: int, end: int, tmin: float, tmax: float, icaos):
+        with self.lock:
+            block = len(self.block_start)
+            self.block_segment.append(segment)
+            self.block_start.append(start)
+            self.block_end.append(end)
+            self.block_tmin.append(tmin)
+            self.block_tmax.append(tmax)
+            self.prefix_max.append(max(tmax, self.prefix_max[-1]) if block else tmax)
+            # 维护后缀最小值：按时间顺序写入时只修改新块本身
+            self.suffix_min.append(tmin)
+            j = block - 1
+            while j >= 0 and self.suffix_min[j] > tmin:
+                self.suffix_min[j] = tmin
+                j -= 1
+            for icao in icaos:
+                blocks = self.icao_blocks.get(icao)
+                if blocks is None:
+                    blocks = self.icao_blocks[icao] = array('I')
+                blocks.append(block)
+            if self.latest_time is None or tmax > self.latest_time:
+                self.latest_time = tmax
+
+    def block_range(self, start: float, end: float) -> tuple:
+        """可能包含[start, end]内记录的块区间[lo, hi)（调用方需持有lock）"""
+        return bisect_left(self.prefix_max, start), bisect_right(self.suffix_min, end)
+
+    def _candidate_blocks(self, start: float, end: float, icao: Optional[str] = None) -> Sequence[int]:
+        """可能包含结果的块号（不限飞机时为range，不占用额外内存）"""
+        with self.lock:
+            lo, hi = self.block_range(start, end)
+            if icao is None:
+                return range(lo, hi)
+            icao_blocks = self.icao_blocks.get(icao)
+            if icao_blocks is None:
+                return range(0)
+            return icao_blocks[bisect_left(icao_blocks, lo):bisect_left(icao_blocks, hi)]
+
+    def _read_blocks(self, blocks: Sequence[int], start: float, end: float) -> Iterator[tuple]:
+        """按块号读取日志，返回(以换行结尾的数据, 是否整段都在[start, end]内)
+
+        每次只从索引中取BLOCK_BATCH个块的位置，相邻且性质相同的块合并读取，
+        单次读取不超过MAX_READ字节，内存占用与导出的总量无关
+        """
+        files = {}
+        try:
+            for first in range(0, len(blocks), BLOCK_BATCH):
+                with self.lock:
+                    ranges = [(self.block_segment[b], self.block_start[b], self.block_end[b],
+                               start <= self.block_tmin[b] and self.block_tmax[b] <= end)
+                              for b in blocks[first:first + BLOCK_BATCH]]
+                k = 0
+                while k < len(ranges):
+                    segment, offset, stop, inside = ranges[k]
+                    k += 1
+                    while (k < len(ranges) and ranges[k][0] == segment and ranges[k][1] == stop
+                           and ranges[k][3] == inside and ranges[k][2] - offset <= MAX_READ):
+                        stop = ranges[k][2]
+                        k += 1
+                    f = files.get(segment)
+                    if f is None:
+                        f = files[segment] = open(self.paths[segment], 'rb')
+                    f.seek(offset)
+                    yield f.read(stop - offset), inside
+        finally:
+            for f in files.values():
+                f.close()
+
+    def lines_between(self, start: float, end: float, icao: Optional[str] = None) -> Iterator[List[bytes]]:
+        """按日志顺序分批返回时间在[start, end]内的原始日志行（不含换行符）
+
+        整块都在时间范围内的块不做逐行的时间判断；指定飞机时只比较ICAO字段
+        """
+        prefix = icao.encode('ascii') if icao is not None else None
+        parse_time = LogTimeParser()
+        for data, inside in self._read_blocks(self._candidate_blocks(start, end, icao), start, end):
+            lines = data.split(b'\n')
+            lines.pop()
+            if prefix is not None:
+                lines = [line for line in lines if line.split(b',', 2)[1:2] == [prefix]]
+            if not inside:
+                lines = [line for line in lines if line_in_range(line, start, end, parse_time)]
+            if lines:
+                yield lines
+
+    def records_between(self, start: float, end: float, icao: Optional[str] = None) -> Iterator[tuple]:
+        """按日志顺序返回时间在[start, end]内的记录（见parse_record），可只返回一架飞机"""
+        parse_time = LogTimeParser()
+        for lines in self.lines_between(start, end, icao):
+            for line in lines:
+                record = parse_record(line, parse_time)
+                if record is not None:
+                    yield record
+
+    def track(self, icao: str, start: float, end: float, limit: Optional[int] = None) -> tuple:
+        """单架飞机在[start, end]内的航迹（按TRACK_FIELDS分列），返回(航迹, 是否被limit截断)"""
+        columns = {name: [] for name in TRACK_FIELDS}
+        truncated = False
+        for record in self.records_between(start, end, icao):
+            if limit is not None and len(columns['time']) >= limit:
+                truncated = True
+                break
+            values = (record[0],) + record[2:8]
+            for name, value in zip(TRACK_FIELDS, values):
+                columns[name].append(value)
+        return columns, truncated
+
+    def snapshot(self, at: float, window: float = 300.0) -> List[dict]:
+        """时刻at每架飞机的最后已知位置（只考虑at之前window秒内的记录）"""
+        latest = {}
+        for record in self.records_between(at - window, at):
+            previous = latest.get(record[1])
+            if previous is None or record[0] >= previous[0]:
+                latest[record[1]] = record
+        aircraft = []
+        for record in latest.values():
+            t, icao, lat, lon, alt, enu_e, enu_n, enu_u, timestamp = record
+            aircraft.append({'icao': icao, 'lat': lat, 'lon': lon, 'alt': alt,
+                             'time': t, 'timestamp': timestamp, 'age': at - t,
+                             'enu_e': enu_e, 'enu_n': enu_n, 'enu_u': enu_u})
+        aircraft.sort(key=lambda item: item['icao'])
+        return aircraft
+
+    def stats(self) -> dict:
+        """索引规模"""
+        with self.lock:
+            return {
+                'segments': len(self.paths),
+                'indexed_bytes': sum(self.indexed),
+                'records': self.records,
+                'blocks': len(self.block_start),
+                'aircraft': len(self.icao_blocks),
+                'first_time': self.block_tmin[0] if self.block_tmin else None,
+                'latest_time': self.latest_time,
+            }
+
+
+def export_csv(index: LogIndex, start: float, end: float, icao: Optional[str] = None) -> Iterator[bytes]:
+    """CSV导出：第一行为表头，日志行原样输出（旧格式缺少的列留空，无法识别的行跳过）"""
+    yield (','.join(EXPORT_FIELDS) + '\n').encode('ascii')
+    columns = len(EXPORT_FIELDS) - 1
+    for lines in index.lines_between(start, end, icao):
+        out = []
+        for line in lines:
+            commas = line.count(b',')
+            if commas == columns:
+                out.append(line)
+            elif commas + 1 in LOG_COLUMNS:
+                out.append(line.rstrip(b'\r') + b',' * (columns - commas))
+        if out:
+            out.append(b'')
+            yield b'\n'.join(out)
+
+
+def ndjson_line(line: bytes, parse_time: LogTimeParser) -> Optional[str]:
+    """日志行转换为一行JSON（字段同EXPORT_FIELDS，另加Unix时间time），无法解析时返回None"""
+    parts = line.rstrip(b'\r').split(b',')
+    if len(parts) not in LOG_COLUMNS:
+        return None
+    try:
+        t = parse_time(parts[0])
+        icao = parts[1].decode('ascii')
+        alt = int(parts[4])
+        values = [float(value) for value in parts[2:4] + parts[5:]]
+    except ValueError:
+        return None
+    if not icao.isalnum():
+        return None
+    coords = ''.join(f', "{name}": {value!r}' for name, value in zip(EXPORT_FIELDS[5:], values[2:]))
+    return (f'{{"time": {t!r}, "timestamp": "{parts[0].decode("ascii")}", "icao": "{icao}", '
+            f'"lat": {values[0]!r}, "lon": {values[1]!r}, "alt": {alt}{coords}}}\n')
+
+
+def export_ndjson(index: LogIndex, start: float, end: float, icao: Optional[str] = None) -> Iterator[bytes]:
+    """NDJSON导出：每行一条记录"""
+    parse_time = LogTimeParser()
+    for lines in index.lines_between(start, end, icao):
+        out = [ndjson_line(line, parse_time) for line in lines]
+        data = ''.join(item for item in out if item is not None)
+        if data:
+            yield data.encode('ascii')
+
+
+def export_records(index: LogIndex, start: float, end: float, icao: Optional[str] = None,
+                   fmt: str = 'ndjson') -> Iterator[bytes]:
+    """按格式流式导出时间在[start, end]内的记录，每次产出不超过约MAX_READ字节的原始数据"""
+    if fmt == 'csv':
+        return export_csv(index, start, end, icao)
+    if fmt == 'ndjson':
+        return export_ndjson(index, start, end, icao)
+    raise ValueError(f"不支持的导出格式: {fmt}")
+
+
+class LogIndexer(threading.Thread):
+    """后台索引线程：启动时建立索引，之后定期索引新增的日志行"""
+
+    def __init__(self, index: LogIndex, interval: float = 1.0):
+        super().__init__(name='adsb-log-indexer', daemon=True)
+        self.index = index
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.index.refresh()
+            except Exception as e:
+                print(f"日志索引线程出错: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        """停止索引线程"""
+        self._stop_event.set()
+
+
+def benchmark_log_index(sizes=(100000, 1000000), aircraft_count: int = 200):
+    """不同日志长度下建立索引的耗时，按飞机/按时刻查询与全文件扫描的耗时对比，以及导出吞吐量"""
+    rng = random.Random(11)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for lines in sizes:
+            path = os.path.join(tmp_dir, 'adsb_decoded.log')
+            start_time = time.mktime((2025, 6, 26, 0, 0, 0, 0, 0, -1))
+            rate = 50  # 每秒50条
+            with open(path, 'w', encoding='utf-8') as f:
+                for k in range(lines):
+                    t = start_time + k / rate
+                    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
+                    f.write(f"{stamp},{rng.randrange(aircraft_count):06X},"
+                            f"{rng.uniform(39, 41):.6f},{rng.uniform(115, 118):.6f},"
+                            f"{rng.randrange(1000, 40000, 25)},-2220347.6,4302645.1,4139749.3,"
+                            f"{rng.uniform(-1e5, 1e5):.1f},{rng.uniform(-1e5, 1e5):.1f},-9925.8\n")
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            index = LogIndex([path])
+            begin = time.perf_counter()
+            index.refresh()
+            build_time = time.perf_counter() - begin
+
+            middle = start_time + lines / rate / 2
+            icao = f"{7:06X}"
+            begin = time.perf_counter()
+            track, _ = index.track(icao, middle, middle + 60)
+            track_time = time.perf_counter() - begin
+            begin = time.perf_counter()
+            snapshot = index.snapshot(middle, window=30)
+            snapshot_time = time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            parse_time = LogTimeParser()
+            scanned = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    record = parse_record(line.rstrip(b'\n'), parse_time)
+                    if record and record[1] == icao and middle <= record[0] <= middle + 60:
+                        scanned += 1
+            scan_time = time.perf_counter() - begin
+            assert scanned == len(track['time'])
+
+            print(f"{lines} 行 ({size_mb:.0f} MB): 建立索引 {build_time:.2f} s, {index.stats()['blocks']} 块")
+            print(f"  航迹(60秒, {len(track['time'])} 点): {track_time * 1000:.2f} ms, "
+                  f"全文件扫描 {scan_time * 1000:.0f} ms")
+            print(f"  快照(30秒窗口, {len(snapshot)} 架): {snapshot_time * 1000:.2f} ms")
+            for fmt in EXPORT_FORMATS:
+                begin = time.perf_counter()
+                exported = sum(len(chunk) for chunk in export_records(index, float('-inf'), float('inf'),
+                                                                      fmt=fmt))
+                export_time = time.perf_counter() - begin
+                print(f"  全量导出{fmt}: {exported / 1024 / 1024:.0f} MB, "
+                      f"{exported / 1024 / 1024 / export_time:.0f} MB/s")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    benchmark_log_index()
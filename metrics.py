@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+进程内指标（计数器、仪表、固定分桶直方图）
+热路径上每次更新只做一次加法（直方图再加一次二分查找），导出时才生成
+Prometheus文本格式（text exposition format 0.0.4），由/metrics返回
+
+指标默认只由一个线程写入（采集线程、nav.py主循环），更新不加锁；
+多个线程同时写入的指标（如HTTP请求）注册时指定threadsafe=True
+"""
+
+import bisect
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 默认的耗时分桶（秒）：100微秒到5秒
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_value(value: float) -> str:
+    """数值的文本格式（整数不带小数点，无穷大为+Inf）"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """标签的文本格式：{name="value",...}（值中的反斜杠、引号和换行需转义）"""
+    if not names:
+        return ''
+    items = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        items.append(f'{name}="{value}"')
+    return '{' + ','.join(items) + '}'
+
+
+class Metric:
+    """指标基类：无标签时直接更新本对象，有标签时通过labels()取得子指标"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # 保护子指标的创建（以及加锁变体的更新）
+        self._children: Dict[tuple, 'Metric'] = {}
+
+    def labels(self, *values) -> 'Metric':
+        """取得（必要时创建）标签值对应的子指标；热路径应预先取得并保存子指标"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self) -> 'Metric':
+        return type(self)(self.name, self.help)
+
+    def _samples(self, labels: str) -> list:
+        """(后缀, 标签文本, 值)列表"""
+        raise NotImplementedError
+
+    def collect(self) -> list:
+        """本指标的全部文本行"""
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        if self.labelnames:
+            for key, child in sorted(self._children.items()):
+                labels = format_labels(self.labelnames, key)
+                lines.extend(f'{self.name}{suffix}{text} {format_value(value)}'
+                             for suffix, text, value in child._samples(labels))
+        else:
+            lines.extend(f'{self.name}{suffix}{text} {format_value(value)}'
+                         for suffix, text, value in self._samples(''))
+        return lines
+
+
+class Counter(Metric):
+    """单调递增计数器；set_function设置后导出时调用函数取值（计数由其他对象维护时）"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.value = 0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def _samples(self, labels: str) -> list:
+        if self.function is not None:
+            try:
+                return [('', labels, self.function())]
+            except Exception:
+                return []  # 取值失败时不导出（如对象已关闭）
+        return [('', labels, self.value)]
+
+
+class LockedCounter(Counter):
+    """多线程写入的计数器"""
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge(Metric):
+    """可增可减的仪表；set_function设置后导出时调用函数取值（如缓存大小）"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.value = 0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount  # 仪表不在热路径上，总是加锁
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def _samples(self, labels: str) -> list:
+        if self.function is not None:
+            try:
+                return [('', labels, self.function())]
+            except Exception:
+                return []  # 取值失败时不导出（如对象已关闭）
+        return [('', labels, self.value)]
+
+
+class Histogram(Metric):
+    """固定分桶直方图：observe时二分查找所在的桶，导出时再累加为累计计数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为+Inf
+        self.sum = 0.0
+
+    def _new_child(self) -> 'Histogram':
+        return type(self)(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        """记录with块的耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """按桶估计分位数（桶内线性插值，落在+Inf桶时返回最大的有限边界）"""
+        with self._lock:
+            counts = list(self.counts)
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def _samples(self, labels: str) -> list:
+        with self._lock:
+            counts = list(self.counts)
+            total_sum = self.sum
+        inner = labels[1:-1] + ',' if labels else ''
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            samples.append(('_bucket', f'{{{inner}le="{format_value(float(bound))}"}}', cumulative))
+        samples.append(('_sum', labels, total_sum))
+        samples.append(('_count', labels, cumulative))
+        return samples
+
+
+class LockedHistogram(Histogram):
+    """多线程写入的直方图"""
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标只创建一次，各模块在导入时声明自己的指标"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+
+    def _get_or_create(self, cls, name: str, help_text: str, labelnames, **kwargs) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, tuple(labelnames), **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"指标 {name} 已以不同类型或标签注册")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                threadsafe: bool = False) -> Counter:
+        return self._get_or_create(LockedCounter if threadsafe else Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS, threadsafe: bool = False) -> Histogram:
+        return self._get_or_create(LockedHistogram if threadsafe else Histogram, name, help_text,
+                                   labelnames, buckets=buckets)
+
+    def exposition(self) -> str:
+        """全部指标的文本格式"""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内默认注册表
+REGISTRY = MetricsRegistry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """只提供/metrics的处理器（用于nav.py等没有Web服务的进程）"""
+
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = '127.0.0.1', registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """在后台线程提供 http://host:port/metrics"""
+    handler = type('RegistryMetricsHandler', (MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+@contextmanager
+def disabled():
+    """临时把所有指标的更新替换为空操作（只用于测量埋点开销）"""
+    patched = [(Counter, 'inc'), (LockedCounter, 'inc'), (Gauge, 'inc'), (Gauge, 'set'),
+               (Histogram, 'observe'), (LockedHistogram, 'observe')]
+    originals = [(cls, name, cls.__dict__[name]) for cls, name in patched]
+    for cls, name in patched:
+        setattr(cls, name, lambda self, value=1: None)
+    try:
+        yield
+    finally:
+        for cls, name, original in originals:
+            setattr(cls, name, original)
+
+
+# 开销测试的帧组合：短帧（DF11、DF4，不进入解码器）、识别和速度报文、
+# 同一架飞机的偶/奇位置报文
+SAMPLE_FRAMES = ('*5D4840D6202CC3;', '*20000F1F684A6C;', '*8D4840D6202CC371C32CE0576098;',
+                 '*8D485020994409940838175B284F;', '*8D40621D58C382D690C8AC2863A7;',
+                 '*8D40621D58C386435CC412692AD6;')
+
+
+def benchmark_overhead(frames: int = 3000, rounds: int = 60):
+    """测量nav.py处理链路（解码、CPR配对、写日志、状态更新）的埋点开销
+
+    有埋点和埋点替换为空操作的版本成对交替运行，取各对耗时比的中位数（空操作
+    版本仍保留取时间戳和抽样判断，结果略低估开销；另外输出单次操作的耗时供估算）
+    """
+    import metrics  # 作为脚本运行时本模块是__main__，nav.py使用的是metrics模块中的类
+    from nav import NavigationSystem
+
+    print(f"埋点开销测试: {frames} 帧 x {rounds} 对")
+    with tempfile.TemporaryDirectory() as log_dir:
+        system = NavigationSystem(verbose=False)
+        system.logger.log_dir = log_dir
+        system.logger.initialize()
+        lines = [SAMPLE_FRAMES[k % len(SAMPLE_FRAMES)] for k in range(frames)]
+
+        def run() -> float:
+            start = time.perf_counter()
+            for line in lines:
+                system.process_line(line)
+            return time.perf_counter() - start
+
+        def run_disabled() -> float:
+            with metrics.disabled():
+                return run()
+
+        run()  # 预热
+        ratios = []
+        enabled_total = disabled_total = 0.0
+        for k in range(rounds):
+            order = (run, run_disabled) if k % 2 == 0 else (run_disabled, run)
+            first, second = order[0](), order[1]()
+            enabled, baseline = (first, second) if k % 2 == 0 else (second, first)
+            ratios.append(enabled / baseline)
+            enabled_total += enabled
+            disabled_total += baseline
+        system.logger.close()
+
+    ratios.sort()
+    count = frames * rounds
+    print(f"无埋点: {disabled_total / count * 1e6:.2f} us/帧, 有埋点: {enabled_total / count * 1e6:.2f} us/帧, "
+          f"开销中位数 {(ratios[len(ratios) // 2] - 1) * 100:+.2f}% "
+          f"(四分位 {(ratios[len(ratios) // 4] - 1) * 100:+.2f}% ~ {(ratios[len(ratios) * 3 // 4] - 1) * 100:+.2f}%)")
+
+    # 单次操作的耗时（含取时间戳）
+    counter = metrics.Counter('bench_total', '')
+    histogram = metrics.Histogram('bench_seconds', '')
+    n = 200000
+    start = time.perf_counter()
+    for _ in range(n):
+        counter.inc()
+    inc_ns = (time.perf_counter() - start) / n * 1e9
+    start = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        histogram.observe(time.perf_counter() - t)
+    observe_ns = (time.perf_counter() - start) / n * 1e9
+    print(f"计数器inc: {inc_ns:.0f} ns, 计时+直方图observe: {observe_ns:.0f} ns")
+    print(f"导出 {len(metrics.REGISTRY.metrics)} 个指标: {len(metrics.REGISTRY.exposition())} 字节")
+
+
+if __name__ == '__main__':
+    benchmark_overhead()
@@ -1,114 +1,909 @@
 #!/usr/bin/env python3
 
+import argparse
+import asyncio
+import hashlib
+import http.client
+import io
 import json
-import os
-from datetime import datetime
-from http.server import HTTPServer, BaseHTTPRequestHandler
-
-class MinimalHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/api/aircraft/':
-            # 读取数据文件
-            aircraft_data = {}
-            try:
-                if os.path.exists('adsb_decoded.log'):
-                    with open('adsb_decoded.log', 'r', encoding='utf-8') as f:
-                        lines = f.readlines()
-                        current_time = datetime.now()
-                        
-                        for line in lines[-100:]:  # 只处理最后100行
-                            try:
-                                parts = line.strip().split(',')
-                                if len(parts) >= 5:
-                                    timestamp_str = parts[0]
-                                    icao = parts[1]
-                                    lat = float(parts[2])
-                                    lon = float(parts[3])
-                                    alt = int(parts[4])
-
-                                    # 解析额外的坐标信息
-                                    ecef_x = ecef_y = ecef_z = None
-                                    enu_e = enu_n = enu_u = None
-
-                                    if len(parts) >= 8:  # ECEF坐标
-                                        try:
-                                            ecef_x = float(parts[5])
-                                            ecef_y = float(parts[6])
-                                            ecef_z = float(parts[7])
-                                        except:
-                                            pass
-
-                                    if len(parts) >= 11:  # ENU坐标
-                                        try:
-                                            enu_e = float(parts[8])
-                                            enu_n = float(parts[9])
-                                            enu_u = float(parts[10])
-                                        except:
-                                            pass
-
-                                    timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                                    time_diff = (current_time - timestamp).total_seconds()
-
-                                    if time_diff <= 86400:  # 24小时内
-                                        aircraft_data[icao] = {
-                                            'icao': icao,
-                                            'lat': lat,
-                                            'lon': lon,
-                                            'alt': alt,
-                                            'timestamp': timestamp_str,
-                                            'time_diff': time_diff,
-                                            'ecef_x': ecef_x,
-                                            'ecef_y': ecef_y,
-                                            'ecef_z': ecef_z,
-                                            'enu_e': enu_e,
-                                            'enu_n': enu_n,
-                                            'enu_u': enu_u
-                                        }
-                            except:
-                                continue
-            except Exception as e:
-                pass
-            
-            # 返回JSON响应
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            response = {
-                'status': 'success',
-                'count': len(aircraft_data),
-                'aircraft': list(aircraft_data.values())
-            }
-            
-            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-            
-        elif self.path == '/api/statistics/':
-            # 统计信息
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            response = {
-                'status': 'success',
-                'total_aircraft': 0,
-                'altitude_distribution': {
-                    'low': 0,
-                    'medium': 0,
-                    'high': 0
-                }
-            }
-            
-            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-            
+import math
+import re
+import time
+from typing import Optional
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from aircraft_store import AIRCRAFT_FIELDS, AircraftStore, states_binary, states_json
+from kalman_tracker import predicted_lla
+from live_state import LiveAircraftState, LogIngester
+from log_index import EXPORT_FORMATS, LogIndex, LogIndexer, export_records, parse_time_value
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY
+from response_compression import ResponseCompressor, negotiate_encoding, precompress
+from sampling_profiler import (SamplingProfiler, checkpoint, cprofile_status, install_signal_handlers,
+                               start_cprofile)
+from single_flight import SingleFlightCache
+from track_simplifier import douglas_peucker
+
+
+# 服务端实时状态（由后台采集线程更新，请求只读取内存中的状态）
+live_state = LiveAircraftState()
+
+# 动态响应压缩（级别和阈值可由命令行配置）
+compressor = ResponseCompressor()
+
+# 版本化API的单飞响应缓存：同一版本的并发请求只构建一次，结果在TTL（秒）内复用
+response_cache: Optional[SingleFlightCache] = SingleFlightCache(ttl=1.0)
+
+# 解码日志的时间/ICAO索引（历史航迹和时刻快照），--no-log-index时为None
+log_index: Optional[LogIndex] = None
+
+# 运行时采样分析器（--profiler时启用 /admin/profile 和SIGUSR1/SIGUSR2），未启用时为None
+profiler: Optional[SamplingProfiler] = None
+
+# HTTP指标（多个请求线程同时写入）；接口标签只取已知路径，避免标签数量无限增长
+HTTP_REQUESTS = REGISTRY.counter('adsb_http_requests_total', 'HTTP请求数（按接口和状态码）',
+                                 ('endpoint', 'status'), threadsafe=True)
+HTTP_SECONDS = REGISTRY.histogram('adsb_http_request_seconds',
+                                  'HTTP请求耗时（从读完请求头到响应写完，不含SSE推送）',
+                                  ('endpoint',), threadsafe=True)
+
+# 服务状态的指标：导出时读取
+REGISTRY.gauge('adsb_live_aircraft', '实时状态中的飞机数').set_function(lambda: len(live_state.store))
+REGISTRY.gauge('adsb_ingest_age_seconds', '距最近一次采集的时间').set_function(
+    lambda: time.time() - live_state.last_ingest)
+REGISTRY.gauge('adsb_response_cache_entries', '单飞缓存的条目数').set_function(
+    lambda: len(response_cache.entries))
+_cache_events = REGISTRY.counter('adsb_response_cache_events_total', '单飞缓存的命中、合并和构建次数',
+                                 ('event',))
+for _event in ('hits', 'joins', 'builds'):
+    _cache_events.labels(_event).set_function(lambda event=_event: getattr(response_cache, event))
+REGISTRY.gauge('adsb_log_index_records', '日志索引的记录数').set_function(
+    lambda: log_index.stats()['records'])
+
+# 历史航迹默认最多返回的点数、时刻快照默认回溯的时间（秒）
+HISTORY_TRACK_LIMIT = 100000
+SNAPSHOT_WINDOW = 300.0
+
+# 超过该时间（秒）未更新的飞机不做外推
+PREDICT_HORIZON = 60
+
+# /api/aircraft/<icao>/track
+TRACK_PATH = re.compile(r'^/api/aircraft/([^/]+)/track/?$')
+SNAPSHOT_PATHS = ('/api/snapshot', '/api/snapshot/')
+EXPORT_PATHS = ('/api/export', '/api/export/')
+PROFILE_PATH = '/admin/profile'
+
+# /api/aircraft/ 的二进制格式（?format=bin或Accept: application/octet-stream）
+BINARY_CONTENT_TYPE = 'application/octet-stream'
+
+# 作为指标标签的路径
+METRIC_ENDPOINTS = {'/', '/metrics', PROFILE_PATH, '/api/aircraft/', '/api/conflicts/', '/api/statistics/',
+                    '/api/stream/', *SNAPSHOT_PATHS, *EXPORT_PATHS}
+
+# 导出格式对应的Content-Type
+EXPORT_CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+
+# SSE推送：合并窗口（秒）、心跳间隔（秒）、浏览器断线重连间隔（毫秒）
+STREAM_COALESCE = 1.0
+STREAM_HEARTBEAT = 15.0
+STREAM_RETRY_MS = 3000
+
+# ?coalesce=和?heartbeat=的取值范围（秒）：心跳过短时推送线程会空转
+STREAM_MAX_COALESCE = 60.0
+STREAM_MIN_HEARTBEAT = 0.1
+STREAM_MAX_HEARTBEAT = 300.0
+
+
+class Response:
+    """HTTP响应（三种服务模式共用）"""
+
+    def __init__(self, status: int = 200, body: bytes = b'',
+                 content_type: str = 'application/json', headers: list = None,
+                 stream=None, precompressed: dict = None, chunks=None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or []
+        self.stream = stream  # 流式响应（AircraftEventStream），不为None时忽略body
+        self.precompressed = precompressed  # 预压缩的响应体 {编码: 字节}
+        self.chunks = chunks  # 分块传输的响应体（字节串迭代器），不为None时忽略body
+        self.encoded = False  # 是否已经过compress_response处理
+
+    def copy(self) -> 'Response':
+        """复制响应（缓存的响应每次发送前复制，避免共享headers列表）"""
+        response = Response(self.status, self.body, self.content_type, list(self.headers),
+                            self.stream, self.precompressed, self.chunks)
+        response.encoded = self.encoded
+        return response
+
+
+def json_response(payload: dict, status: int = 200) -> Response:
+    """构造JSON响应"""
+    return Response(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                    'application/json', [('Access-Control-Allow-Origin', '*')])
+
+
+def json_response_with_raw(payload: dict, key: str, raw: bytes, status: int = 200) -> Response:
+    """构造JSON响应，key对应的值为已序列化的JSON字节，直接拼接而不重新编码"""
+    head = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    separator = b', ' if payload else b''
+    body = head[:-1] + separator + json.dumps(key).encode('utf-8') + b': ' + raw + b'}'
+    return Response(status, body, 'application/json', [('Access-Control-Allow-Origin', '*')])
+
+
+def parse_float_list(value: str, count: int) -> list:
+    """解析逗号分隔的浮点数参数（inf/nan无法映射到网格索引，视为无效参数）"""
+    values = [float(v) for v in value.split(',')]
+    if len(values) != count:
+        raise ValueError(f"需要{count}个数值: {value}")
+    if not all(math.isfinite(v) for v in values):
+        raise ValueError(f"参数必须是有限数值: {value}")
+    return values
+
+
+def parse_radius(value: str) -> list:
+    """解析radius=lat,lon,km，半径必须为正数"""
+    lat, lon, radius_km = parse_float_list(value, 3)
+    if radius_km <= 0:
+        raise ValueError(f"半径必须为正数: {value}")
+    return [lat, lon, radius_km]
+
+
+def positive_float(value: str, name: str) -> float:
+    """解析必须为有限正数的参数（如抽稀容差）"""
+    number = float(value)
+    if not math.isfinite(number) or number <= 0:
+        raise ValueError(f"{name}必须是有限正数: {value}")
+    return number
+
+
+def optional_float(query: dict, name: str) -> Optional[float]:
+    """读取可选的浮点数参数（必须是有限数值）"""
+    if name not in query:
+        return None
+    value = float(query[name][0])
+    if not math.isfinite(value):
+        raise ValueError(f"{name}必须是有限数值: {query[name][0]}")
+    return value
+
+
+def parse_active_within(query: dict, default: Optional[float] = None) -> Optional[float]:
+    """读取?active_within=<秒>（不能为负数），未指定时返回default"""
+    active_within = optional_float(query, 'active_within')
+    if active_within is None:
+        return default
+    if active_within < 0:
+        raise ValueError(f"active_within不能为负数: {active_within}")
+    return active_within
+
+
+def active_cutoff(query: dict, now: float) -> Optional[float]:
+    """?active_within=<秒> 对应的最早更新时间，未指定时返回None"""
+    active_within = parse_active_within(query)
+    return None if active_within is None else now - active_within
+
+
+def query_aircraft(store: AircraftStore, query: dict, now: float) -> list:
+    """按查询参数筛选飞机（使用空间和高度索引，只返回状态对象，不做序列化）
+
+    支持的参数：
+        bbox=lat_min,lon_min,lat_max,lon_max  经纬度矩形
+        radius=lat,lon,km                     圆形范围（水平距离）
+        alt_min=/alt_max=                     高度范围（英尺，闭区间）
+        active_within=<秒>                    只返回该时间内有更新的飞机
+    """
+    alt_min = optional_float(query, 'alt_min')
+    alt_max = optional_float(query, 'alt_max')
+    if 'bbox' in query:
+        lat_min, lon_min, lat_max, lon_max = parse_float_list(query['bbox'][0], 4)
+        states = store.query_bbox(lat_min, lon_min, lat_max, lon_max, alt_min, alt_max)
+    elif 'radius' in query:
+        lat, lon, radius_km = parse_radius(query['radius'][0])
+        states = store.query_radius(lat, lon, radius_km, alt_min, alt_max)
+    elif alt_min is not None or alt_max is not None:
+        states = store.query_altitude(alt_min, alt_max)
+    else:
+        states = list(store.values())
+
+    cutoff = active_cutoff(query, now)
+    if cutoff is not None:
+        states = [state for state in states if state.time >= cutoff]
+    return states
+
+
+def aircraft_matcher(store: AircraftStore, query: dict, now: float):
+    """返回与query_aircraft筛选条件一致的逐架判断函数，没有筛选条件时返回None
+
+    用于增量响应：只检查有变化的飞机，不做全量查询
+    """
+    predicates = []
+    if 'bbox' in query:
+        lat_min, lon_min, lat_max, lon_max = parse_float_list(query['bbox'][0], 4)
+        predicates.append(lambda state: lat_min <= state.lat <= lat_max and lon_min <= state.lon <= lon_max)
+    elif 'radius' in query:
+        lat, lon, radius_km = parse_radius(query['radius'][0])
+        center_e, center_n, _ = store.converter.lla_to_enu(lat, lon, 0.0)
+        radius_sq = (radius_km * 1000.0) ** 2
+        predicates.append(lambda state: (state.enu_e - center_e) ** 2 +
+                          (state.enu_n - center_n) ** 2 <= radius_sq)
+    alt_min = optional_float(query, 'alt_min')
+    alt_max = optional_float(query, 'alt_max')
+    if alt_min is not None:
+        predicates.append(lambda state: state.alt >= alt_min)
+    if alt_max is not None:
+        predicates.append(lambda state: state.alt <= alt_max)
+    cutoff = active_cutoff(query, now)
+    if cutoff is not None:
+        predicates.append(lambda state: state.time >= cutoff)
+
+    if not predicates:
+        return None
+    return lambda state: all(predicate(state) for predicate in predicates)
+
+
+# 推算（?predict）时额外输出的字段
+PREDICTION_FIELDS = ('vel_e', 'vel_n', 'vel_u', 'predicted')
+
+
+def parse_fields(query: dict) -> Optional[tuple]:
+    """解析?fields=icao,lat,lon,alt 字段投影，icao总是输出（用于合并增量）"""
+    if 'fields' not in query:
+        return None
+    fields = ['icao']
+    for name in query['fields'][0].split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in AIRCRAFT_FIELDS and name not in PREDICTION_FIELDS:
+            raise ValueError(f"未知字段: {name}")
+        fields.append(name)
+    return tuple(fields)
+
+
+def paginate(states: list, query: dict):
+    """?limit=N&offset=M 分页（按ICAO排序保证翻页稳定），返回(当前页, 分页信息或None)"""
+    if 'limit' not in query and 'offset' not in query:
+        return states, None
+    offset = int(query.get('offset', [0])[0])
+    limit = int(query['limit'][0]) if 'limit' in query else len(states)
+    if offset < 0 or limit < 0:
+        raise ValueError('limit和offset不能为负数')
+    states = sorted(states, key=lambda state: state.icao)
+    end = offset + limit
+    page = {'total': len(states), 'offset': offset, 'limit': limit,
+            'next_offset': end if end < len(states) else None}
+    return states[offset:end], page
+
+
+def parse_predict_time(query: dict, now: float):
+    """解析?predict=now|<Unix时间>，未指定时返回None"""
+    if 'predict' not in query:
+        return None
+    value = query['predict'][0]
+    if value in ('', 'now', '1'):
+        return now
+    at = float(value)
+    if not math.isfinite(at):
+        raise ValueError(f"predict必须是有限数值: {value}")
+    return at
+
+
+def apply_predictions(aircraft: list, states: list, at: float, fields: Optional[tuple] = None):
+    """用卡尔曼滤波推算的位置和速度替换输出中的位置（仅限近期有更新的飞机）"""
+    tracker = live_state.tracker
+    for item, state in zip(aircraft, states):
+        last = tracker.last_update(state.icao)
+        # 只在最近一次更新之后PREDICT_HORIZON秒内向前外推，早于最近更新的时刻输出当前状态
+        if last is None or not 0 <= at - last <= PREDICT_HORIZON:
+            continue
+        predicted = predicted_lla(tracker, live_state.store.converter, state.icao, at)
+        predicted['predicted'] = True
+        if fields is None:
+            item.update(predicted)
+        else:
+            item.update((name, predicted[name]) for name in fields if name in predicted)
+
+
+def query_delta(query: dict, since: int, now: float):
+    """计算版本since之后的增量：有变化且符合筛选条件的飞机，以及被移除或移出筛选范围的飞机
+
+    调用方需持有live_state.lock
+    """
+    store = live_state.store
+    matches = aircraft_matcher(store, query, now)
+    aircraft_list = []
+    removed = live_state.removed_since(since)
+    for icao in live_state.changes_since(since):
+        state = store.get(icao)
+        if matches is None or matches(state):
+            aircraft_list.append(state)
+        else:
+            removed.append(icao)
+    return aircraft_list, removed
+
+
+def api_aircraft(query: dict) -> Response:
+    """/api/aircraft/ 飞机列表（只读取内存中的实时状态）
+
+    ?since=<版本号> 只返回该版本之后有变化的飞机和被移除的飞机（removed）；
+    版本号过旧或来自重启前的服务时返回全量（full为true）。
+    ?fields=、alt_min/alt_max、active_within、limit/offset见query_aircraft、parse_fields和paginate，
+    筛选和分页在序列化之前完成；不做投影和推算时直接拼接每架飞机缓存的JSON片段。
+    ?format=bin 返回定长小端记录的二进制格式（见aircraft_store.BINARY_HEADER），不支持fields和predict
+    """
+    current_time = time.time()
+    predict_at = parse_predict_time(query, current_time)
+    since = int(query['since'][0]) if 'since' in query else None
+    fields = parse_fields(query)
+    fmt = query.get('format', ['json'])[0]
+    if fmt not in ('json', 'bin'):
+        raise ValueError(f"不支持的格式: {fmt}")
+    if fmt == 'bin' and (fields is not None or predict_at is not None):
+        raise ValueError('二进制格式不支持fields和predict')
+    removed = None
+    with live_state.lock:
+        version = live_state.version
+        if since is not None and live_state.delta_available(since):
+            aircraft_list, removed = query_delta(query, since, current_time)
         else:
-            # 返回HTML页面
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            
-            html = '''<!DOCTYPE html>
+            aircraft_list = query_aircraft(live_state.store, query, current_time)
+        aircraft_list, page = paginate(aircraft_list, query)
+        if fmt == 'bin':
+            body = states_binary(aircraft_list, current_time, version,
+                                 page['total'] if page is not None else None, removed,
+                                 full=removed is None)
+            return Response(200, body, BINARY_CONTENT_TYPE,
+                            [('Access-Control-Allow-Origin', '*'), ('Vary', 'Accept')])
+        if fields is None and predict_at is None:
+            aircraft = None
+            aircraft_json = states_json(aircraft_list, current_time)
+        else:
+            state_fields = fields and tuple(name for name in fields if name in AIRCRAFT_FIELDS)
+            aircraft = [state.to_dict(current_time, state_fields) for state in aircraft_list]
+            if predict_at is not None:
+                apply_predictions(aircraft, aircraft_list, predict_at, fields)
+
+    response = {
+        'status': 'success',
+        'version': version,
+        'count': len(aircraft_list),
+    }
+    if page is not None:
+        response.update(page)
+    if since is not None:
+        response['full'] = removed is None
+        response['removed'] = removed or []
+    if aircraft is None:
+        result = json_response_with_raw(response, 'aircraft', aircraft_json)
+    else:
+        response['aircraft'] = aircraft
+        result = json_response(response)
+    result.headers.append(('Vary', 'Accept'))  # Accept可选择二进制格式
+    return result
+
+
+def simplify_track(points: dict, query: dict) -> dict:
+    """?simplify=<米>[&simplify_ft=<英尺>] 用Douglas-Peucker抽稀航迹（缺少ENU坐标的点不抽稀）"""
+    if 'simplify' not in query:
+        return points
+    tolerance_m = positive_float(query['simplify'][0], 'simplify')
+    tolerance_ft = positive_float(query.get('simplify_ft', ['100'])[0], 'simplify_ft')
+    if None in points['enu_e']:
+        return points
+    kept = douglas_peucker(points['enu_e'], points['enu_n'], points['alt'],
+                           tolerance_m, tolerance_ft)
+    return {name: [values[i] for i in kept] for name, values in points.items()}
+
+
+def history_unavailable() -> Response:
+    return json_response({'status': 'error', 'message': '日志索引未启用'}, 503)
+
+
+def api_track(icao: str, query: dict) -> Response:
+    """/api/aircraft/<icao>/track 单架飞机的航迹
+
+    ?since=<Unix时间> 只返回该时间之后的点，?last=N 只返回最后N个点，
+    ?simplify=<米>[&simplify_ft=<英尺>] 用Douglas-Peucker抽稀；
+    带from/to时从日志索引查询历史航迹（见api_track_history）
+    """
+    icao = icao.upper()
+    if 'from' in query or 'to' in query:
+        return api_track_history(icao, query)
+    since = float(query['since'][0]) if 'since' in query else None
+    last_n = int(query['last'][0]) if 'last' in query else None
+
+    with live_state.lock:
+        track = live_state.tracks.get(icao)
+        points = track.slice(since=since, last_n=last_n) if track is not None else None
+    if points is None:
+        return json_response({'status': 'error', 'message': f'未找到飞机 {icao}'}, 404)
+
+    points = simplify_track(points, query)
+    return json_response({
+        'status': 'success',
+        'icao': icao,
+        'count': len(points['time']),
+        'track': points
+    })
+
+
+def parse_time_range(query: dict) -> tuple:
+    """解析?from=&to=：Unix时间、'YYYY-MM-DD HH:MM:SS'或相对日志最新时间的负秒数（如from=-3600），
+    省略一端表示不限"""
+    latest = log_index.latest_time
+    start = parse_time_value(query['from'][0], latest) if 'from' in query else float('-inf')
+    end = parse_time_value(query['to'][0], latest) if 'to' in query else float('inf')
+    return start, end
+
+
+def api_track_history(icao: str, query: dict) -> Response:
+    """/api/aircraft/<icao>/track?from=&to= 日志中的历史航迹
+
+    时间范围见parse_time_range；?limit=N 最多返回N个点（超出时truncated为true）
+    """
+    if log_index is None:
+        return history_unavailable()
+    start, end = parse_time_range(query)
+    limit = int(query.get('limit', [HISTORY_TRACK_LIMIT])[0])
+
+    points, truncated = log_index.track(icao, start, end, limit)
+    points = simplify_track(points, query)
+    response = {
+        'status': 'success',
+        'icao': icao,
+        'from': start if start != float('-inf') else None,
+        'to': end if end != float('inf') else None,
+        'count': len(points['time']),
+        'truncated': truncated,
+        'track': points
+    }
+    return json_response(response)
+
+
+def api_snapshot(query: dict) -> Response:
+    """/api/snapshot?at=<时间> 日志中某一时刻每架飞机的最后已知位置
+
+    at的格式同历史航迹的from/to；?window=<秒> 只考虑at之前这段时间内的记录（默认300）
+    """
+    if log_index is None:
+        return history_unavailable()
+    if 'at' not in query:
+        raise ValueError('缺少参数 at')
+    at = parse_time_value(query['at'][0], log_index.latest_time)
+    window = float(query.get('window', [SNAPSHOT_WINDOW])[0])
+    aircraft = log_index.snapshot(at, window)
+    return json_response({
+        'status': 'success',
+        'at': at,
+        'window': window,
+        'count': len(aircraft),
+        'aircraft': aircraft
+    })
+
+
+def api_conflicts(query: dict) -> Response:
+    """/api/conflicts/ 间隔冲突检测：水平间隔 < lateral_nm 且垂直间隔 < vertical_ft
+
+    只考虑active_within秒内有更新的飞机（默认60），长时间没有更新的飞机不参与配对
+    """
+    detector = live_state.conflicts
+    lateral_nm = float(query.get('lateral_nm', [detector.lateral_nm])[0])
+    vertical_ft = float(query.get('vertical_ft', [detector.vertical_ft])[0])
+    k = int(query.get('k', [5])[0])
+    active_within = parse_active_within(query, detector.active_within)
+    active_since = time.time() - active_within
+
+    with live_state.lock:
+        detector.maybe_rebuild(live_state.store.values, live_state.version)
+        conflicts = detector.find_conflicts(lateral_nm, vertical_ft, active_since)
+        neighbors = detector.nearest_neighbors(query['icao'][0].upper(), k, active_since) \
+            if 'icao' in query else None
+
+    response = {
+        'status': 'success',
+        'lateral_nm': lateral_nm,
+        'vertical_ft': vertical_ft,
+        'active_within': active_within,
+        'count': len(conflicts),
+        'conflicts': conflicts
+    }
+    if neighbors is not None:
+        # k近邻查询
+        response['neighbors'] = neighbors
+    return json_response(response)
+
+
+def api_statistics(query: dict) -> Response:
+    """/api/statistics/ 统计信息（采集时增量维护，请求只读取计数）
+
+    ?top=N 附带消息数最多的N架飞机，?icao=<ICAO> 附带该飞机的消息数
+    """
+    top = int(query.get('top', [0])[0])
+    stats = live_state.stats
+    response = {'status': 'success'}
+    with live_state.lock:
+        response.update(stats.summary())
+        if top > 0:
+            response['top_aircraft'] = stats.top_aircraft(top)
+        if 'icao' in query:
+            icao = query['icao'][0].upper()
+            response['message_counts'] = {icao: stats.message_count(icao)}
+    response['latency'] = live_state.latency.summary()
+    response['compression'] = compressor.stats.snapshot()
+    if response_cache is not None:
+        response['response_cache'] = response_cache.stats()
+    if log_index is not None:
+        response['log_index'] = log_index.stats()
+    return json_response(response)
+
+
+def api_export(query: dict) -> Response:
+    """/api/export?from=&to=&icao=&format=ndjson|csv 流式导出日志记录
+
+    直接从日志分段逐批读取并分块传输，不在内存中生成完整结果；时间范围见parse_time_range
+    """
+    if log_index is None:
+        return history_unavailable()
+    fmt = query.get('format', ['ndjson'])[0]
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    start, end = parse_time_range(query)
+    icao = query['icao'][0].upper() if 'icao' in query else None
+    return Response(200, content_type=EXPORT_CONTENT_TYPES[fmt],
+                    headers=[('Content-Disposition', f'attachment; filename="adsb_export.{fmt}"'),
+                             ('Cache-Control', 'no-store')],
+                    chunks=export_records(log_index, start, end, icao, fmt))
+
+
+class AircraftEventStream:
+    """/api/stream/ 的SSE事件生成器
+
+    连接建立时先推送一次全量快照（event: snapshot），之后每个合并窗口内
+    把有变化的飞机各推送一次最新状态，连同被移除的飞机（event: aircraft）；
+    长时间没有数据时发送心跳注释行，避免代理和浏览器断开空闲连接。
+    poll()不阻塞，等待方式由线程模式和asyncio模式各自实现。
+    """
+
+    def __init__(self, state: LiveAircraftState, coalesce: float = 1.0,
+                 heartbeat: float = 15.0):
+        self.state = state
+        self.coalesce = coalesce    # 合并窗口：窗口内同一架飞机的多次更新只推送最新一次
+        self.heartbeat = heartbeat  # 心跳间隔
+        self.version = 0            # 已推送到的状态版本
+        self.last_data = 0.0        # 最近一次推送数据的时间（time.monotonic）
+        self.last_write = 0.0       # 最近一次写出任何内容的时间
+
+    @staticmethod
+    def format_event(event: str, payload: dict, aircraft_json: bytes) -> bytes:
+        """编码一条SSE事件，aircraft为已拼接的飞机JSON数组"""
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        return (f"event: {event}\ndata: ".encode('ascii') + data[:-1] +
+                b', "aircraft": ' + aircraft_json + b'}\n\n')
+
+    def snapshot(self) -> bytes:
+        """连接建立时的重连间隔和全量快照"""
+        now = time.time()
+        with self.state.lock:
+            self.version = self.state.version
+            aircraft_json = states_json(self.state.store.values(), now)
+        self.state.latency.record_serve(self.version)
+        self.last_data = self.last_write = time.monotonic()
+        return (f"retry: {STREAM_RETRY_MS}\n\n".encode('ascii') +
+                self.format_event('snapshot', {'version': self.version}, aircraft_json))
+
+    def pending(self) -> bool:
+        """是否有尚未推送的变化"""
+        return self.state.version != self.version
+
+    def timeout(self, now: float) -> float:
+        """距离下一次可能需要写出的时间（秒）"""
+        if self.pending():
+            return max(0.0, self.last_data + self.coalesce - now)
+        return max(0.0, self.last_write + self.heartbeat - now)
+
+    def poll(self, now: float) -> Optional[bytes]:
+        """返回当前需要写出的数据（变化事件或心跳），没有则返回None"""
+        if self.pending() and now - self.last_data >= self.coalesce:
+            wall_time = time.time()
+            with self.state.lock:
+                store = self.state.store
+                changed = self.state.changes_since(self.version)
+                removed = self.state.removed_since(self.version)
+                self.version = self.state.version
+                aircraft_json = states_json([store.get(icao) for icao in changed], wall_time)
+            self.state.latency.record_serve(self.version)
+            self.last_data = self.last_write = now
+            return self.format_event('aircraft', {'version': self.version, 'removed': removed},
+                                     aircraft_json)
+        if now - self.last_write >= self.heartbeat:
+            self.last_write = now
+            return b': heartbeat\n\n'
+        return None
+
+    def __iter__(self):
+        """阻塞式迭代（线程模式）：没有变化时在live_state.changed条件变量上等待"""
+        yield self.snapshot()
+        changed = self.state.changed
+        while True:
+            chunk = self.poll(time.monotonic())
+            if chunk is not None:
+                yield chunk
+                continue
+            wait = self.timeout(time.monotonic())
+            if self.pending():
+                time.sleep(wait)  # 合并窗口未到
+            else:
+                with changed:
+                    if not self.pending():
+                        changed.wait(wait)
+
+
+def api_stream(query: dict) -> Response:
+    """/api/stream/ SSE推送飞机状态变化
+
+    ?coalesce=<秒> 合并窗口（0~60），?heartbeat=<秒> 心跳间隔（0.1~300）
+    """
+    coalesce = float(query.get('coalesce', [STREAM_COALESCE])[0])
+    heartbeat = float(query.get('heartbeat', [STREAM_HEARTBEAT])[0])
+    # 链式比较对nan总为False，nan和inf都会被拒绝
+    if not 0 <= coalesce <= STREAM_MAX_COALESCE:
+        raise ValueError(f"coalesce必须在0到{STREAM_MAX_COALESCE:g}秒之间: {coalesce}")
+    if not STREAM_MIN_HEARTBEAT <= heartbeat <= STREAM_MAX_HEARTBEAT:
+        raise ValueError(f"heartbeat必须在{STREAM_MIN_HEARTBEAT:g}到{STREAM_MAX_HEARTBEAT:g}秒之间: {heartbeat}")
+    return Response(200, content_type='text/event-stream; charset=utf-8',
+                    headers=[('Cache-Control', 'no-cache'),
+                             ('Access-Control-Allow-Origin', '*')],
+                    stream=AircraftEventStream(live_state, coalesce, heartbeat))
+
+
+def endpoint_label(path: str) -> str:
+    """请求路径对应的指标标签"""
+    if path in METRIC_ENDPOINTS:
+        return path
+    if TRACK_PATH.match(path):
+        return '/api/aircraft/{icao}/track'
+    return 'other'
+
+
+def record_request(target: str, response: Response, elapsed: float):
+    """记录一次请求的计数和耗时（推送流的耗时是连接时长，不计入耗时直方图）"""
+    endpoint = endpoint_label(urlsplit(target).path)
+    HTTP_REQUESTS.labels(endpoint, response.status).inc()
+    if response.stream is None:
+        HTTP_SECONDS.labels(endpoint).observe(elapsed)
+
+
+def api_profile(query: dict) -> Response:
+    """/admin/profile?action=status|start|stop|cprofile 控制运行时性能分析
+
+    start可带rate=<次/秒>，stop返回折叠栈文件路径；cprofile采集seconds=<秒>（默认30）
+    """
+    action = query.get('action', ['status'])[0]
+    if action == 'start':
+        if 'rate' in query:
+            rate = float(query['rate'][0])
+            if not 0 < rate <= 1000:
+                raise ValueError('rate需要在0~1000之间')
+            if not profiler.running:
+                profiler.rate = rate
+        profiler.start()
+    elif action == 'stop':
+        profiler.stop()
+    elif action == 'cprofile':
+        seconds = float(query.get('seconds', [30])[0])
+        if not 0 < seconds <= 600:
+            raise ValueError('seconds需要在0~600之间')
+        if start_cprofile(seconds, profiler.output_dir) is None:
+            return json_response({'status': 'error', 'message': 'cProfile采集正在进行'}, 409)
+    elif action != 'status':
+        raise ValueError(f'未知的操作: {action}')
+    return json_response({'status': 'success', 'sampling': profiler.status(), 'cprofile': cprofile_status()})
+
+
+def api_metrics() -> Response:
+    """/metrics 本进程的指标（Prometheus文本格式）"""
+    return Response(200, REGISTRY.exposition().encode('utf-8'), METRICS_CONTENT_TYPE)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match是否与etag匹配（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tag = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == tag:
+            return True
+    return False
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """304响应（没有响应体）"""
+    return Response(304, headers=[('ETag', etag), ('Cache-Control', cache_control)])
+
+
+def build_versioned_response(endpoint, query: dict, etag: str, encoding: Optional[str]) -> Response:
+    """构建版本化API的完整响应（含ETag和压缩），结果可被单飞缓存共享"""
+    response = endpoint(query)
+    if response.status == 200:
+        response.headers += [('ETag', etag), ('Cache-Control', 'no-cache')]
+    return compress_response(response, encoding)
+
+
+def accepts_binary(accept: Optional[str]) -> bool:
+    """Accept头是否明确要求二进制格式（优先于JSON）"""
+    if not accept:
+        return False
+    for item in accept.split(','):
+        media_type = item.split(';')[0].strip().lower()
+        if media_type == BINARY_CONTENT_TYPE:
+            return True
+        if media_type in ('application/json', '*/*'):
+            return False
+    return False
+
+
+def route_versioned_api(path: str):
+    """匹配只随数据版本变化的API，返回处理函数（参数为query），未匹配返回None"""
+    if path == '/api/aircraft/':
+        return api_aircraft
+    track_match = TRACK_PATH.match(path)
+    if track_match:
+        return lambda query: api_track(track_match.group(1), query)
+    if path == '/api/conflicts/':
+        return api_conflicts
+    if path in SNAPSHOT_PATHS:
+        return api_snapshot
+    return None
+
+
+def activity_bucket(path: str, query: dict, now: float) -> Optional[int]:
+    """按活跃时间窗口筛选的请求（?active_within=和冲突检测）所在的时间段，其余请求返回None
+
+    这些结果在数据版本不变时也随时间变化（飞机逐渐移出窗口），ETag和缓存键另含
+    以缓存TTL（至少1秒）为长度的时间段序号，结果最多滞后一个时间段
+    """
+    if 'active_within' not in query and path != '/api/conflicts/':
+        return None
+    bucket = max(response_cache.ttl, 1.0) if response_cache is not None else 1.0
+    return int(now // bucket)
+
+
+def reads_log_index(path: str, query: dict) -> bool:
+    """请求是否读取日志索引（时刻快照和带from/to的历史航迹）
+
+    日志索引由LogIndexer在后台追赶，与实时状态的版本号无关，这些请求的ETag和缓存键
+    还需包含索引的记录数，否则索引追上之前的空结果或部分结果会一直被304复用
+    """
+    if path in SNAPSHOT_PATHS:
+        return True
+    return bool(TRACK_PATH.match(path)) and ('from' in query or 'to' in query)
+
+
+def response_encoding(headers) -> Optional[str]:
+    """协商响应压缩编码（压缩关闭时为None）"""
+    if not compressor.enabled:
+        return None
+    return negotiate_encoding(headers.get('Accept-Encoding'))
+
+
+def compress_response(response: Response, encoding: Optional[str]) -> Response:
+    """按协商的编码压缩响应：静态内容使用预压缩结果，JSON超过阈值时实时压缩"""
+    if response.encoded or response.stream is not None or response.status == 304 or not compressor.enabled:
+        return response
+    response.encoded = True
+    if response.chunks is not None:
+        # 分块响应长度未知，客户端接受压缩时总是流式压缩
+        response.headers.append(('Vary', 'Accept-Encoding'))
+        if encoding is not None:
+            response.chunks = compressor.compress_stream(response.chunks, encoding)
+            response.headers.append(('Content-Encoding', encoding))
+        return response
+    if response.precompressed is None and len(response.body) < compressor.min_size:
+        return response
+
+    response.headers.append(('Vary', 'Accept-Encoding'))
+    if encoding is None:
+        compressor.stats.record_uncompressed()
+        return response
+    if response.precompressed is not None:
+        body = response.precompressed[encoding]
+        compressor.stats.record_static(len(response.body), len(body))
+    else:
+        body = compressor.compress(response.body, encoding)
+    response.body = body
+    response.headers.append(('Content-Encoding', encoding))
+    return response
+
+
+def handle_request(target: str, headers) -> Response:
+    """处理请求并按Accept-Encoding压缩响应（threaded/single/asyncio三种模式共用）"""
+    encoding = response_encoding(headers)
+    return compress_response(route_request(target, headers, encoding), encoding)
+
+
+def route_request(target: str, headers, encoding: Optional[str] = None) -> Response:
+    """路由请求
+
+    只随数据版本变化的API带有以版本号为值的ETag（读取日志索引的API另含索引记录数，
+    按活跃时间窗口筛选的请求另含时间段序号，见activity_bucket），
+    客户端携带If-None-Match且数据没有变化时直接返回304，不做查询和序列化；否则按
+    (请求目标, 编码, ETag)经单飞缓存构建，并发的相同请求共享一次构建结果
+
+    Args:
+        target: 请求路径（含查询字符串）
+        headers: 请求头（大小写不敏感的映射）
+        encoding: 协商的压缩编码，用于选择HTML页面对应编码的ETag
+    """
+    url = urlsplit(target)
+    query = parse_qs(url.query)
+    if_none_match = headers.get('If-None-Match')
+    try:
+        endpoint = route_versioned_api(url.path)
+        if endpoint is not None:
+            if 'predict' in query:
+                return endpoint(query)  # 推算结果随时间变化，不做条件响应
+            if url.path == '/api/aircraft/' and 'format' not in query and \
+                    accepts_binary(headers.get('Accept')):
+                query['format'] = ['bin']
+            # 先取版本号再查询：查询期间有新数据时，下次请求不会误判为未修改。
+            # 同一URL的JSON和二进制表示使用不同的ETag和缓存键
+            binary = query.get('format') == ['bin']
+            version = live_state.version
+            tag = f'{version}{"-bin" if binary else ""}'
+            if log_index is not None and reads_log_index(url.path, query):
+                tag += f'-i{log_index.records}'
+            bucket = activity_bucket(url.path, query, time.time())
+            if bucket is not None:
+                tag += f'-t{bucket}'
+            etag = f'W/"{tag}"'
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag, 'no-cache')
+            if response_cache is None:
+                response = build_versioned_response(endpoint, query, etag, encoding)
+            else:
+                response = response_cache.get(
+                    (target, encoding, etag),
+                    lambda: build_versioned_response(endpoint, query, etag, encoding)).copy()
+            live_state.latency.record_serve(version)
+            return response
+        if url.path == '/api/statistics/':
+            # 统计中的延迟、压缩和缓存计数不随数据版本变化，不做条件响应；
+            # 按版本经单飞缓存合并构建，这些计数最多滞后缓存TTL
+            if response_cache is None:
+                return api_statistics(query)
+            return response_cache.get(
+                (target, encoding, live_state.version),
+                lambda: compress_response(api_statistics(query), encoding)).copy()
+        if url.path == '/api/stream/':
+            return api_stream(query)
+        if url.path in EXPORT_PATHS:
+            return api_export(query)
+        if url.path == '/metrics':
+            return api_metrics()
+        if url.path == PROFILE_PATH and profiler is not None:
+            return api_profile(query)
+    except ValueError as e:
+        return json_response({'status': 'error', 'message': str(e)}, 400)
+    except Exception as e:
+        # 未预料的错误返回500，不让请求线程带着异常退出（客户端会收到空响应）
+        print(f"处理请求出错 {target}: {e!r}")
+        return json_response({'status': 'error', 'message': '服务器内部错误'}, 500)
+
+    # 返回HTML页面（启动时已编码和预压缩，各编码使用不同的ETag）
+    etag = INDEX_ETAGS[encoding]
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, INDEX_CACHE_CONTROL)
+    return Response(200, INDEX_BODY, 'text/html; charset=utf-8',
+                    [('ETag', etag), ('Cache-Control', INDEX_CACHE_CONTROL)],
+                    precompressed=INDEX_COMPRESSED)
+
+
+INDEX_HTML = '''<!DOCTYPE html>
 <html>
 <head>
     <meta charset="utf-8">
@@ -722,40 +1517,215 @@ class MinimalHandler(BaseHTTPRequestHandler):
         let autoRefreshEnabled = false;
         let autoRefreshInterval = null;
         let aircraftData = [];
+        let aircraftMap = {};       // ICAO -> 飞机数据（推送模式下增量合并）
+        let eventSource = null;     // SSE推送连接
+        let streamTicker = null;    // 推送模式下本地更新time_diff的定时器
+        let dataVersion = null;     // 已合并到的服务端数据版本，轮询时只请求增量
+        let serverStats = null;     // 服务端增量维护的统计（/api/statistics/）
+        let statsFetchedAt = -Infinity;
+        // 以 /?bin=1 打开页面时轮询使用二进制格式（不使用SSE推送）
+        const binaryFormat = new URLSearchParams(location.search).has('bin');
         let startTime = new Date();
 
         // 移除标签页切换功能，所有内容在一个页面显示
 
+        // 记录数据到达时刻，time_diff在本地随时间增长
+        function receiveAircraft(aircraft) {
+            aircraft.received = performance.now() / 1000 - aircraft.time_diff;
+            aircraftMap[aircraft.icao] = aircraft;
+        }
+
+        function renderAircraft() {
+            const now = performance.now() / 1000;
+            aircraftData = Object.values(aircraftMap);
+            aircraftData.forEach(aircraft => {
+                aircraft.time_diff = now - aircraft.received;
+            });
+
+            document.getElementById('status').className = 'status online';
+            document.getElementById('status-text').textContent =
+                eventSource ? '系统正常运行（实时推送）' : '系统正常运行';
+            updateStatistics();
+            updateAircraftList();
+            updateRadarView();
+            updateSystemInfo();
+
+            // 更新时间
+            const time = new Date();
+            document.getElementById('update-time').textContent =
+                time.getHours().toString().padStart(2, '0') + ':' +
+                time.getMinutes().toString().padStart(2, '0');
+        }
+
+        function showOffline() {
+            document.getElementById('status').className = 'status offline';
+            document.getElementById('status-text').textContent = '连接失败';
+            document.getElementById('aircraft-count').textContent = '无法获取数据';
+        }
+
+        // 合并增量：full为false时只包含有变化的飞机和被移除的飞机
+        function mergeAircraft(data) {
+            if (data.full !== false) {
+                aircraftMap = {};
+            }
+            data.aircraft.forEach(receiveAircraft);
+            (data.removed || []).forEach(icao => delete aircraftMap[icao]);
+            dataVersion = data.version;
+            renderAircraft();
+        }
+
+        // 解码/api/aircraft/?format=bin：40字节头部 + 每架飞机56字节记录 + 移除的ICAO（均为小端序）
+        function decodeAircraftBinary(buffer) {
+            const view = new DataView(buffer);
+            const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+            if (magic !== 'ADSB' || view.getUint16(4, true) !== 1) {
+                throw new Error('无法识别的二进制格式');
+            }
+            const recordSize = view.getUint16(6, true);
+            const serverTime = view.getFloat64(16, true);
+            const count = view.getUint32(24, true);
+            const removedCount = view.getUint32(32, true);
+            const hex = value => value.toString(16).toUpperCase().padStart(6, '0');
+            const optional = value => Number.isNaN(value) ? null : value;
+            const pad = value => value.toString().padStart(2, '0');
+            const aircraft = new Array(count);
+            let offset = 40;
+            for (let i = 0; i < count; i++, offset += recordSize) {
+                const time = view.getFloat64(offset + 24, true);
+                const date = new Date(time * 1000);
+                aircraft[i] = {
+                    icao: hex(view.getUint32(offset, true)),
+                    alt: view.getInt32(offset + 4, true),
+                    lat: view.getFloat64(offset + 8, true),
+                    lon: view.getFloat64(offset + 16, true),
+                    time: time,
+                    time_diff: serverTime - time,
+                    // 日志时间戳为服务端本地时间，这里按浏览器本地时区还原
+                    timestamp: `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())} ` +
+                               `${pad(date.getHours())}:${pad(date.getMinutes())}:${pad(date.getSeconds())}`,
+                    ecef_x: optional(view.getFloat32(offset + 32, true)),
+                    ecef_y: optional(view.getFloat32(offset + 36, true)),
+                    ecef_z: optional(view.getFloat32(offset + 40, true)),
+                    enu_e: view.getFloat32(offset + 44, true),
+                    enu_n: view.getFloat32(offset + 48, true),
+                    enu_u: view.getFloat32(offset + 52, true)
+                };
+            }
+            const removed = [];
+            for (let i = 0; i < removedCount; i++, offset += 4) {
+                removed.push(hex(view.getUint32(offset, true)));
+            }
+            return {
+                version: view.getFloat64(8, true),
+                full: (view.getUint32(36, true) & 1) === 1,
+                count: count,
+                total: view.getUint32(28, true),
+                aircraft: aircraft,
+                removed: removed
+            };
+        }
+
         function refreshData() {
-            fetch('/api/aircraft/')
+            // 全量请求不使用浏览器缓存：缓存的响应中time_diff已过时；增量请求未变化时服务器返回304
+            const format = binaryFormat ? 'format=bin&' : '';
+            const request = dataVersion === null
+                ? fetch(`/api/aircraft/?${format}`, {cache: 'no-store'})
+                : fetch(`/api/aircraft/?${format}since=${dataVersion}`);
+            request
+                .then(response => binaryFormat
+                    ? response.arrayBuffer().then(decodeAircraftBinary)
+                    : response.json())
+                .then(mergeAircraft)
+                .catch(error => {
+                    console.error('数据获取失败:', error);
+                    showOffline();
+                });
+        }
+
+        // 实时推送：snapshot事件为全量数据，aircraft事件为有变化的飞机
+        function startStream() {
+            if (!window.EventSource) {
+                return false;
+            }
+            eventSource = new EventSource('/api/stream/');
+            eventSource.addEventListener('snapshot', event => {
+                mergeAircraft(JSON.parse(event.data));
+            });
+            eventSource.addEventListener('aircraft', event => {
+                const data = JSON.parse(event.data);
+                data.full = false;
+                mergeAircraft(data);
+            });
+            eventSource.onerror = () => {
+                // 服务器不支持推送或连接中断：回退到轮询
+                console.log('实时推送不可用，回退到轮询');
+                stopStream();
+                if (autoRefreshEnabled && !autoRefreshInterval && !document.hidden) {
+                    startPolling();
+                }
+            };
+            streamTicker = setInterval(renderAircraft, 3000);
+            return true;
+        }
+
+        function stopStream() {
+            if (eventSource) {
+                eventSource.close();
+                eventSource = null;
+            }
+            if (streamTicker) {
+                clearInterval(streamTicker);
+                streamTicker = null;
+            }
+        }
+
+        function startPolling() {
+            autoRefreshInterval = setInterval(refreshData, 3000);
+            refreshData();
+        }
+
+        function stopPolling() {
+            if (autoRefreshInterval) {
+                clearInterval(autoRefreshInterval);
+                autoRefreshInterval = null;
+            }
+        }
+
+        function startUpdates() {
+            if (!binaryFormat && startStream()) {
+                console.log('实时推送已启用');
+            } else {
+                startPolling();
+                console.log('自动刷新已启用 (3秒间隔)');
+            }
+        }
+
+        function stopUpdates() {
+            stopStream();
+            stopPolling();
+        }
+
+        // 统计由服务端维护，最多每3秒请求一次
+        function refreshStatistics() {
+            if (performance.now() - statsFetchedAt < 3000) {
+                return;
+            }
+            statsFetchedAt = performance.now();
+            fetch('/api/statistics/')
                 .then(response => response.json())
                 .then(data => {
-                    document.getElementById('status').className = 'status online';
-                    document.getElementById('status-text').textContent = `系统正常运行`;
-
-                    aircraftData = Object.values(data.aircraft);
+                    serverStats = data;
                     updateStatistics();
-                    updateAircraftList();
-                    updateRadarView();
                     updateSystemInfo();
-
-                    // 更新时间
-                    const now = new Date();
-                    document.getElementById('update-time').textContent =
-                        now.getHours().toString().padStart(2, '0') + ':' +
-                        now.getMinutes().toString().padStart(2, '0');
                 })
-                .catch(error => {
-                    console.error('数据获取失败:', error);
-                    document.getElementById('status').className = 'status offline';
-                    document.getElementById('status-text').textContent = '连接失败';
-                    document.getElementById('aircraft-count').textContent = '无法获取数据';
-                });
+                .catch(error => console.error('统计获取失败:', error));
         }
 
         function updateSystemInfo() {
-            // 计算数据速率 (飞机数/分钟)
-            const dataRate = aircraftData.length;
+            // 数据速率：最近1分钟的解码位置数
+            const dataRate = serverStats
+                ? Math.round(serverStats.decode_rate['60s'] * 60)
+                : aircraftData.length;
             document.getElementById('data-rate').textContent = dataRate + '/min';
 
             // 计算运行时间
@@ -769,6 +1739,18 @@ class MinimalHandler(BaseHTTPRequestHandler):
         }
 
         function updateStatistics() {
+            refreshStatistics();
+            if (serverStats) {
+                const bands = serverStats.altitude_distribution;
+                animateNumber('total-aircraft', serverStats.total_aircraft);
+                animateNumber('active-aircraft', serverStats.active_aircraft);
+                animateNumber('low-alt', bands.low);
+                animateNumber('med-alt', bands.medium);
+                animateNumber('high-alt', bands.high);
+                return;
+            }
+
+            // 服务端统计尚未获取时在本地计算
             const total = aircraftData.length;
             const active = aircraftData.filter(a => a.time_diff < 300).length; // 5分钟内活跃
 
@@ -1066,15 +2048,11 @@ class MinimalHandler(BaseHTTPRequestHandler):
             if (autoRefreshEnabled) {
                 button.textContent = '停止自动刷新';
                 button.parentElement.style.background = '#ff9500';
-                autoRefreshInterval = setInterval(refreshData, 3000);
-                console.log('自动刷新已启用 (3秒间隔)');
+                startUpdates();
             } else {
                 button.textContent = '启用自动刷新';
                 button.parentElement.style.background = '#007aff';
-                if (autoRefreshInterval) {
-                    clearInterval(autoRefreshInterval);
-                    autoRefreshInterval = null;
-                }
+                stopUpdates();
                 console.log('自动刷新已停止');
             }
         }
@@ -1106,19 +2084,17 @@ class MinimalHandler(BaseHTTPRequestHandler):
             console.log('系统初始化完成');
         }, 2000);
 
-        // 添加页面可见性检测，页面不可见时停止刷新
+        // 添加页面可见性检测，页面不可见时停止刷新和推送
         document.addEventListener('visibilitychange', () => {
+            if (!autoRefreshEnabled) {
+                return;
+            }
             if (document.hidden) {
-                if (autoRefreshEnabled && autoRefreshInterval) {
-                    clearInterval(autoRefreshInterval);
-                    console.log('页面不可见，暂停自动刷新');
-                }
-            } else {
-                if (autoRefreshEnabled && !autoRefreshInterval) {
-                    autoRefreshInterval = setInterval(refreshData, 3000);
-                    console.log('页面可见，恢复自动刷新');
-                    refreshData(); // 立即刷新一次
-                }
+                stopUpdates();
+                console.log('页面不可见，暂停自动刷新');
+            } else if (!eventSource && !autoRefreshInterval) {
+                startUpdates();
+                console.log('页面可见，恢复自动刷新');
             }
         });
 
@@ -1205,10 +2181,413 @@ ${aircraft.enu_e ? `ENU坐标: E=${aircraft.enu_e.toFixed(0)}, N=${aircraft.enu_
     </script>
 </body>
 </html>'''
-            
-            self.wfile.write(html.encode('utf-8'))
-print('Web服务器启动成功，访问 http://127.0.0.1:8000/')
+
+# HTML页面只在启动时编码并预压缩一次，ETag为内容哈希；浏览器每次用If-None-Match验证
+INDEX_BODY = INDEX_HTML.encode('utf-8')
+INDEX_COMPRESSED = precompress(INDEX_BODY)
+INDEX_ETAG = hashlib.sha1(INDEX_BODY).hexdigest()[:16]
+INDEX_ETAGS = {None: f'"{INDEX_ETAG}"'}
+INDEX_ETAGS.update((encoding, f'"{INDEX_ETAG}-{encoding}"') for encoding in INDEX_COMPRESSED)
+INDEX_CACHE_CONTROL = 'no-cache'
+
+
+def encode_chunk(chunk: bytes) -> bytes:
+    """编码一个HTTP/1.1分块"""
+    return b'%x\r\n' % len(chunk) + chunk + b'\r\n'
+
+
+class MinimalHandler(BaseHTTPRequestHandler):
+    """http.server请求处理器（single/threaded模式），支持HTTP/1.1长连接"""
+
+    protocol_version = 'HTTP/1.1'
+    timeout = 15  # 长连接空闲超时（秒）
+    # 响应头和响应体分两次写出：不关闭Nagle时，长连接上的第二次写要等客户端的延迟ACK（约40 ms）
+    disable_nagle_algorithm = True
+    quiet = False
+    streaming = True  # 是否支持流式响应
+    app = staticmethod(handle_request)  # 请求处理函数(target, headers) -> Response
+
+    def do_GET(self):
+        checkpoint()  # cProfile采集窗口内在本线程启用/停用cProfile
+        start = time.perf_counter()
+        response = self.app(self.path, self.headers)
+        self.send_app_response(response)
+        record_request(self.path, response, time.perf_counter() - start)
+
+    def send_app_response(self, response: Response):
+        """发送Response"""
+        if response.stream is not None:
+            self.send_stream(response)
+            return
+        if response.chunks is not None:
+            self.send_chunked(response)
+            return
+        self.send_response(response.status)
+        if response.status != 304:
+            self.send_header('Content-type', response.content_type)
+            self.send_header('Content-Length', str(len(response.body)))
+        for name, value in response.headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(response.body)
+
+    def send_stream(self, response: Response):
+        """发送流式响应（SSE）：不带Content-Length，写完后关闭连接"""
+        if not self.streaming:
+            self.send_app_response(json_response(
+                {'status': 'error', 'message': '当前服务模式不支持推送，请使用轮询'}, 503))
+            return
+        self.close_connection = True
+        self.send_response(response.status)
+        self.send_header('Content-type', response.content_type)
+        self.send_header('Connection', 'close')
+        for name, value in response.headers:
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            for chunk in response.stream:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except (ConnectionError, TimeoutError):
+            pass  # 客户端断开
+
+    def send_chunked(self, response: Response):
+        """分块传输（Transfer-Encoding: chunked），HTTP/1.0连接直接写出后关闭"""
+        chunked = self.request_version == 'HTTP/1.1' and self.protocol_version == 'HTTP/1.1'
+        self.send_response(response.status)
+        self.send_header('Content-type', response.content_type)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.close_connection = True
+            self.send_header('Connection', 'close')
+        for name, value in response.headers:
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            for chunk in response.chunks:
+                if not chunk:
+                    continue
+                self.wfile.write(encode_chunk(chunk) if chunked else chunk)
+            if chunked:
+                self.wfile.write(b'0\r\n\r\n')
+        except (ConnectionError, TimeoutError):
+            self.close_connection = True  # 客户端断开
+        finally:
+            response.chunks.close()
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+class LegacyHandler(MinimalHandler):
+    """单线程模式使用HTTP/1.0：每个请求后关闭连接，避免空闲长连接独占服务器
+
+    推送连接会一直占用唯一的线程，因此单线程模式不支持/api/stream/
+    """
+
+    protocol_version = 'HTTP/1.0'
+    streaming = False
+
+
+class ThreadedHTTPServer(ThreadingHTTPServer):
+    """每个连接一个线程，慢客户端不会阻塞其他请求"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class AsyncHTTPServer:
+    """基于asyncio的HTTP/1.1服务器，支持长连接，与MinimalHandler共用路由"""
+
+    MAX_HEADER_LINES = 100
+    HEADER_TIMEOUT = 10.0       # 收到请求行后读完请求头的时限（秒），防止慢速发送头部占住连接
+    MAX_DISCARD_BODY = 1 << 20  # 读取并丢弃的请求体上限（字节），更大的请求体直接关闭连接
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8000, quiet: bool = False,
+                 keep_alive_timeout: float = 15.0):
+        self.host = host
+        self.port = port
+        self.quiet = quiet
+        self.keep_alive_timeout = keep_alive_timeout  # 长连接空闲超时（秒）
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """读取请求行和请求头，连接关闭或超时返回None"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.keep_alive_timeout)
+            if not request_line:
+                return None
+            header_lines = await asyncio.wait_for(self._read_header_lines(reader), self.HEADER_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        headers = http.client.parse_headers(io.BytesIO(b''.join(header_lines) + b'\r\n'))
+
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            return None
+        return parts[0], parts[1], parts[2], headers
+
+    async def _read_header_lines(self, reader: asyncio.StreamReader) -> list:
+        header_lines = []
+        while len(header_lines) < self.MAX_HEADER_LINES:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header_lines.append(line)
+        return header_lines
+
+    async def _discard_body(self, reader: asyncio.StreamReader, headers) -> bool:
+        """读取并丢弃请求体（只处理GET，但请求体留在缓冲区会被当作下一个请求），
+        返回连接能否继续复用：分块、长度无效或过大的请求体无法可靠跳过，需关闭连接"""
+        if headers.get('Transfer-Encoding'):
+            return False
+        length = headers.get('Content-Length')
+        if length is None:
+            return True
+        try:
+            length = int(length)
+        except ValueError:
+            return False
+        if length < 0 or length > self.MAX_DISCARD_BODY:
+            return False
+        if length:
+            await asyncio.wait_for(reader.readexactly(length), self.HEADER_TIMEOUT)
+        return True
+
+    @staticmethod
+    def _response_head(response: Response, keep_alive: bool, chunked: bool) -> bytes:
+        head = [f"HTTP/1.1 {response.status} {http.client.responses.get(response.status, '')}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if response.status != 304:
+            head.append(f"Content-type: {response.content_type}")
+            if chunked:
+                head.append('Transfer-Encoding: chunked')
+            elif response.stream is None and response.chunks is None:
+                head.append(f"Content-Length: {len(response.body)}")
+        head.extend(f"{name}: {value}" for name, value in response.headers)
+        return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1')
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接上的所有请求"""
+        try:
+            while True:
+                responded = False  # 当前请求是否已开始发送响应（出错时据此决定能否再发送500）
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers = request
+
+                connection = (headers.get('Connection') or '').lower()
+                if version == 'HTTP/1.1':
+                    keep_alive = connection != 'close'
+                else:
+                    keep_alive = connection == 'keep-alive'
+                if not await self._discard_body(reader, headers):
+                    keep_alive = False
+
+                checkpoint()
+                start = time.perf_counter()
+                if method != 'GET':
+                    response = json_response({'status': 'error', 'message': f'不支持的方法 {method}'}, 405)
+                else:
+                    response = handle_request(target, headers)
+
+                if response.stream is not None:
+                    keep_alive = False  # 流式响应结束即关闭连接
+                chunked = response.chunks is not None and version == 'HTTP/1.1'
+                if response.chunks is not None and not chunked:
+                    keep_alive = False  # HTTP/1.0客户端不支持分块，以关闭连接表示结束
+                responded = True
+                writer.write(self._response_head(response, keep_alive, chunked) + response.body)
+                await writer.drain()
+
+                if not self.quiet:
+                    print(f'{writer.get_extra_info("peername")[0]} - "{method} {target} {version}" {response.status}')
+                if response.stream is not None:
+                    await self.send_stream(response.stream, writer)
+                if response.chunks is not None:
+                    await self.send_chunked(response.chunks, writer, chunked)
+                record_request(target, response, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            # 未预料的错误（如请求行或请求头过长）：尚未发送响应时返回500，然后关闭连接
+            print(f"处理连接出错: {e!r}")
+            if not responded:
+                error = json_response({'status': 'error', 'message': '服务器内部错误'}, 500)
+                writer.write(self._response_head(error, False, False) + error.body)
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+        finally:
+            writer.close()
+
+    async def send_chunked(self, chunks, writer: asyncio.StreamWriter, chunked: bool):
+        """发送分块响应：每块在线程池中生成（读取日志不阻塞事件循环），写缓冲满时等待"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                if not chunk:
+                    continue
+                writer.write(encode_chunk(chunk) if chunked else chunk)
+                await writer.drain()
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+                await writer.drain()
+        finally:
+            chunks.close()
+
+    async def send_stream(self, stream: AircraftEventStream, writer: asyncio.StreamWriter):
+        """推送SSE事件：采集线程通过call_soon_threadsafe唤醒等待的协程"""
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+
+        def listener():
+            loop.call_soon_threadsafe(wake.set)
+
+        stream.state.add_listener(listener)
+        try:
+            writer.write(stream.snapshot())
+            await writer.drain()
+            while True:
+                chunk = stream.poll(time.monotonic())
+                if chunk is not None:
+                    writer.write(chunk)
+                    await writer.drain()
+                    continue
+                wake.clear()
+                wait = stream.timeout(time.monotonic())
+                if stream.pending():
+                    await asyncio.sleep(wait)  # 合并窗口未到
+                else:
+                    try:
+                        await asyncio.wait_for(wake.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            stream.state.remove_listener(listener)
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=128)
+        async with server:
+            await server.serve_forever()
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+
+def create_server(mode: str, host: str, port: int, quiet: bool = False):
+    """按模式创建服务器：single（单线程）、threaded（每连接一线程）、asyncio"""
+    MinimalHandler.quiet = quiet
+    if mode == 'single':
+        return HTTPServer((host, port), LegacyHandler)
+    if mode == 'threaded':
+        return ThreadedHTTPServer((host, port), MinimalHandler)
+    if mode == 'asyncio':
+        return AsyncHTTPServer(host, port, quiet)
+    raise ValueError(f"未知的服务模式: {mode}")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """命令行参数（prefork_server.py在此基础上增加多进程参数）"""
+    parser = argparse.ArgumentParser(description='ADS-B可视化Web服务器')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8000, help='监听端口')
+    parser.add_argument('--mode', choices=('threaded', 'asyncio', 'single'), default='threaded',
+                        help='服务模式')
+    parser.add_argument('--log', default='adsb_decoded.log', help='解码日志路径')
+    parser.add_argument('--quiet', action='store_true', help='不输出访问日志')
+    parser.add_argument('--initial-lines', type=int, default=100,
+                        help='启动时从日志末尾读取的行数')
+    parser.add_argument('--history-log', action='append', default=[],
+                        help='较早的日志分段（可重复，按时间先后排列），与--log一起建立历史索引')
+    parser.add_argument('--no-log-index', action='store_true',
+                        help='不建立日志索引（历史航迹和快照API不可用）')
+    parser.add_argument('--cache-ttl', type=float, default=response_cache.ttl,
+                        help='版本化API响应的微缓存时间（秒，0为只合并并发请求）')
+    parser.add_argument('--no-single-flight', action='store_true',
+                        help='关闭单飞响应缓存（每个请求独立构建）')
+    parser.add_argument('--compress-level', type=int, default=compressor.level, choices=range(10),
+                        metavar='0-9', help='动态响应的gzip/deflate压缩级别（0为关闭压缩）')
+    parser.add_argument('--compress-min-size', type=int, default=compressor.min_size,
+                        help='小于该字节数的响应不压缩')
+    parser.add_argument('--stream-coalesce', type=float, default=STREAM_COALESCE,
+                        help='/api/stream/ 默认合并窗口（秒）')
+    parser.add_argument('--stream-heartbeat', type=float, default=STREAM_HEARTBEAT,
+                        help='/api/stream/ 默认心跳间隔（秒）')
+    parser.add_argument('--profiler', action='store_true',
+                        help=f'启用运行时性能分析（{PROFILE_PATH} 和SIGUSR1/SIGUSR2）')
+    parser.add_argument('--profile-rate', type=float, default=100, help='采样频率（次/秒）')
+    parser.add_argument('--profile-dir', default='profiles', help='分析结果的输出目录')
+    return parser
+
+
+def configure(args):
+    """按命令行参数设置压缩、缓存和推送参数"""
+    global STREAM_COALESCE, STREAM_HEARTBEAT, response_cache, profiler
+    STREAM_COALESCE = args.stream_coalesce
+    STREAM_HEARTBEAT = args.stream_heartbeat
+    compressor.level = args.compress_level
+    compressor.min_size = args.compress_min_size
+    MinimalHandler.quiet = args.quiet
+    if args.no_single_flight:
+        response_cache = None
+    else:
+        response_cache.ttl = args.cache_ttl
+    if args.profiler:
+        profiler = SamplingProfiler(args.profile_rate, args.profile_dir)
+        if install_signal_handlers(profiler):
+            print(f"性能分析: {PROFILE_PATH}，或 kill -USR1/-USR2 <进程号>")
+
+
+def start_background(args) -> LogIngester:
+    """启动后台采集线程和日志索引线程"""
+    global log_index
+    # 后台采集线程：增量读取解码日志，更新实时状态
+    ingester = LogIngester(live_state, args.log, initial_lines=args.initial_lines)
+    ingester.ingest_once()
+    ingester.start()
+
+    # 后台索引线程：建立日志的时间/ICAO索引，之后增量索引新增行
+    if not args.no_log_index:
+        log_index = LogIndex(args.history_log + [args.log])
+        LogIndexer(log_index).start()
+    return ingester
+
+
+def print_compression_stats():
+    """输出压缩统计（服务停止时）"""
+    stats = compressor.stats.snapshot()
+    for name, label in (('dynamic', '动态压缩'), ('static', '预压缩')):
+        item = stats[name]
+        if item['responses']:
+            print(f"{label}: {item['responses']} 个响应, 节省 {item['bytes_saved'] / 1024:.1f} KB"
+                  f" ({item['ratio']:.1f}x)" +
+                  (f", CPU {item['cpu_ms']:.1f} ms" if 'cpu_ms' in item else ''))
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    configure(args)
+    start_background(args)
+
+    server = create_server(args.mode, args.host, args.port, args.quiet)
+    print(f'Web服务器启动成功（{args.mode}模式），访问 http://{args.host}:{args.port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\n服务器已停止')
+        print_compression_stats()
+        if profiler is not None and profiler.running:
+            print(f"采样分析结果: {profiler.stop()}")
+
 
 if __name__ == '__main__':
-    server = HTTPServer(('127.0.0.1', 8000), MinimalHandler)
-    server.serve_forever()
+    main()
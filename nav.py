@@ -14,6 +14,66 @@ from dataclasses import dataclass
 from typing import Optional, Tuple, List
 import logging
 
+from aircraft_store import AircraftStore
+from kalman_tracker import KalmanTracker
+from metrics import REGISTRY, serve_metrics
+from sampling_profiler import SamplingProfiler, checkpoint, install_signal_handlers
+from track_history import TrackHistory
+from traffic_stats import TrafficStatistics
+
+# 采集链路指标（metrics.py）：热路径只更新预先取得的子指标
+SERIAL_LINES = REGISTRY.counter('adsb_serial_lines_total', '从串口读取的非空行数')
+SERIAL_BYTES = REGISTRY.counter('adsb_serial_bytes_total', '从串口读取的字节数')
+SERIAL_ERRORS = REGISTRY.counter('adsb_serial_errors_total', '串口读取异常次数')
+FRAMES = REGISTRY.counter('adsb_frames_total', '送入解码器的帧数（按结果）', ('result',))
+FRAMES_POSITION = FRAMES.labels('position')          # 空中位置报文（TC 9-18）
+FRAMES_BAD_LENGTH = FRAMES.labels('bad_length')
+FRAMES_NOT_DF17 = FRAMES.labels('not_df17')
+FRAMES_OTHER_TYPE = FRAMES.labels('other_type')      # 非位置报文（识别、速度等）
+FRAMES_ERROR = FRAMES.labels('error')
+CPR_PAIRS = REGISTRY.counter('adsb_cpr_pairs_total', '偶/奇帧齐备时的CPR全球解码次数（按结果）', ('result',))
+CPR_DECODED = CPR_PAIRS.labels('decoded')
+CPR_ZONE_MISMATCH = CPR_PAIRS.labels('zone_mismatch')  # 两帧纬度的NL不同，无法配对
+CPR_EXPIRED = REGISTRY.counter('adsb_cpr_expired_total', '超时未配对而清除的CPR缓存帧数')
+LOG_WRITE_SECONDS = REGISTRY.histogram('adsb_log_write_seconds', '日志写入（含flush）耗时（抽样）', ('file',))
+LOG_WRITE_RAW = LOG_WRITE_SECONDS.labels('raw')
+LOG_WRITE_DECODED = LOG_WRITE_SECONDS.labels('decoded')
+FRAME_SECONDS = REGISTRY.histogram('adsb_frame_processing_seconds',
+                                   '单帧处理耗时（从读到一行到解码、记录和状态更新完成，抽样）')
+
+class WallClock:
+    """单调时钟换算为墙上时间
+
+    各阶段的时间差直接用time.monotonic()相减，不受系统校时影响；需要写入日志的
+    绝对时间按最近一次对齐的基准换算，每anchor_interval秒重新对齐一次墙上时间
+    """
+
+    def __init__(self, anchor_interval: float = 60.0):
+        self.anchor_interval = anchor_interval
+        self.anchor()
+
+    def anchor(self):
+        self.monotonic = time.monotonic()
+        self.wall = time.time()
+
+    def to_wall(self, monotonic: float) -> float:
+        """time.monotonic()的值换算为Unix时间"""
+        if monotonic - self.monotonic > self.anchor_interval:
+            self.anchor()
+        return self.wall + (monotonic - self.monotonic)
+
+
+CLOCK = WallClock()
+
+# 每帧（或每条日志）都会经过的计时按TIMING_SAMPLE抽样一次：两次取时间戳加一次observe
+# 约0.3~0.5微秒，逐帧计时会超过短帧处理耗时的2%
+TIMING_SAMPLE = 16
+
+# 实时状态（store/tracks/tracker/stats）中超过AIRCRAFT_MAX_AGE秒未更新的飞机被移除，
+# 每EXPIRE_INTERVAL秒（按位置的接收时间）检查一次，长时间运行时内存不随见过的ICAO数增长
+AIRCRAFT_MAX_AGE = 300.0
+EXPIRE_INTERVAL = 10.0
+
 
 class ECEFConverter:
     """经纬度到地心地固坐标系(ECEF)转换器"""
@@ -139,13 +199,15 @@ class AircraftPosition:
     latitude: float
     longitude: float
     altitude: int
-    timestamp: float
+    timestamp: float  # 接收时间（Unix时间，含小数秒）
     ecef_x: float = 0.0
     ecef_y: float = 0.0
     ecef_z: float = 0.0
     enu_e: float = 0.0  # 东向距离
     enu_n: float = 0.0  # 北向距离
     enu_u: float = 0.0  # 天向距离
+    received: float = 0.0  # 接收时间（time.monotonic()，0为未知）
+    decoded: float = 0.0   # 解码完成时间（time.monotonic()）
 
     def __post_init__(self):
         """初始化后自动计算ECEF和ENU坐标"""
@@ -178,6 +240,7 @@ class SerialManager:
         self.baudrate = baudrate
         self.timeout = timeout
         self.connection = None
+        self.receive_time = 0.0  # 最近一行的接收时间（time.monotonic()）
 
     def get_available_ports(self) -> List[str]:
         """获取可用串口列表"""
@@ -230,9 +293,15 @@ class SerialManager:
         if not self.connection:
             return None
         try:
-            return self.connection.readline().decode('ascii', errors='ignore').strip()
+            data = self.connection.readline()
         except Exception:
+            SERIAL_ERRORS.inc()
             return None
+        self.receive_time = time.monotonic()
+        if data:
+            SERIAL_LINES.inc()
+            SERIAL_BYTES.inc(len(data))
+        return data.decode('ascii', errors='ignore').strip()
 
     def close(self):
         """关闭串口连接"""
@@ -247,10 +316,13 @@ class ADSBDecoder:
     def __init__(self, cache_timeout: int = 10):
         self.cache_timeout = cache_timeout
         self.message_cache = defaultdict(dict)  # icao -> {"even": data, "odd": data}
+        REGISTRY.gauge('adsb_cpr_cache_aircraft', '等待CPR配对的飞机数').set_function(
+            lambda: len(self.message_cache))
 
     def decode_message(self, hex_data: str) -> Optional[Tuple[str, str, int, int, int]]:
         """解码ADS-B十六进制消息"""
         if not hex_data or len(hex_data) != 28:
+            FRAMES_BAD_LENGTH.inc()
             return None
 
         try:
@@ -260,6 +332,7 @@ class ADSBDecoder:
             # 检查消息格式 (DF=17)
             df_field = int(binary_data[:5], 2)
             if df_field != 17:
+                FRAMES_NOT_DF17.inc()
                 return None
 
             # 提取ICAO地址
@@ -271,6 +344,7 @@ class ADSBDecoder:
 
             # 只处理位置消息 (TC 9-18)
             if not (9 <= type_code <= 18):
+                FRAMES_OTHER_TYPE.inc()
                 return None
 
             # 提取位置相关数据
@@ -281,9 +355,11 @@ class ADSBDecoder:
             lat_cpr = int(me_field[22:39], 2)
             lon_cpr = int(me_field[39:56], 2)
 
+            FRAMES_POSITION.inc()
             return icao, format_type, lat_cpr, lon_cpr, altitude
 
         except Exception as e:
+            FRAMES_ERROR.inc()
             logging.warning(f"消息解码失败: {e}")
             return None
 
@@ -300,20 +376,25 @@ class ADSBDecoder:
         else:
             return alt_value * 100 - 1000  # 100英尺精度
 
-    def process_position_message(self, hex_data: str) -> Optional[AircraftPosition]:
-        """处理位置消息，尝试解码完整位置"""
+    def process_position_message(self, hex_data: str, received: Optional[float] = None) -> Optional[AircraftPosition]:
+        """处理位置消息，尝试解码完整位置
+
+        received为帧的接收时间（time.monotonic()），默认为当前时间
+        """
         decoded = self.decode_message(hex_data)
         if not decoded:
             return None
 
         icao, msg_type, lat_cpr, lon_cpr, altitude = decoded
-        current_time = time.time()
+        if received is None:
+            received = time.monotonic()
+        current_time = CLOCK.to_wall(received)
 
         # 清理过期缓存
         self._cleanup_cache(current_time)
 
         # 存储消息
-        self.message_cache[icao][msg_type] = (lat_cpr, lon_cpr, current_time, altitude)
+        self.message_cache[icao][msg_type] = (lat_cpr, lon_cpr, current_time, altitude, received)
 
         # 尝试位置解码
         if "even" in self.message_cache[icao] and "odd" in self.message_cache[icao]:
@@ -332,6 +413,8 @@ class ADSBDecoder:
 
             for msg_type in expired_types:
                 del messages[msg_type]
+            if expired_types:
+                CPR_EXPIRED.inc(len(expired_types))
 
             if not messages:
                 expired_icaos.append(icao)
@@ -346,17 +429,21 @@ class ADSBDecoder:
 
         lat, lon = self._cpr_global_decode(even_data, odd_data)
         if lat is None or lon is None:
+            CPR_ZONE_MISMATCH.inc()
             return None
+        CPR_DECODED.inc()
 
-        # 使用最新消息的高度
-        altitude = even_data[3] if even_data[2] >= odd_data[2] else odd_data[3]
+        # 使用最新消息的高度和接收时间
+        latest = even_data if even_data[2] >= odd_data[2] else odd_data
 
         return AircraftPosition(
             icao=icao,
             latitude=lat,
             longitude=lon,
-            altitude=altitude,
-            timestamp=max(even_data[2], odd_data[2])
+            altitude=latest[3],
+            timestamp=latest[2],
+            received=latest[4],
+            decoded=time.monotonic()
         )
 
     def _cpr_global_decode(self, even_data: Tuple, odd_data: Tuple) -> Tuple[Optional[float], Optional[float]]:
@@ -442,10 +529,14 @@ class ADSBDecoder:
 class DataLogger:
     """数据记录器 - 负责记录原始数据和解码结果"""
 
-    def __init__(self, log_dir: str = "."):
+    def __init__(self, log_dir: str = ".", position_filter=None):
         self.log_dir = log_dir
         self.raw_log_file = None
         self.decoded_log_file = None
+        self.raw_writes = 0
+        self.decoded_writes = 0
+        # 写入过滤器：输入位置，返回需要写入的位置列表（如track_simplifier.SimplifyingFilter）
+        self.position_filter = position_filter
 
     def initialize(self):
         """初始化日志文件"""
@@ -464,22 +555,57 @@ class DataLogger:
     def log_raw_data(self, data: str):
         """记录原始数据"""
         if self.raw_log_file:
+            self.raw_writes += 1
+            if self.raw_writes % TIMING_SAMPLE:
+                self.raw_log_file.write(f"{data}\n")
+                self.raw_log_file.flush()
+                return
+            start = time.perf_counter()
             self.raw_log_file.write(f"{data}\n")
             self.raw_log_file.flush()
+            LOG_WRITE_RAW.observe(time.perf_counter() - start)
 
     def log_position(self, position: AircraftPosition):
         """记录解码后的位置信息（包含ECEF和ENU坐标）"""
+        if self.position_filter is None:
+            self._write_position(position)
+            return
+        for kept in self.position_filter(position):
+            self._write_position(kept)
+
+    def _write_position(self, position: AircraftPosition):
+        """写入一条位置记录
+
+        时间戳为接收时间（精确到微秒）；有接收时间的位置另记两列：解码完成和写入
+        距接收的毫秒数，服务端据此统计各阶段延迟
+        """
         if self.decoded_log_file:
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(position.timestamp))
-            line = (f"{timestamp},{position.icao},"
+            seconds, micros = divmod(int(position.timestamp * 1000000), 1000000)
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds))
+            line = (f"{timestamp}.{micros:06d},{position.icao},"
                    f"{position.latitude:.6f},{position.longitude:.6f},{position.altitude},"
                    f"{position.ecef_x:.1f},{position.ecef_y:.1f},{position.ecef_z:.1f},"
-                   f"{position.enu_e:.1f},{position.enu_n:.1f},{position.enu_u:.1f}\n")
+                   f"{position.enu_e:.1f},{position.enu_n:.1f},{position.enu_u:.1f}")
+            if position.received:
+                line += (f",{(position.decoded - position.received) * 1000:.3f}"
+                         f",{(time.monotonic() - position.received) * 1000:.3f}\n")
+            else:
+                line += "\n"
+            self.decoded_writes += 1
+            if self.decoded_writes % TIMING_SAMPLE:
+                self.decoded_log_file.write(line)
+                self.decoded_log_file.flush()
+                return
+            start = time.perf_counter()
             self.decoded_log_file.write(line)
             self.decoded_log_file.flush()
+            LOG_WRITE_DECODED.observe(time.perf_counter() - start)
 
     def close(self):
         """关闭日志文件"""
+        if self.position_filter is not None and hasattr(self.position_filter, 'flush'):
+            for kept in self.position_filter.flush():
+                self._write_position(kept)
         if self.raw_log_file:
             self.raw_log_file.close()
         if self.decoded_log_file:
@@ -489,12 +615,23 @@ class DataLogger:
 class NavigationSystem:
     """导航系统主类 - 整合所有组件"""
 
-    def __init__(self, target_port: str = "10"):
+    def __init__(self, target_port: str = "10", verbose: bool = True, metrics_port: Optional[int] = None):
         self.target_port = target_port
+        self.verbose = verbose  # 是否打印每个解码出的位置
+        self.metrics_port = metrics_port  # 提供 http://127.0.0.1:<端口>/metrics，None为不提供
         self.serial_manager = SerialManager()
         self.decoder = ADSBDecoder()
         self.logger = DataLogger()
+        self.store = AircraftStore()  # 实时飞机状态（ICAO + ENU网格索引）
+        self.tracks = TrackHistory()  # 每架飞机的航迹历史
+        self.tracker = KalmanTracker()  # 卡尔曼滤波跟踪（剔除CPR异常点、推算位置）
+        self.stats = TrafficStatistics()  # 增量交通统计（消息/解码速率、高度分布）
         self.running = False
+        self.frame_count = 0
+        self.decoded_count = 0
+        self.next_expire = 0.0  # 下次清理过期飞机的时间
+        self.profiler = SamplingProfiler()  # 运行时采样分析（SIGUSR1开关，SIGUSR2做cProfile采集）
+        REGISTRY.gauge('adsb_aircraft', '实时状态中的飞机数').set_function(lambda: len(self.store))
 
     def initialize(self) -> bool:
         """初始化系统"""
@@ -504,6 +641,13 @@ class NavigationSystem:
         if not self.logger.initialize():
             return False
 
+        if self.metrics_port is not None:
+            try:
+                serve_metrics(self.metrics_port)
+                print(f"指标: http://127.0.0.1:{self.metrics_port}/metrics")
+            except OSError as e:
+                print(f"指标服务启动失败（端口 {self.metrics_port}）: {e}")
+
         # 连接串口
         if not self.serial_manager.connect(self.target_port):
             print("串口连接失败")
@@ -520,6 +664,8 @@ class NavigationSystem:
         self.running = True
         print("开始接收ADS-B数据...")
         print("按 Ctrl+C 停止程序")
+        if install_signal_handlers(self.profiler):
+            print(f"性能分析: kill -USR1 {os.getpid()} 开始/停止采样, kill -USR2 {os.getpid()} 采集cProfile")
 
         try:
             self._main_loop()
@@ -530,34 +676,65 @@ class NavigationSystem:
 
     def _main_loop(self):
         """主处理循环"""
-        decoded_count = 0
-
         while self.running:
+            checkpoint()  # cProfile采集窗口内在本线程启用/停用cProfile
             # 读取串口数据
             raw_data = self.serial_manager.read_line()
-            if not raw_data:
-                continue
+            if raw_data:
+                self.process_line(raw_data, self.serial_manager.receive_time)
 
-            # 记录原始数据
-            self.logger.log_raw_data(raw_data)
+    def process_line(self, raw_data: str, received: Optional[float] = None):
+        """处理串口读到的一行：记录原始数据、解码位置并更新状态
+
+        received为该行的接收时间（time.monotonic()），默认为当前时间
+        """
+        if received is None:
+            received = time.monotonic()
+        self.frame_count += 1
+        if self.frame_count % TIMING_SAMPLE:
+            self._process_line(raw_data, received)
+            return
+        start = time.perf_counter()
+        self._process_line(raw_data, received)
+        FRAME_SECONDS.observe(time.perf_counter() - start)
 
-            # 过滤有效数据（以*开头的28字节十六进制）
-            if not raw_data.startswith('*') or len(raw_data) < 29:
-                continue
+    def _process_line(self, raw_data: str, received: float):
+        # 记录原始数据
+        self.logger.log_raw_data(raw_data)
+        self.stats.record_messages()
 
+        # 过滤有效数据（以*开头的28字节十六进制）
+        if raw_data.startswith('*') and len(raw_data) >= 29:
             hex_data = raw_data[1:29]  # 提取十六进制部分
 
             # 解码位置信息
-            position = self.decoder.process_position_message(hex_data)
+            position = self.decoder.process_position_message(hex_data, received)
             if position:
-                decoded_count += 1
-                print(f"✈️ {position}")
+                self.decoded_count += 1
+                if self.verbose:
+                    print(f"✈️ {position}")
                 self.logger.log_position(position)
+                self.store.update_position(position)
+                self.tracks.append_position(position)
+                self.tracker.update_position(position)
+                self.stats.record_aircraft_position(position)
+                if position.timestamp >= self.next_expire:
+                    self.next_expire = position.timestamp + EXPIRE_INTERVAL
+                    self._expire_aircraft(position.timestamp)
+
+    def _expire_aircraft(self, now: float):
+        """移除超过AIRCRAFT_MAX_AGE秒未更新的飞机（与LiveAircraftState.apply一致）"""
+        for icao in self.store.expire(AIRCRAFT_MAX_AGE, now):
+            self.tracks.remove(icao)
+            self.tracker.remove(icao)
+            self.stats.remove(icao)
 
     def _cleanup(self):
         """清理资源"""
         print("正在关闭系统...")
         self.running = False
+        if self.profiler.running:
+            print(f"采样分析结果: {self.profiler.stop()}")
         self.serial_manager.close()
         self.logger.close()
         print("系统已关闭")
@@ -586,7 +763,7 @@ def main():
     print("\n正在启动系统...")
 
     # 创建并启动导航系统
-    nav_system = NavigationSystem(target_port="10")
+    nav_system = NavigationSystem(target_port="10", metrics_port=9100)
     nav_system.start()
 
 
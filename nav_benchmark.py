@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+nav.py处理链路的基准测试
+输入为adsb_simulator.py按固定种子生成的模拟数据（结果可重复），分别测量：
+decode_message、process_position_message（含CPR配对）、坐标转换、
+AircraftPosition构造、DataLogger写日志和process_line端到端处理，
+输出吞吐量（次/秒）和单次耗时的p50/p90/p99，可保存为基线并与基线比较。
+
+用法：
+    python nav_benchmark.py --save baseline.json
+    python nav_benchmark.py --compare baseline.json [--threshold 10]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from typing import Callable, List, Optional, Tuple
+
+import metrics
+from adsb_simulator import TrafficSimulator
+from coord_converter import CoordinateConverter
+from nav import ADSBDecoder, AircraftPosition, DataLogger, ECEFConverter, ENUConverter, NavigationSystem
+
+DEFAULT_BASELINE = 'nav_benchmark_baseline.json'
+
+
+class Workload:
+    """基准测试的输入数据（同一参数下每次生成的数据相同）"""
+
+    def __init__(self, aircraft: int = 100, seconds: float = 30.0, seed: int = 1):
+        simulator = TrafficSimulator(aircraft, seed, noise=0.05, corruption=0.01)
+        start = time.monotonic()
+        self.frames: List[Tuple[str, float]] = []  # (28位十六进制, 接收时间)
+        self.lines: List[Tuple[str, float]] = []   # (AVR行, 接收时间)
+        for timestamp, frame in simulator.frames(seconds):
+            hex_data = frame.hex().upper()
+            self.lines.append((f"*{hex_data};", start + timestamp))
+            if len(frame) == 14:
+                self.frames.append((hex_data, start + timestamp))
+
+        # 解码出的位置（坐标转换和写日志的输入）
+        decoder = ADSBDecoder()
+        self.positions: List[AircraftPosition] = []
+        for hex_data, received in self.frames:
+            position = decoder.process_position_message(hex_data, received)
+            if position is not None:
+                self.positions.append(position)
+        self.lla = [(p.latitude, p.longitude, p.altitude * 0.3048) for p in self.positions]
+        self.ecef = [(p.ecef_x, p.ecef_y, p.ecef_z) for p in self.positions]
+        self.enu = [(p.enu_e, p.enu_n, p.enu_u) for p in self.positions]
+
+
+def _timer_overhead_ns(rounds: int = 20000) -> int:
+    """两次perf_counter_ns()之间的最小间隔（单次计时本身的开销）"""
+    timer = time.perf_counter_ns
+    best = None
+    for _ in range(rounds):
+        start = timer()
+        elapsed = timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _timed_pass(setup: Callable[[], Tuple[Callable, list]]) -> Tuple[int, int]:
+    """重新setup后处理一遍输入，返回(耗时（纳秒）, 次数)；setup不计时，有状态的用例每遍从初始状态开始"""
+    func, items = setup()
+    timer = time.perf_counter_ns
+    start = timer()
+    for item in items:
+        func(item)
+    return timer() - start, len(items)
+
+
+def run_case(setup: Callable[[], Tuple[Callable, list]], repeat: int, timer_ns: int,
+             min_time: float = 0.2) -> dict:
+    """测量一个用例：setup()返回(函数, 输入列表)
+
+    吞吐量取repeat轮中最快的一轮，每轮重复处理输入直到至少min_time秒（过短的轮次受调度
+    干扰大）；单次耗时在另一遍中逐次计时，扣除计时开销
+    """
+    timer = time.perf_counter_ns
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        elapsed, _ = _timed_pass(setup)  # 预热，并估算每轮需要的遍数
+        passes = max(1, round(min_time * 1e9 / max(elapsed, 1)))
+        best = None
+        for _ in range(repeat):
+            total = ops = 0
+            for _ in range(passes):
+                elapsed, count = _timed_pass(setup)
+                total += elapsed
+                ops += count
+            if best is None or total / ops < best:
+                best = total / ops  # 每次的平均耗时（纳秒）
+
+        func, items = setup()
+        samples = []
+        for item in items:
+            start = timer()
+            func(item)
+            samples.append(timer() - start - timer_ns)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    samples.sort()
+    count = len(samples)
+
+    def percentile(q: float) -> float:
+        return max(samples[min(count - 1, int(q * count))], 0) / 1000
+
+    return {
+        'ops': count,
+        'ops_per_sec': 1e9 / best if best else 0.0,
+        'mean_us': best / 1000,
+        'p50_us': percentile(0.50),
+        'p90_us': percentile(0.90),
+        'p99_us': percentile(0.99),
+        'max_us': max(samples[-1], 0) / 1000,
+    }
+
+
+def build_cases(workload: Workload, log_dir: str) -> List[Tuple[str, Callable[[], Tuple[Callable, list]]]]:
+    """各用例的(名称, setup)"""
+    enu = ENUConverter()
+    converter = CoordinateConverter()
+
+    def decode_message():
+        decoder = ADSBDecoder()
+        return (lambda item: decoder.decode_message(item[0])), workload.frames
+
+    def process_position_message():
+        decoder = ADSBDecoder()
+        return (lambda item: decoder.process_position_message(item[0], item[1])), workload.frames
+
+    def lla_to_ecef():
+        return (lambda item: ECEFConverter.lla_to_ecef(*item)), workload.lla
+
+    def ecef_to_enu():
+        return (lambda item: enu.ecef_to_enu(*item)), workload.ecef
+
+    def aircraft_position():
+        return (lambda p: AircraftPosition(p.icao, p.latitude, p.longitude, p.altitude, p.timestamp)), \
+            workload.positions
+
+    def converter_lla_to_enu():
+        return (lambda item: converter.lla_to_enu(*item)), workload.lla
+
+    def converter_enu_to_lla():
+        return (lambda item: converter.enu_to_lla(*item)), workload.enu
+
+    def new_logger() -> DataLogger:
+        for name in ('adsb_raw.log', 'adsb_decoded.log'):
+            path = os.path.join(log_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+        logger = DataLogger(log_dir)
+        logger.initialize()
+        return logger
+
+    def log_raw_data():
+        logger = new_logger()
+        return (lambda item: logger.log_raw_data(item[0])), workload.lines
+
+    def log_position():
+        logger = new_logger()
+        return logger.log_position, workload.positions
+
+    def process_line():
+        system = NavigationSystem(verbose=False)
+        system.logger = new_logger()
+        return (lambda item: system.process_line(item[0], item[1])), workload.lines
+
+    return [
+        ('decode_message', decode_message),
+        ('process_position_message', process_position_message),
+        ('ECEFConverter.lla_to_ecef', lla_to_ecef),
+        ('ENUConverter.ecef_to_enu', ecef_to_enu),
+        ('AircraftPosition', aircraft_position),
+        ('CoordinateConverter.lla_to_enu', converter_lla_to_enu),
+        ('CoordinateConverter.enu_to_lla', converter_enu_to_lla),
+        ('DataLogger.log_raw_data', log_raw_data),
+        ('DataLogger.log_position', log_position),
+        ('NavigationSystem.process_line', process_line),
+    ]
+
+
+def environment(args) -> dict:
+    """结果附带的运行环境（比较不同机器上的基线时参考）"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'aircraft': args.aircraft,
+        'seconds': args.seconds,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'metrics': not args.no_metrics,
+    }
+
+
+def run_benchmarks(args) -> dict:
+    print(f"生成模拟数据: {args.aircraft} 架飞机, {args.seconds:.0f} 秒 (种子 {args.seed})")
+    workload = Workload(args.aircraft, args.seconds, args.seed)
+    print(f"  {len(workload.lines)} 行, {len(workload.frames)} 个DF17长帧, {len(workload.positions)} 个位置")
+    timer_ns = _timer_overhead_ns()
+    results = {}
+    log_dir = tempfile.mkdtemp(prefix='nav_benchmark_')
+    try:
+        with metrics.disabled() if args.no_metrics else nullcontext():
+            for name, setup in build_cases(workload, log_dir):
+                if args.filter and not any(word in name for word in args.filter):
+                    continue
+                results[name] = run_case(setup, args.repeat, timer_ns)
+                print_result(name, results[name])
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+    return {'environment': environment(args), 'timer_overhead_ns': timer_ns, 'results': results}
+
+
+def print_result(name: str, result: dict, baseline: Optional[dict] = None):
+    line = (f"{name:<34} {result['ops_per_sec']:>12,.0f} 次/秒  p50 {result['p50_us']:>7.2f}  "
+            f"p90 {result['p90_us']:>7.2f}  p99 {result['p99_us']:>8.2f} 微秒")
+    if baseline is not None:
+        line += (f"  吞吐 {change(result['ops_per_sec'], baseline['ops_per_sec']):>+7.1f}%"
+                 f"  p99 {change(result['p99_us'], baseline['p99_us']):>+7.1f}%")
+    print(line)
+
+
+def change(value: float, base: float) -> float:
+    return (value / base - 1) * 100 if base else 0.0
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """与基线比较，返回吞吐量下降超过threshold%的用例"""
+    base_env = baseline['environment']
+    env = report['environment']
+    print(f"\n与基线比较（{base_env.get('date')} commit {base_env.get('commit') or '?'}, "
+          f"Python {base_env.get('python')}）:")
+    for key in ('python', 'platform', 'aircraft', 'seconds', 'seed', 'metrics'):
+        if base_env.get(key) != env.get(key):
+            print(f"  注意: {key} 不同（基线 {base_env.get(key)}，本次 {env.get(key)}）")
+    regressions = []
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<34} （基线中没有）")
+            continue
+        print_result(name, result, base)
+        if change(result['ops_per_sec'], base['ops_per_sec']) < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='nav.py处理链路基准测试')
+    parser.add_argument('--aircraft', type=int, default=100, help='模拟飞机数')
+    parser.add_argument('--seconds', type=float, default=30.0, help='模拟时长（秒）')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--repeat', type=int, default=5, help='吞吐量测量轮数（取最快一轮）')
+    parser.add_argument('--filter', nargs='+', help='只运行名称包含这些关键字的用例')
+    parser.add_argument('--no-metrics', action='store_true', help='关闭指标埋点（metrics.disabled()）')
+    parser.add_argument('--save', nargs='?', const=DEFAULT_BASELINE, help='保存结果为基线（JSON）')
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, help='与基线比较')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='吞吐量下降超过该百分比时视为退化（退出码1；共享或调频的机器上波动可达10%%）')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.save}")
+    if regressions:
+        print(f"\n吞吐量下降超过 {args.threshold:.0f}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
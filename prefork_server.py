@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+多进程预派生（prefork）服务
+主进程运行采集线程，把飞机快照（已编码的JSON数组和二进制记录）发布到共享内存；
+N个工作进程继承同一个监听套接字（或各自以SO_REUSEPORT监听），/api/aircraft/直接
+返回共享内存中的快照，不解析、不重新编码；其余API转发给主进程内部的完整服务
+
+用法：python prefork_server.py --workers 4 [minimal_server.py的其他参数]
+"""
+
+import http.client
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+# 共享内存需要Python 3.8+，预派生需要fork（仅Unix/Linux）
+try:
+    from multiprocessing import shared_memory
+    HAS_SHARED_MEMORY = True
+except ImportError:
+    HAS_SHARED_MEMORY = False
+
+import minimal_server
+from aircraft_store import (BINARY_FULL, BINARY_HEADER, BINARY_MAGIC, BINARY_RECORD,
+                            BINARY_VERSION, states_json)
+from live_state import LiveAircraftState
+from minimal_server import (BINARY_CONTENT_TYPE, MinimalHandler, Response, ThreadedHTTPServer,
+                            accepts_binary, compress_response, etag_matches, handle_request,
+                            json_response, json_response_with_raw, not_modified, response_encoding)
+
+# 共享内存布局：序列号 | 元数据 | 每个工作进程的计数 | JSON数组 | 二进制记录
+# 序列号在写入期间为奇数（seqlock）：读取方在读取前后各读一次序列号，
+# 两次相同且为偶数时读到的数据是完整的，否则重试
+SEQ = struct.Struct('<Q')
+META = struct.Struct('<ddIQQ')     # 数据版本、发布时间、飞机数、JSON字节数、二进制字节数
+META_OFFSET = SEQ.size
+COUNTER = struct.Struct('<QQQ')    # 从快照直接返回的请求数、转发的请求数、seqlock重试次数
+COUNTER_OFFSET = 64
+MAX_WORKERS = 64
+DATA_OFFSET = COUNTER_OFFSET + COUNTER.size * MAX_WORKERS
+
+# seqlock读取：先让出CPU重试SEQLOCK_SPINS次，之后每次休眠1毫秒；序列号超过
+# SEQLOCK_TIMEOUT（秒）仍为奇数或一直变化时（如写入方在写入中途退出）放弃读取，返回503
+SEQLOCK_SPINS = 100
+SEQLOCK_TIMEOUT = 0.5
+
+# 工作进程可直接用快照回答的/api/aircraft/参数（其余参数转发给主进程）
+SNAPSHOT_PARAMS = {'since', 'format'}
+
+# 转发时传给主进程的请求头，以及不回传给客户端的响应头
+FORWARD_HEADERS = ('Accept', 'Accept-Encoding', 'If-None-Match')
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length',
+               'content-type', 'server', 'date'}
+
+
+class SharedSnapshot:
+    """共享内存中的飞机快照（单写多读，seqlock保证读取一致）
+
+    每个进程缓存最近一次读到的副本：序列号不变时直接返回，快照每发布一次，
+    每个工作进程最多复制一次
+    """
+
+    def __init__(self, size: int):
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.capacity = size - DATA_OFFSET
+        self.seq = 0  # 写入方的序列号
+        self._cache = {}  # 类型 -> (序列号, 快照)
+
+    def publish(self, version: int, published: float, count: int,
+                aircraft_json: bytes, records: bytes):
+        """写入新快照（只能由主进程的一个线程调用）"""
+        size = len(aircraft_json) + len(records)
+        if size > self.capacity:
+            raise ValueError(f"快照 {size / 1024 / 1024:.1f} MB 超过共享内存容量，请增大--shm-mb")
+        buf = self.shm.buf
+        SEQ.pack_into(buf, 0, self.seq + 1)  # 奇数：写入中
+        META.pack_into(buf, META_OFFSET, float(version), published, count, len(aircraft_json), len(records))
+        buf[DATA_OFFSET:DATA_OFFSET + len(aircraft_json)] = aircraft_json
+        buf[DATA_OFFSET + len(aircraft_json):DATA_OFFSET + size] = records
+        self.seq += 2
+        SEQ.pack_into(buf, 0, self.seq)
+
+    def _read(self, read_data) -> tuple:
+        """seqlock读取：返回(序列号, 元数据, read_data的结果, 重试次数)
+
+        超过SEQLOCK_TIMEOUT仍读不到一致的快照时抛出TimeoutError
+        """
+        buf = self.shm.buf
+        retries = 0
+        deadline = None
+        while True:
+            seq, = SEQ.unpack_from(buf, 0)
+            if not seq & 1:
+                meta = META.unpack_from(buf, META_OFFSET)
+                data = read_data(seq, meta)
+                if SEQ.unpack_from(buf, 0)[0] == seq:
+                    return seq, meta, data, retries
+            retries += 1
+            if retries < SEQLOCK_SPINS:
+                time.sleep(0)
+                continue
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + SEQLOCK_TIMEOUT
+            elif now > deadline:
+                raise TimeoutError(f"共享快照 {SEQLOCK_TIMEOUT} 秒内未完成写入（序列号 {seq}）")
+            time.sleep(0.001)
+
+    def version(self) -> tuple:
+        """当前快照的(数据版本, 重试次数)，不复制数据"""
+        _, meta, _, retries = self._read(lambda seq, meta: None)
+        return int(meta[0]), retries
+
+    def read(self, kind: str) -> tuple:
+        """读取快照：返回((数据版本, 发布时间, 飞机数, 数据), 重试次数)，kind为'json'或'bin'"""
+        buf = self.shm.buf
+
+        def read_data(seq, meta):
+            cached = self._cache.get(kind)
+            if cached is not None and cached[0] == seq:
+                return cached[1][3]
+            json_length, bin_length = meta[3], meta[4]
+            start = DATA_OFFSET if kind == 'json' else DATA_OFFSET + json_length
+            return bytes(buf[start:start + (json_length if kind == 'json' else bin_length)])
+
+        seq, meta, data, retries = self._read(read_data)
+        snapshot = (int(meta[0]), meta[1], meta[2], data)
+        self._cache[kind] = (seq, snapshot)
+        return snapshot, retries
+
+    def add_counts(self, worker_id: int, local: int = 0, proxied: int = 0, retries: int = 0):
+        """累加工作进程的计数（每个工作进程只写自己的槽位，调用方需串行化）"""
+        offset = COUNTER_OFFSET + worker_id * COUNTER.size
+        values = COUNTER.unpack_from(self.shm.buf, offset)
+        COUNTER.pack_into(self.shm.buf, offset, values[0] + local, values[1] + proxied, values[2] + retries)
+
+    def counts(self, workers: int) -> list:
+        """各工作进程的(直接返回, 转发, 重试)计数"""
+        return [COUNTER.unpack_from(self.shm.buf, COUNTER_OFFSET + i * COUNTER.size)
+                for i in range(workers)]
+
+    def close(self, unlink: bool = False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SnapshotPublisher(threading.Thread):
+    """主进程的发布线程：数据有变化时立即发布；没有变化时每interval秒重新发布一次，
+    使快照中的time_diff保持新鲜（与--cache-ttl的微缓存相同程度的滞后）"""
+
+    def __init__(self, state: LiveAircraftState, snapshot: SharedSnapshot, interval: float = 1.0):
+        super().__init__(name='adsb-snapshot-publisher', daemon=True)
+        self.state = state
+        self.snapshot = snapshot
+        self.interval = interval
+        self.published_version = None
+        self.publishes = 0
+        self.publish_time = 0.0
+        self._stop_event = threading.Event()
+
+    def publish(self):
+        """编码并发布当前状态"""
+        start = time.perf_counter()
+        now = time.time()
+        with self.state.lock:
+            version = self.state.version
+            states = list(self.state.store.values())
+            aircraft_json = states_json(states, now)
+            records = b''.join([state.binary_record() for state in states])
+        self.snapshot.publish(version, now, len(states), aircraft_json, records)
+        self.state.latency.record_serve(version)  # 工作进程从此刻起可返回该版本
+        self.published_version = version
+        self.publishes += 1
+        self.publish_time += time.perf_counter() - start
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with self.state.changed:
+                if self.state.version == self.published_version:
+                    self.state.changed.wait(self.interval)
+            try:
+                self.publish()
+            except Exception as e:
+                print(f"快照发布出错: {e}")
+                self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class PreforkWorker:
+    """工作进程的请求处理：/api/aircraft/读取共享快照，其余API、/metrics和/admin/转发给主进程，
+    页面在本进程返回（分析某个工作进程用SIGUSR1/SIGUSR2）"""
+
+    def __init__(self, snapshot: SharedSnapshot, worker_id: int, upstream_port: int):
+        self.snapshot = snapshot
+        self.worker_id = worker_id
+        self.upstream_port = upstream_port
+        self.lock = threading.Lock()  # 串行化计数更新
+
+    def count(self, local: int = 0, proxied: int = 0, retries: int = 0):
+        with self.lock:
+            self.snapshot.add_counts(self.worker_id, local, proxied, retries)
+
+    def handle(self, target: str, headers) -> Response:
+        url = urlsplit(target)
+        if url.path == '/api/aircraft/':
+            query = parse_qs(url.query)
+            if set(query) <= SNAPSHOT_PARAMS and query.get('format', ['json'])[0] in ('json', 'bin'):
+                try:
+                    return self.snapshot_response(target, query, headers)
+                except TimeoutError as e:
+                    # 共享快照一直处于写入中（如主进程在写入中途退出）
+                    return json_response({'status': 'error', 'message': str(e)}, 503)
+        if url.path.startswith(('/api/', '/admin/')) or url.path == '/metrics':
+            self.count(proxied=1)
+            return self.proxy(target, headers)
+        return handle_request(target, headers)
+
+    def snapshot_response(self, target: str, query: dict, headers) -> Response:
+        """用共享快照回答/api/aircraft/（since参数总是得到全量响应，full为true）"""
+        try:
+            if 'since' in query:
+                int(query['since'][0])
+        except ValueError as e:
+            return json_response({'status': 'error', 'message': str(e)}, 400)
+        binary = query.get('format') == ['bin'] or \
+            ('format' not in query and accepts_binary(headers.get('Accept')))
+        encoding = response_encoding(headers)
+        version, retries = self.snapshot.version()
+        etag = f'W/"{version}{"-bin" if binary else ""}"'
+        if etag_matches(headers.get('If-None-Match'), etag):
+            self.count(local=1, retries=retries)
+            return not_modified(etag, 'no-cache')
+
+        def build():
+            response = self.build_snapshot(binary, 'since' in query)
+            response.headers += [('ETag', etag), ('Cache-Control', 'no-cache')]
+            return compress_response(response, encoding)
+
+        cache = minimal_server.response_cache
+        response = build() if cache is None else cache.get((target, binary, encoding, etag), build).copy()
+        self.count(local=1, retries=retries)
+        return response
+
+    def build_snapshot(self, binary: bool, delta_requested: bool) -> Response:
+        if binary:
+            (version, _, count, records), retries = self.snapshot.read('bin')
+            header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, BINARY_RECORD.size, float(version),
+                                        time.time(), count, count, 0, BINARY_FULL)
+            response = Response(200, header + records, BINARY_CONTENT_TYPE,
+                                [('Access-Control-Allow-Origin', '*'), ('Vary', 'Accept')])
+        else:
+            (version, _, count, aircraft_json), retries = self.snapshot.read('json')
+            payload = {'status': 'success', 'version': version, 'count': count}
+            if delta_requested:
+                payload['full'] = True
+                payload['removed'] = []
+            response = json_response_with_raw(payload, 'aircraft', aircraft_json)
+            response.headers.append(('Vary', 'Accept'))
+        if retries:
+            self.count(retries=retries)
+        return response
+
+    def proxy(self, target: str, headers) -> Response:
+        """转发给主进程的内部服务；没有Content-Length的响应（SSE、导出）按块转发"""
+        connection = http.client.HTTPConnection('127.0.0.1', self.upstream_port, timeout=60)
+        try:
+            forward = {name: headers[name] for name in FORWARD_HEADERS if headers.get(name)}
+            forward['Connection'] = 'close'  # 每个转发请求使用独立连接，响应结束后由主进程关闭
+            connection.request('GET', target, headers=forward)
+            upstream = connection.getresponse()
+        except OSError as e:
+            connection.close()
+            return json_response({'status': 'error', 'message': f'主进程不可用: {e}'}, 502)
+        response_headers = [(name, value) for name, value in upstream.getheaders()
+                            if name.lower() not in HOP_HEADERS]
+        content_type = upstream.getheader('Content-Type', 'application/json')
+        if upstream.getheader('Content-Length') is not None or upstream.status == 304:
+            response = Response(upstream.status, upstream.read(), content_type, response_headers)
+            connection.close()
+        else:
+            response = Response(upstream.status, content_type=content_type, headers=response_headers,
+                                chunks=relay(connection, upstream))
+        response.encoded = True  # 主进程已按Accept-Encoding压缩
+        return response
+
+
+def relay(connection: http.client.HTTPConnection, upstream: http.client.HTTPResponse):
+    """逐块转发上游响应（read1有数据就返回，SSE事件不会被缓冲）"""
+    try:
+        while True:
+            data = upstream.read1(64 * 1024)
+            if not data:
+                break
+            yield data
+    finally:
+        connection.close()
+
+
+def open_listener(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    """创建监听套接字（reuse_port时多个进程可绑定同一端口，由内核分配连接）"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(ThreadedHTTPServer.request_queue_size)
+    return sock
+
+
+def run_worker(worker_id: int, listener: Optional[socket.socket], snapshot: SharedSnapshot,
+               upstream_port: int, args):
+    """工作进程入口（fork之后调用，不返回）"""
+    try:
+        if listener is None:
+            listener = open_listener(args.host, args.port, reuse_port=True)
+        worker = PreforkWorker(snapshot, worker_id, upstream_port)
+        handler = type('PreforkHandler', (MinimalHandler,), {'app': staticmethod(worker.handle)})
+        server = ThreadedHTTPServer((args.host, args.port), handler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = listener
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"工作进程 {worker_id} 出错: {e}")
+    finally:
+        os._exit(0)
+
+
+def main():
+    parser = minimal_server.build_arg_parser()
+    parser.description = 'ADS-B可视化Web服务器（多进程预派生）'
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='工作进程数')
+    parser.add_argument('--reuse-port', action='store_true',
+                        help='每个工作进程以SO_REUSEPORT各自监听（默认共享主进程创建的监听套接字）')
+    parser.add_argument('--shm-mb', type=int, default=64, help='共享快照的容量（MB）')
+    parser.add_argument('--publish-interval', type=float, default=1.0,
+                        help='数据没有变化时重新发布快照的间隔（秒）')
+    args = parser.parse_args()
+
+    if not HAS_SHARED_MEMORY or not hasattr(os, 'fork'):
+        parser.error('多进程模式需要Python 3.8+和fork（Unix/Linux）')
+    if not 1 <= args.workers <= MAX_WORKERS:
+        parser.error(f'--workers 需要在1~{MAX_WORKERS}之间')
+    if args.mode != 'threaded':
+        print('多进程模式下工作进程使用threaded模式')
+
+    minimal_server.configure(args)
+    snapshot = SharedSnapshot(args.shm_mb * 1024 * 1024 + DATA_OFFSET)
+    # 主进程内部的完整服务（只监听本机随机端口），接收工作进程转发的请求
+    upstream = ThreadedHTTPServer(('127.0.0.1', 0), MinimalHandler)
+    listener = None if args.reuse_port else open_listener(args.host, args.port)
+
+    # 先fork再启动任何线程
+    workers = []
+    for worker_id in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            upstream.socket.close()
+            run_worker(worker_id, listener, snapshot, upstream.server_address[1], args)
+        workers.append(pid)
+    if listener is not None:
+        listener.close()
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    minimal_server.start_background(args)
+    publisher = SnapshotPublisher(minimal_server.live_state, snapshot, args.publish_interval)
+    publisher.publish()
+    publisher.start()
+
+    print(f'Web服务器启动成功（{args.workers} 个工作进程），访问 http://{args.host}:{args.port}/')
+    try:
+        upstream.serve_forever()
+    except KeyboardInterrupt:
+        print('\n服务器已停止')
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in workers:
+            os.waitpid(pid, 0)
+        if publisher.publishes:
+            print(f"快照发布 {publisher.publishes} 次, 平均 "
+                  f"{publisher.publish_time / publisher.publishes * 1000:.2f} ms")
+        for worker_id, (local, proxied, retries) in enumerate(snapshot.counts(args.workers)):
+            print(f"工作进程 {worker_id}: 快照响应 {local}, 转发 {proxied}, seqlock重试 {retries}")
+        minimal_server.print_compression_stats()
+        snapshot.close(unlink=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+HTTP响应压缩
+Accept-Encoding协商（gzip/deflate）、静态内容启动时预压缩、动态内容按级别压缩，
+并统计压缩节省的字节数和消耗的CPU时间
+"""
+
+import gzip
+import json
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+# 服务端支持的编码，按优先级排列（q值相同时优先gzip）
+ENCODINGS = ('gzip', 'deflate')
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """根据Accept-Encoding选择编码，不接受任何压缩编码时返回None"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            weights[name] = q
+
+    best = None
+    best_q = 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data: bytes, encoding: str, level: int = 6) -> bytes:
+    """按编码压缩（deflate为HTTP约定的zlib格式）"""
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == 'deflate':
+        return zlib.compress(data, level)
+    raise ValueError(f"不支持的编码: {encoding}")
+
+
+def precompress(data: bytes, level: int = 9) -> Dict[str, bytes]:
+    """预先生成所有编码的压缩结果（用于静态内容，只在启动时执行一次）"""
+    return {encoding: compress(data, encoding, level) for encoding in ENCODINGS}
+
+
+class CompressionStats:
+    """压缩统计：动态压缩和预压缩分别计数（线程安全）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dynamic = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_time': 0.0}
+        self.static = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0}
+        self.uncompressed = 0  # 客户端不接受压缩或响应低于阈值的次数
+
+    def record_dynamic(self, bytes_in: int, bytes_out: int, cpu_time: float):
+        with self.lock:
+            self.dynamic['responses'] += 1
+            self.dynamic['bytes_in'] += bytes_in
+            self.dynamic['bytes_out'] += bytes_out
+            self.dynamic['cpu_time'] += cpu_time
+
+    def record_static(self, bytes_in: int, bytes_out: int):
+        with self.lock:
+            self.static['responses'] += 1
+            self.static['bytes_in'] += bytes_in
+            self.static['bytes_out'] += bytes_out
+
+    def record_uncompressed(self):
+        with self.lock:
+            self.uncompressed += 1
+
+    def snapshot(self) -> dict:
+        """返回统计结果：节省的字节数、压缩比和每KB原始数据的CPU耗时"""
+        with self.lock:
+            dynamic = dict(self.dynamic)
+            static = dict(self.static)
+            uncompressed = self.uncompressed
+        result = {'uncompressed_responses': uncompressed}
+        for name, counters in (('dynamic', dynamic), ('static', static)):
+            bytes_in = counters['bytes_in']
+            bytes_out = counters['bytes_out']
+            item = {
+                'responses': counters['responses'],
+                'bytes_in': bytes_in,
+                'bytes_out': bytes_out,
+                'bytes_saved': bytes_in - bytes_out,
+                'ratio': bytes_in / bytes_out if bytes_out else 0.0,
+            }
+            if 'cpu_time' in counters:
+                item['cpu_ms'] = counters['cpu_time'] * 1000
+                item['cpu_us_per_kb'] = (counters['cpu_time'] * 1e6 / (bytes_in / 1024)
+                                         if bytes_in else 0.0)
+            result[name] = item
+        return result
+
+
+class ResponseCompressor:
+    """动态响应压缩器
+
+    level为zlib压缩级别（1~9，0表示不压缩），小于min_size字节的响应不压缩
+    """
+
+    def __init__(self, level: int = 6, min_size: int = 1024):
+        self.level = level
+        self.min_size = min_size
+        self.stats = CompressionStats()
+
+    @property
+    def enabled(self) -> bool:
+        return self.level > 0
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        """压缩并记录CPU耗时（按线程CPU时间统计，不受其他线程影响）"""
+        start = time.thread_time()
+        compressed = compress(data, encoding, self.level)
+        self.stats.record_dynamic(len(data), len(compressed), time.thread_time() - start)
+        return compressed
+
+    def compress_stream(self, chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+        """流式压缩分块响应，输出完毕后记录一次统计"""
+        if encoding not in ENCODINGS:
+            raise ValueError(f"不支持的编码: {encoding}")
+        # wbits=31为gzip格式，15为zlib格式（HTTP的deflate）
+        stream = zlib.compressobj(self.level, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+        bytes_in = bytes_out = 0
+        cpu_time = 0.0
+        for chunk in chunks:
+            start = time.thread_time()
+            data = stream.compress(chunk)
+            cpu_time += time.thread_time() - start
+            bytes_in += len(chunk)
+            if data:
+                bytes_out += len(data)
+                yield data
+        data = stream.flush()
+        bytes_out += len(data)
+        self.stats.record_dynamic(bytes_in, bytes_out, cpu_time)
+        yield data
+
+
+def benchmark_compression(log_path: str = 'adsb_decoded.log', repeat: int = 50):
+    """用解码日志中的飞机数据生成API响应，比较各压缩级别的压缩比和耗时"""
+    latest = {}
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split(',')
+            if len(parts) < 11:
+                continue
+            latest[parts[1]] = {
+                'icao': parts[1], 'lat': float(parts[2]), 'lon': float(parts[3]),
+                'alt': int(parts[4]), 'timestamp': parts[0], 'time_diff': 12.345678,
+                'ecef_x': float(parts[5]), 'ecef_y': float(parts[6]), 'ecef_z': float(parts[7]),
+                'enu_e': float(parts[8]), 'enu_n': float(parts[9]), 'enu_u': float(parts[10]),
+            }
+    body = json.dumps({'status': 'success', 'count': len(latest),
+                       'aircraft': list(latest.values())}).encode('utf-8')
+    print(f"压缩基准测试: {len(latest)} 架飞机的JSON响应, {len(body) / 1024:.1f} KB")
+
+    for encoding in ENCODINGS:
+        for level in (1, 6, 9):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                compressed = compress(body, encoding, level)
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f"{encoding:>7} 级别{level}: {len(compressed) / 1024:6.1f} KB "
+                  f"({len(body) / len(compressed):.1f}x), {elapsed * 1000:.3f} ms/次")
+
+
+if __name__ == '__main__':
+    benchmark_compression()
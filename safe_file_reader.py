@@ -4,10 +4,15 @@
 """
 
 import os
+import sys
 import time
 import errno
+import tempfile
+from collections import deque
 from datetime import datetime
-from typing import List, Optional
+from typing import Iterator, List, Optional
+
+from metrics import REGISTRY
 
 # 尝试导入fcntl（仅在Unix/Linux系统可用）
 try:
@@ -16,6 +21,12 @@ try:
 except ImportError:
     HAS_FCNTL = False
 
+# 增量读取的指标（由采集线程单线程更新）
+READ_SECONDS = REGISTRY.histogram('adsb_reader_read_seconds', '一次增量读取并解析日志的耗时')
+READ_LINES = REGISTRY.counter('adsb_reader_lines_total', '读取的日志行数')
+PARSE_ERRORS = REGISTRY.counter('adsb_reader_parse_errors_total', '无法解析的日志行数')
+
+
 class SafeFileReader:
     """安全的文件读取器，避免与写入进程冲突"""
     
@@ -63,7 +74,8 @@ class SafeFileReader:
                 return []
             
             # 打开文件并尝试获取共享锁
-            with open(self.file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            # 二进制模式读取：读取位置和消费长度都按字节计算，完整行再解码
+            with open(self.file_path, 'rb') as f:
                 # 在Windows上或没有fcntl时，使用简单读取
                 if not HAS_FCNTL or os.name == 'nt':
                     return self._read_windows_safe(f, current_size)
@@ -73,12 +85,17 @@ class SafeFileReader:
         except Exception:
             return []
     
+    def _take_complete_lines(self, content: bytes) -> str:
+        """只消费到最后一个换行符，末尾未写完的行留到下次读取"""
+        complete = content[:content.rfind(b'\n') + 1]
+        self.last_position += len(complete)
+        return complete.decode('utf-8', errors='ignore')
+
     def _read_windows_safe(self, f, current_size: int) -> List[str]:
         """Windows安全读取"""
         try:
             f.seek(self.last_position)
-            new_content = f.read(current_size - self.last_position)
-            self.last_position = current_size
+            new_content = self._take_complete_lines(f.read(current_size - self.last_position))
             self.last_size = current_size
             
             if new_content:
@@ -100,8 +117,7 @@ class SafeFileReader:
             fcntl.flock(f.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
 
             f.seek(self.last_position)
-            new_content = f.read(current_size - self.last_position)
-            self.last_position = current_size
+            new_content = self._take_complete_lines(f.read(current_size - self.last_position))
             self.last_size = current_size
 
             # 释放锁
@@ -121,27 +137,130 @@ class SafeFileReader:
         return []
 
 
+class ReverseLineReader:
+    """从文件末尾按固定大小的块向前读取完整行
+
+    读取量只与需要的行数有关，与文件大小无关；末尾未写完的行会被忽略。
+    """
+
+    def __init__(self, file_path: str, block_size: int = 64 * 1024):
+        self.file_path = file_path
+        self.block_size = block_size
+        self.end_offset = 0  # 最后一个完整行之后的文件偏移
+
+    def iter_reversed(self) -> Iterator[bytes]:
+        """从最后一个完整行开始倒序逐行返回（不含换行符）"""
+        self.end_offset = 0
+        if not os.path.exists(self.file_path):
+            return
+
+        with open(self.file_path, 'rb') as f:
+            position = f.seek(0, os.SEEK_END)
+            buffer = b''
+            found_end = False
+
+            while position > 0:
+                read_size = min(self.block_size, position)
+                position -= read_size
+                f.seek(position)
+                buffer = f.read(read_size) + buffer
+
+                if not found_end:
+                    # 丢弃末尾未写完的行
+                    newline = buffer.rfind(b'\n')
+                    if newline < 0:
+                        continue
+                    self.end_offset = position + newline + 1
+                    buffer = buffer[:newline]
+                    found_end = True
+
+                lines = buffer.split(b'\n')
+                buffer = lines[0]  # 第一段可能不完整，留到下一块
+                for line in reversed(lines[1:]):
+                    if line.strip():
+                        yield line
+
+            if found_end and buffer.strip():
+                yield buffer
+
+    def tail(self, max_lines: int = 100) -> List[str]:
+        """返回最后max_lines个完整行（按文件顺序）"""
+        lines = []
+        if max_lines <= 0:
+            return lines
+        for line in self.iter_reversed():
+            lines.append(line.decode('utf-8', errors='ignore').strip())
+            if len(lines) >= max_lines:
+                break
+        lines.reverse()
+        return lines
+
+    def since(self, since_time: float, max_lines: Optional[int] = None) -> List[str]:
+        """返回时间戳晚于since_time（Unix时间）的行（按文件顺序）
+
+        日志时间戳格式'YYYY-MM-DD HH:MM:SS[.ffffff]'（微秒为定长6位）可直接按字符串比较，
+        无需逐行解析；比较整个时间戳字段，同一秒内的行按微秒区分，不带微秒的旧格式视为整秒
+        """
+        seconds, micros = divmod(int(since_time * 1000000), 1000000)
+        since_str = (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds)) +
+                     f'.{micros:06d}').encode('ascii')
+        lines = []
+        for line in self.iter_reversed():
+            if line.split(b',', 1)[0] <= since_str:
+                break
+            lines.append(line.decode('utf-8', errors='ignore').strip())
+            if max_lines is not None and len(lines) >= max_lines:
+                break
+        lines.reverse()
+        return lines
+
+
 class SafeADSBDataReader:
     """安全的ADS-B数据读取器"""
     
-    def __init__(self, log_file_path: str = 'adsb_decoded.log'):
+    def __init__(self, log_file_path: str = 'adsb_decoded.log', initial_lines: Optional[int] = None):
         self.log_file_path = log_file_path
         self.file_reader = SafeFileReader(log_file_path)
         self.data_cache = {}
         self.last_cleanup = time.time()
+        # 首次读取时只从文件末尾读取最后initial_lines行（None表示从头读取整个文件）
+        self.initial_lines = initial_lines
+        self._started = False
+        # 时间戳解析缓存：同一秒内的多行共用一次strptime
+        self._last_timestamp = None
+        self._last_timestamp_unix = 0.0
+        self.lines_read = 0  # 累计读取的行数（含无法解析的行）
+
+    def read_new_records(self) -> List[dict]:
+        """读取新增行并解析为记录列表（按文件顺序，不去重），同时更新data_cache"""
+        start = time.perf_counter()
+        if not self._started and self.initial_lines is not None:
+            reader = ReverseLineReader(self.log_file_path)
+            new_lines = reader.tail(self.initial_lines)
+            self.file_reader.last_position = reader.end_offset
+            self.file_reader.last_size = reader.end_offset
+        else:
+            new_lines = self.file_reader.read_new_lines()
+        self._started = True
+        self.lines_read += len(new_lines)
+
+        records = []
+        for line in new_lines:
+            aircraft_data = self._parse_line(line)
+            if aircraft_data:
+                self.data_cache[aircraft_data['icao']] = aircraft_data
+                records.append(aircraft_data)
+        READ_LINES.inc(len(new_lines))
+        if len(records) < len(new_lines):
+            PARSE_ERRORS.inc(len(new_lines) - len(records))
+        READ_SECONDS.observe(time.perf_counter() - start)
+        return records
         
     def get_latest_data(self) -> dict:
         """获取最新的飞机数据"""
         try:
-            # 读取新行
-            new_lines = self.file_reader.read_new_lines()
-            
-            # 解析新数据
-            for line in new_lines:
-                aircraft_data = self._parse_line(line)
-                if aircraft_data:
-                    icao = aircraft_data['icao']
-                    self.data_cache[icao] = aircraft_data
+            # 读取并解析新行
+            self.read_new_records()
             
             # 定期清理过期数据
             current_time = time.time()
@@ -159,11 +278,17 @@ class SafeADSBDataReader:
         """解析日志行 - 使用nav.py的原始时间戳"""
         try:
             parts = line.strip().split(',')
-            if len(parts) >= 11:
-                # 解析nav.py输出的时间戳格式: 'YYYY-MM-DD HH:MM:SS'
+            if len(parts) >= 5:
+                # 解析nav.py输出的时间戳格式: 'YYYY-MM-DD HH:MM:SS[.ffffff]'（接收时间）
                 nav_timestamp = parts[0]
-                nav_time = datetime.strptime(nav_timestamp, '%Y-%m-%d %H:%M:%S')
-                nav_time_unix = nav_time.timestamp()
+                second = nav_timestamp[:19]
+                if second != self._last_timestamp:
+                    nav_time = datetime.strptime(second, '%Y-%m-%d %H:%M:%S')
+                    self._last_timestamp_unix = nav_time.timestamp()
+                    self._last_timestamp = second
+                nav_time_unix = self._last_timestamp_unix
+                if len(nav_timestamp) > 19:
+                    nav_time_unix += float(nav_timestamp[19:])
 
                 icao = parts[1]
 
@@ -178,12 +303,16 @@ class SafeADSBDataReader:
                     'latitude': float(parts[2]),
                     'longitude': float(parts[3]),
                     'altitude': int(parts[4]),
-                    'ecef_x': float(parts[5]),
-                    'ecef_y': float(parts[6]),
-                    'ecef_z': float(parts[7]),
-                    'enu_e': float(parts[8]),
-                    'enu_n': float(parts[9]),
-                    'enu_u': float(parts[10]),
+                    # 旧格式日志只有经纬度和高度，缺少的坐标为None
+                    'ecef_x': float(parts[5]) if len(parts) >= 8 else None,
+                    'ecef_y': float(parts[6]) if len(parts) >= 8 else None,
+                    'ecef_z': float(parts[7]) if len(parts) >= 8 else None,
+                    'enu_e': float(parts[8]) if len(parts) >= 11 else None,
+                    'enu_n': float(parts[9]) if len(parts) >= 11 else None,
+                    'enu_u': float(parts[10]) if len(parts) >= 11 else None,
+                    # 解码完成、写入日志距接收的毫秒数（旧格式日志没有）
+                    'decode_ms': float(parts[11]) if len(parts) >= 13 else None,
+                    'write_ms': float(parts[12]) if len(parts) >= 13 else None,
                     'last_seen': time.time(),  # 系统接收时间
                     'timestamp': nav_timestamp  # 保持兼容性
                 }
@@ -220,5 +349,49 @@ def test_safe_reader():
         print(f"第{i+1}次读取: 发现 {len(data)} 架飞机")
         time.sleep(2)
 
+def benchmark_tail_reader(sizes_mb=(10, 100, 1024, 3072), sample_log: str = 'adsb_decoded.log'):
+    """在不同大小的合成日志上对比整文件扫描与倒序块读取取最后100行的耗时"""
+    print("日志尾部读取基准测试")
+
+    with open(sample_log, 'rb') as f:
+        sample = f.read()
+    chunk = sample * max(1, (4 * 1024 * 1024) // len(sample))  # 约4MB的写入块
+    last_time = sample.rstrip(b'\n').split(b'\n')[-1][:19].decode('ascii')
+    since_time = time.mktime(time.strptime(last_time, '%Y-%m-%d %H:%M:%S')) - 30
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'adsb_decoded.log')
+        written = 0
+        with open(path, 'wb') as f:
+            for size_mb in sizes_mb:
+                while written < size_mb * 1024 * 1024:
+                    f.write(chunk)
+                    written += len(chunk)
+                f.flush()
+
+                # 整文件扫描（readlines()[-100:]的下界，避免大文件占满内存）
+                start = time.perf_counter()
+                with open(path, 'r', encoding='utf-8') as log:
+                    scanned = list(deque(log, maxlen=100))
+                scan_time = time.perf_counter() - start
+
+                reader = ReverseLineReader(path)
+                start = time.perf_counter()
+                tail = reader.tail(100)
+                tail_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                recent = reader.since(since_time)
+                since_time_cost = time.perf_counter() - start
+
+                assert [line.strip() for line in scanned] == tail
+                print(f"{written / 1024 / 1024:8.0f} MB: 整文件扫描 {scan_time * 1000:9.1f} ms, "
+                      f"tail(100) {tail_time * 1000:6.2f} ms, "
+                      f"since(最近30秒, {len(recent)} 行) {since_time_cost * 1000:6.2f} ms")
+
+
 if __name__ == '__main__':
-    test_safe_reader()
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark_tail_reader()
+    else:
+        test_safe_reader()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+运行时采样分析器
+后台线程按固定频率用sys._current_frames()采集所有线程的调用栈，累计为折叠栈
+（collapsed stacks，每行"线程;外层函数;...;内层函数 次数"），可直接交给
+flamegraph.pl、speedscope、inferno等工具生成火焰图；不需要停止服务。
+
+另有cProfile固定时长采集：cProfile只能在被分析的线程内启用，长期运行的循环
+（nav.py主循环、采集线程、HTTP请求处理）在每次迭代调用checkpoint()，
+采集窗口内第一次调用时为该线程启用cProfile，窗口结束后的下一次调用停用，
+窗口结束时合并各线程的结果写入.prof文件（pstats/snakeviz可读）和文本摘要。
+
+运行时开关：SIGUSR1开始/停止采样，SIGUSR2开始一次cProfile采集（Unix）；
+Web服务还可通过 /admin/profile 控制（需以 --profiler 启动）。
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+DEFAULT_RATE = 100        # 采样频率（次/秒）
+DEFAULT_CPROFILE_SECONDS = 30.0
+MAX_DEPTH = 128           # 每个栈最多记录的帧数
+
+
+def _timestamp() -> str:
+    """输出文件名中的时间和进程号（多进程模式下各工作进程写入同一目录）"""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+
+class SamplingProfiler:
+    """采样分析器（线程安全）：start()开始采样，stop()停止并写出折叠栈文件"""
+
+    def __init__(self, rate: float = DEFAULT_RATE, output_dir: str = 'profiles'):
+        self.rate = rate
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.stacks: Counter = Counter()  # 折叠栈 -> 采样次数
+        self.samples = 0
+        self.sample_time = 0.0            # 采样本身的耗时（秒），用于估计开销
+        self.started_at = 0.0
+        self.last_output: Optional[str] = None
+        self._labels: Dict[object, str] = {}  # code对象 -> 帧标签
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> bool:
+        """开始采样（已在运行时返回False）"""
+        with self.lock:
+            if self._thread is not None:
+                return False
+            self.stacks = Counter()
+            self.samples = 0
+            self.sample_time = 0.0
+            self.started_at = time.time()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> Optional[str]:
+        """停止采样并写出折叠栈文件，返回文件路径（未在运行时返回None）"""
+        with self.lock:
+            thread = self._thread
+            if thread is None:
+                return None
+            self._stop_event.set()
+            self._thread = None
+        thread.join()
+        self.last_output = self.write(os.path.join(self.output_dir, f'profile-{_timestamp()}.collapsed'))
+        return self.last_output
+
+    def toggle(self) -> Optional[str]:
+        """运行中则停止并返回文件路径，否则开始采样"""
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+            self._labels[code] = label
+        return label
+
+    def sample(self):
+        """采集一次所有线程（不含采样线程自身）的调用栈"""
+        start = time.perf_counter()
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}'))
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+        self.samples += 1
+        self.sample_time += time.perf_counter() - start
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        next_sample = time.monotonic()
+        while True:
+            next_sample += interval
+            if self._stop_event.wait(max(0.0, next_sample - time.monotonic())):
+                break
+            self.sample()
+
+    def write(self, path: str) -> str:
+        """写出折叠栈文件（每行"栈 次数"）"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def status(self) -> dict:
+        """运行状态（API输出格式）"""
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            'running': self.running,
+            'rate': self.rate,
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+            'sample_ms': self.sample_time / self.samples * 1000 if self.samples else 0.0,
+            'overhead': self.sample_time / elapsed if elapsed > 0 else 0.0,  # 采样耗时占墙上时间的比例
+            'last_output': self.last_output,
+        }
+
+
+class CProfileWindow:
+    """一次cProfile采集窗口：各线程在checkpoint()中自行启用和停用cProfile"""
+
+    def __init__(self, seconds: float, output_dir: str = 'profiles', grace: float = 3.0):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        self.path = os.path.join(output_dir, f'cprofile-{_timestamp()}.prof')
+        self.grace = grace  # 窗口结束后最多等待各线程停用cProfile的时间（秒）
+        self.lock = threading.Lock()
+        # 各线程的[线程, Profile, 是否已停用]；线程退出后ID会被复用，因此按threading.local查找本线程的项
+        self.profiles: List[list] = []
+        self.local = threading.local()
+        self.done = threading.Event()
+        self.summary = ''
+
+    def checkpoint(self):
+        entry = getattr(self.local, 'entry', None)
+        if time.monotonic() < self.deadline:
+            if entry is None:
+                profile = cProfile.Profile()
+                self.local.entry = [threading.current_thread(), profile, False]
+                with self.lock:
+                    self.profiles.append(self.local.entry)
+                profile.enable()
+        elif entry is not None and not entry[2]:
+            entry[1].disable()
+            entry[2] = True
+
+    def pending(self) -> Dict[int, list]:
+        """已启用cProfile、尚未停用且仍在运行的线程（线程ID -> 项）"""
+        with self.lock:
+            return {entry[0].ident: entry for entry in self.profiles if not entry[2] and entry[0].is_alive()}
+
+    def finish(self) -> Dict[int, list]:
+        """等待窗口结束，合并已停用（或线程已退出）的各线程结果并写出文件
+
+        返回等待grace秒后仍未停用的线程（结果不完整，不计入），由调用方在其下次checkpoint()时停用
+        """
+        time.sleep(max(0.0, self.deadline - time.monotonic()))
+        give_up = time.monotonic() + self.grace
+        while self.pending() and time.monotonic() < give_up:
+            time.sleep(0.05)
+        pending = self.pending()
+        waiting = {id(entry) for entry in pending.values()}
+        with self.lock:
+            entries = [entry for entry in self.profiles if id(entry) not in waiting]
+        stats = None
+        threads = 0
+        for thread, profile, disabled in entries:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            threads += 1
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if stats is not None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            stats.dump_stats(self.path)
+            text = io.StringIO()
+            stats.stream = text
+            stats.sort_stats('cumulative').print_stats(40)
+            with open(self.path[:-5] + '.txt', 'w', encoding='utf-8') as f:
+                f.write(text.getvalue())
+            self.summary = f"{threads} 个线程, 写入 {self.path}"
+        else:
+            self.path = None
+            self.summary = '窗口内没有线程到达checkpoint'
+        self.done.set()
+        return pending
+
+
+# 当前的cProfile采集窗口（没有时为None，checkpoint()只做一次判断）
+_window: Optional[CProfileWindow] = None
+_window_lock = threading.Lock()
+_last_window: Optional[CProfileWindow] = None  # 最近完成的一次采集
+# 窗口结束时仍未停用cProfile的线程：线程ID -> [线程, Profile, 是否已停用]
+_stale: Dict[int, list] = {}
+
+
+def checkpoint():
+    """长期运行的循环每次迭代调用：cProfile采集窗口内为当前线程启用/停用cProfile"""
+    window = _window
+    if window is not None:
+        window.checkpoint()
+    elif _stale:
+        entry = _stale.pop(threading.get_ident(), None)
+        if entry is not None and entry[0] is threading.current_thread():
+            entry[1].disable()
+
+
+def start_cprofile(seconds: float = DEFAULT_CPROFILE_SECONDS, output_dir: str = 'profiles',
+                   on_done=None) -> Optional[CProfileWindow]:
+    """开始一次cProfile采集（已有采集在进行时返回None），结束后调用on_done(window)"""
+    global _window
+    with _window_lock:
+        if _window is not None:
+            return None
+        window = _window = CProfileWindow(seconds, output_dir)
+
+    def run():
+        global _window, _last_window
+        try:
+            _stale.update(window.finish())
+        finally:
+            with _window_lock:
+                _window = None
+                _last_window = window
+        if on_done is not None:
+            on_done(window)
+
+    threading.Thread(target=run, name='cprofile-window', daemon=True).start()
+    return window
+
+
+def cprofile_status() -> dict:
+    """cProfile采集的状态（API输出格式）：是否正在采集和最近一次的结果"""
+    window = _window
+    status = {'running': window is not None}
+    if window is not None:
+        status.update(seconds=window.seconds, remaining=max(0.0, window.deadline - time.monotonic()),
+                      threads=len(window.profiles))
+    if _last_window is not None:
+        status.update(last_output=_last_window.path, last_summary=_last_window.summary)
+    return status
+
+
+def install_signal_handlers(profiler: SamplingProfiler,
+                            cprofile_seconds: float = DEFAULT_CPROFILE_SECONDS) -> bool:
+    """SIGUSR1开始/停止采样，SIGUSR2开始一次cProfile采集（只能在主线程调用；Windows不支持，返回False）"""
+    if not hasattr(signal, 'SIGUSR1'):
+        return False
+
+    def on_sampling(signum, frame):
+        # 写文件放到其他线程，信号处理函数尽快返回
+        if profiler.running:
+            threading.Thread(target=lambda: print(f"采样分析已停止: {profiler.stop()}"), daemon=True).start()
+        else:
+            profiler.start()
+            print(f"采样分析已开始（{profiler.rate} 次/秒），再次发送SIGUSR1停止")
+
+    def on_cprofile(signum, frame):
+        window = start_cprofile(cprofile_seconds, profiler.output_dir,
+                                on_done=lambda w: print(f"cProfile采集完成: {w.summary}"))
+        if window is not None:
+            print(f"cProfile采集 {cprofile_seconds:.0f} 秒")
+
+    signal.signal(signal.SIGUSR1, on_sampling)
+    signal.signal(signal.SIGUSR2, on_cprofile)
+    return True
+
+
+def benchmark_profiler(seconds: float = 2.0, rates=(0, 100, 500), threads: int = 4, rounds: int = 2):
+    """在多线程CPU负载下比较不同采样频率的吞吐量损失（交替运行多轮取最好值），并做一次cProfile采集
+
+    采样线程持有GIL遍历各线程的栈，“占”为采样耗时占墙上时间的比例，即对其他线程的开销上限；
+    单核机器上吞吐量受线程调度影响，波动可能大于该开销
+    """
+    print(f"采样分析器测试: {threads} 个工作线程, 每个频率 {rounds} 轮 x {seconds:.0f} 秒")
+
+    def workload(stop: threading.Event, counts: list, index: int):
+        def parse(line):
+            parts = line.split(',')
+            return float(parts[2]) + float(parts[3]) + int(parts[4])
+
+        line = '2025-06-26 10:00:00.123456,ABC123,40.1,116.3,35000,1,2,3,4,5,6,0.05,0.1'
+        while not stop.is_set():
+            checkpoint()
+            for _ in range(200):
+                parse(line)
+            counts[index] += 200
+
+    profiler = SamplingProfiler(output_dir=os.path.join(os.getcwd(), 'profiles'))
+    best = {rate: 0.0 for rate in rates}
+    results = {}
+    for _ in range(rounds):
+        for rate in rates:
+            stop = threading.Event()
+            counts = [0] * threads
+            workers = [threading.Thread(target=workload, args=(stop, counts, i), name=f'worker-{i}')
+                       for i in range(threads)]
+            for worker in workers:
+                worker.start()
+            if rate:
+                profiler.rate = rate
+                profiler.start()
+            time.sleep(seconds)
+            status = profiler.status()
+            path = profiler.stop() if rate else None
+            stop.set()
+            for worker in workers:
+                worker.join()
+            best[rate] = max(best[rate], sum(counts) / seconds)
+            results[rate] = (status, path)
+
+    baseline = best[rates[0]]
+    for rate in rates:
+        line = f"  {rate:>4} 次/秒: {best[rate]:,.0f} 行/秒 ({(best[rate] / baseline - 1) * 100:+.1f}%)"
+        if rate:
+            status, path = results[rate]
+            line += (f", {status['samples']} 次采样, 每次 {status['sample_ms']:.3f} ms"
+                     f"（占 {status['overhead'] * 100:.2f}%）, {status['stacks']} 个不同的栈 -> {path}")
+        print(line)
+
+    stop = threading.Event()
+    counts = [0]
+    worker = threading.Thread(target=workload, args=(stop, counts, 0), name='worker-0')
+    worker.start()
+    window = start_cprofile(1.0, profiler.output_dir)
+    window.done.wait()
+    stop.set()
+    worker.join()
+    print(f"cProfile 1 秒: {window.summary}")
+
+
+if __name__ == '__main__':
+    benchmark_profiler()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+单飞（single-flight）响应缓存
+同一个键同时只有一个线程构建结果，其余并发请求等待并复用该结果；
+构建完成的结果在短TTL内继续直接返回（微缓存）
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """正在进行的一次构建"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlightCache:
+    """带TTL微缓存的单飞缓存（线程安全）
+
+    ttl为0时只合并并发构建，不缓存结果；max_entries限制缓存的条目数
+    """
+
+    def __init__(self, ttl: float = 1.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: Dict[Hashable, tuple] = {}  # 键 -> (结果, 过期时间)
+        self.inflight: Dict[Hashable, _Call] = {}
+        self.hits = 0    # 直接命中微缓存
+        self.joins = 0   # 等待并复用其他线程的构建结果
+        self.builds = 0  # 实际构建次数
+
+    def get(self, key: Hashable, build: Callable[[], object]):
+        """返回键对应的结果，必要时调用build构建"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self.inflight[key] = _Call()
+                self.builds += 1
+            else:
+                self.joins += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = build()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+                if call.error is None and self.ttl > 0:
+                    self._store(key, call.value, time.monotonic() + self.ttl)
+            call.done.set()
+        return call.value
+
+    def _store(self, key: Hashable, value, expires: float):
+        """写入缓存，超过容量时先清理过期条目，再淘汰最早写入的条目（调用方需持有lock）"""
+        self.entries.pop(key, None)
+        self.entries[key] = (value, expires)
+        if len(self.entries) > self.max_entries:
+            now = time.monotonic()
+            for stale in [k for k, (_, e) in self.entries.items() if e <= now]:
+                del self.entries[stale]
+            while len(self.entries) > self.max_entries:
+                del self.entries[next(iter(self.entries))]
+
+    def stats(self) -> dict:
+        """命中、合并和构建计数"""
+        with self.lock:
+            return {'hits': self.hits, 'joins': self.joins, 'builds': self.builds,
+                    'entries': len(self.entries), 'ttl': self.ttl}
+
+
+def benchmark_single_flight(threads: int = 200, build_time: float = 0.05):
+    """模拟200个并发请求同时请求同一版本的快照"""
+    cache = SingleFlightCache(ttl=1.0)
+    built = []
+
+    def build():
+        time.sleep(build_time)
+        built.append(1)
+        return b'snapshot'
+
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        cache.get(('/api/aircraft/', 1), build)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    elapsed = time.perf_counter() - start
+    print(f"单飞缓存测试: {threads} 个并发请求, 构建耗时 {build_time * 1000:.0f} ms")
+    print(f"实际构建 {len(built)} 次, 总耗时 {elapsed * 1000:.0f} ms, 计数 {cache.stats()}")
+
+
+if __name__ == '__main__':
+    benchmark_single_flight()
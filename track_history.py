@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+飞机航迹历史
+每架飞机使用固定容量的环形缓冲区保存历史点，各字段分别存放在array('d')中，
+避免为每个点创建字典对象；读取时只拷贝请求的片段
+"""
+
+import tracemalloc
+from array import array
+from typing import Dict, List, Optional
+
+# 每个航迹点保存的字段（与日志/API字段对应）
+TRACK_FIELDS = ('time', 'lat', 'lon', 'alt', 'enu_e', 'enu_n', 'enu_u')
+
+
+class TrackBuffer:
+    """单架飞机的环形航迹缓冲区
+
+    缓冲区按需增长到capacity，之后覆盖最旧的点。
+    """
+
+    def __init__(self, capacity: int = 300):
+        self.capacity = capacity
+        self.columns = {name: array('d') for name in TRACK_FIELDS}
+        self.start = 0  # 最旧点所在的物理下标
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, t: float, lat: float, lon: float, alt: float,
+               enu_e: float, enu_n: float, enu_u: float):
+        """追加一个航迹点"""
+        values = (t, lat, lon, alt, enu_e, enu_n, enu_u)
+        if self.count < self.capacity:
+            for name, value in zip(TRACK_FIELDS, values):
+                self.columns[name].append(value)
+            self.count += 1
+        else:
+            # 已满：覆盖最旧的点
+            index = self.start
+            for name, value in zip(TRACK_FIELDS, values):
+                self.columns[name][index] = value
+            self.start = (self.start + 1) % self.capacity
+
+    @property
+    def last_time(self) -> Optional[float]:
+        """最新点的时间"""
+        if not self.count:
+            return None
+        return self.columns['time'][(self.start + self.count - 1) % self.capacity]
+
+    def _physical(self, logical: int) -> int:
+        return (self.start + logical) % self.capacity
+
+    def index_since(self, since: float) -> int:
+        """二分查找第一个时间 >= since 的逻辑下标"""
+        times = self.columns['time']
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if times[self._physical(mid)] < since:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def segments(self, first: int, last: int) -> List[tuple]:
+        """将逻辑区间[first, last)映射为至多两个物理连续区间"""
+        if first >= last:
+            return []
+        begin = self._physical(first)
+        length = last - first
+        if begin + length <= len(self.columns['time']):
+            return [(begin, begin + length)]
+        head = len(self.columns['time']) - begin
+        return [(begin, len(self.columns['time'])), (0, length - head)]
+
+    def view(self, name: str, first: int = 0, last: Optional[int] = None) -> List[memoryview]:
+        """返回某字段在逻辑区间内的内存视图（不拷贝数据）"""
+        if last is None:
+            last = self.count
+        column = memoryview(self.columns[name])
+        return [column[a:b] for a, b in self.segments(first, last)]
+
+    def slice(self, since: Optional[float] = None, last_n: Optional[int] = None,
+              fields=TRACK_FIELDS) -> Dict[str, list]:
+        """按时间和点数截取航迹，只拷贝所选片段，返回按字段分列的数据"""
+        first = 0 if since is None else self.index_since(since)
+        if last_n is not None:
+            first = max(first, self.count - last_n)
+
+        result = {}
+        for name in fields:
+            values = []
+            for part in self.view(name, first):
+                values.extend(part.tolist())
+            result[name] = values
+        return result
+
+    def nbytes(self) -> int:
+        """缓冲区数据占用的字节数"""
+        return sum(column.buffer_info()[1] * column.itemsize for column in self.columns.values())
+
+
+class TrackHistory:
+    """按ICAO管理所有飞机的航迹缓冲区"""
+
+    def __init__(self, capacity: int = 300):
+        self.capacity = capacity
+        self.tracks: Dict[str, TrackBuffer] = {}
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def __contains__(self, icao: str) -> bool:
+        return icao in self.tracks
+
+    def get(self, icao: str) -> Optional[TrackBuffer]:
+        """获取指定飞机的航迹"""
+        return self.tracks.get(icao)
+
+    def _buffer(self, icao: str) -> TrackBuffer:
+        track = self.tracks.get(icao)
+        if track is None:
+            track = self.tracks[icao] = TrackBuffer(self.capacity)
+        return track
+
+    def append_position(self, position):
+        """从nav.py的AircraftPosition追加航迹点"""
+        self._buffer(position.icao).append(
+            position.timestamp, position.latitude, position.longitude, position.altitude,
+            position.enu_e, position.enu_n, position.enu_u
+        )
+
+    def append_state(self, state):
+        """从aircraft_store.AircraftState追加航迹点"""
+        self._buffer(state.icao).append(
+            state.time, state.lat, state.lon, state.alt,
+            state.enu_e, state.enu_n, state.enu_u
+        )
+
+    def remove(self, icao: str):
+        """移除指定飞机的航迹"""
+        self.tracks.pop(icao, None)
+
+    def nbytes(self) -> int:
+        """所有航迹数据占用的字节数"""
+        return sum(track.nbytes() for track in self.tracks.values())
+
+
+def benchmark_track_memory(aircraft_count: int = 10000, capacity: int = 300):
+    """统计满容量时每架飞机的航迹内存占用"""
+    print(f"航迹内存测试: {aircraft_count} 架飞机, 每架 {capacity} 个点")
+
+    tracemalloc.start()
+    history = TrackHistory(capacity)
+    for i in range(aircraft_count):
+        icao = f"{i:06X}"
+        for k in range(capacity):
+            history._buffer(icao).append(k, 39.0 + k * 1e-4, 117.0, 10000, k * 10.0, 0.0, 0.0)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"数组数据: {history.nbytes() / aircraft_count / 1024:.1f} KB/架")
+    print(f"总内存(含对象开销): {current / aircraft_count / 1024:.1f} KB/架, "
+          f"共 {current / 1024 / 1024:.1f} MB")
+
+    # 对照：同样的数据用字典列表保存
+    tracemalloc.start()
+    dict_tracks = {f"{i:06X}": [dict(zip(TRACK_FIELDS, (k, 39.0, 117.0, 10000.0, 0.0, 0.0, 0.0)))
+                                for k in range(capacity)]
+                   for i in range(min(aircraft_count, 1000))}
+    dict_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"对照(字典列表): {dict_current / len(dict_tracks) / 1024:.1f} KB/架")
+
+
+if __name__ == '__main__':
+    benchmark_track_memory()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+航迹简化
+在线简化（开窗法）：逐点判断缓存的点是否偏离起点到最新点的直线超过容差，
+只保留转折处的点，可作为DataLogger的写入过滤器；
+离线简化（Douglas-Peucker）：用于航迹查询结果的抽稀
+水平容差单位为ENU米，垂直容差单位为英尺
+"""
+
+import math
+from typing import List, Optional, Sequence, Tuple
+
+from coord_converter import CoordinateConverter
+
+
+def segment_deviation(e: float, n: float, alt: float,
+                      e0: float, n0: float, alt0: float,
+                      e1: float, n1: float, alt1: float) -> Tuple[float, float]:
+    """计算点到线段的水平距离（米）和按投影位置插值的高度偏差（英尺）"""
+    de = e1 - e0
+    dn = n1 - n0
+    length_sq = de * de + dn * dn
+    if length_sq > 0:
+        ratio = ((e - e0) * de + (n - n0) * dn) / length_sq
+        ratio = max(0.0, min(1.0, ratio))
+    else:
+        ratio = 0.0
+    horizontal = math.hypot(e - (e0 + ratio * de), n - (n0 + ratio * dn))
+    vertical = abs(alt - (alt0 + ratio * (alt1 - alt0)))
+    return horizontal, vertical
+
+
+class TrackSimplifier:
+    """单架飞机的在线航迹简化器（开窗法）
+
+    点格式为 (enu_e, enu_n, alt, 附加数据)。新点到来时检查窗口内所有缓存点到
+    "锚点→新点"直线的偏差，超过容差时保留上一个点作为新的锚点。
+    """
+
+    def __init__(self, tolerance_m: float = 50.0, tolerance_ft: float = 100.0,
+                 max_window: int = 60):
+        self.tolerance_m = tolerance_m
+        self.tolerance_ft = tolerance_ft
+        self.max_window = max_window  # 窗口最多缓存的点数，超过时强制保留
+        self.anchor = None
+        self.window: list = []
+
+    def _fits(self, point) -> bool:
+        """窗口内的点是否都在锚点到point的直线容差范围内"""
+        e0, n0, alt0 = self.anchor[:3]
+        e1, n1, alt1 = point[:3]
+        for q in self.window:
+            horizontal, vertical = segment_deviation(q[0], q[1], q[2], e0, n0, alt0, e1, n1, alt1)
+            if horizontal > self.tolerance_m or vertical > self.tolerance_ft:
+                return False
+        return True
+
+    def push(self, point) -> Optional[tuple]:
+        """加入新点，返回被确定保留的点（没有则返回None）"""
+        if self.anchor is None:
+            self.anchor = point
+            return point
+
+        if self.window and (len(self.window) >= self.max_window or not self._fits(point)):
+            # 直线无法覆盖窗口：保留上一个点作为新锚点
+            kept = self.window[-1]
+            self.anchor = kept
+            self.window = [point]
+            return kept
+
+        self.window.append(point)
+        return None
+
+    def flush(self) -> Optional[tuple]:
+        """输出尚未确定的最后一个点（航迹结束时调用）"""
+        if not self.window:
+            return None
+        kept = self.window[-1]
+        self.anchor = kept
+        self.window = []
+        return kept
+
+
+class SimplifyingFilter:
+    """多架飞机的在线简化过滤器，可作为DataLogger的写入过滤器
+
+    输入AircraftPosition，返回需要写入的位置列表（可能为空）。按位置的接收时间
+    每sweep_interval秒检查一次，超过idle_timeout秒没有新位置的飞机（如已离开覆盖范围）
+    输出其尚未确定的最后一个点并移除对应的简化器，长时间运行时字典不会无限增长
+    """
+
+    def __init__(self, tolerance_m: float = 50.0, tolerance_ft: float = 100.0,
+                 max_window: int = 60, idle_timeout: float = 60.0, sweep_interval: float = 10.0):
+        self.tolerance_m = tolerance_m
+        self.tolerance_ft = tolerance_ft
+        self.max_window = max_window
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.simplifiers = {}
+        self.last_seen = {}  # ICAO -> 最近一个位置的接收时间
+        self.next_sweep = None
+        self.received = 0
+        self.written = 0
+        self.evicted = 0
+
+    def __call__(self, position) -> list:
+        self.received += 1
+        now = position.timestamp
+        self.last_seen[position.icao] = now
+        simplifier = self.simplifiers.get(position.icao)
+        if simplifier is None:
+            simplifier = self.simplifiers[position.icao] = TrackSimplifier(
+                self.tolerance_m, self.tolerance_ft, self.max_window)
+
+        kept = simplifier.push((position.enu_e, position.enu_n, position.altitude, position))
+        positions = [] if kept is None else [kept[3]]
+        if self.next_sweep is None:
+            self.next_sweep = now + self.sweep_interval
+        elif now >= self.next_sweep:
+            self.next_sweep = now + self.sweep_interval
+            positions.extend(self.evict_idle(now))
+        self.written += len(positions)
+        return positions
+
+    def evict_idle(self, now: float) -> list:
+        """移除超过idle_timeout没有新位置的飞机，返回它们尚未确定的最后一个点"""
+        cutoff = now - self.idle_timeout
+        positions = []
+        for icao in [icao for icao, seen in self.last_seen.items() if seen < cutoff]:
+            kept = self.simplifiers.pop(icao).flush()
+            del self.last_seen[icao]
+            self.evicted += 1
+            if kept is not None:
+                positions.append(kept[3])
+        return positions
+
+    def flush(self) -> list:
+        """输出所有飞机尚未确定的最后一个点"""
+        positions = []
+        for simplifier in self.simplifiers.values():
+            kept = simplifier.flush()
+            if kept is not None:
+                positions.append(kept[3])
+        self.written += len(positions)
+        return positions
+
+    def compression_ratio(self) -> float:
+        """输入点数 / 写入点数"""
+        return self.received / self.written if self.written else 0.0
+
+
+def douglas_peucker(e: Sequence[float], n: Sequence[float], alt: Sequence[float],
+                    tolerance_m: float = 50.0, tolerance_ft: float = 100.0) -> List[int]:
+    """Douglas-Peucker抽稀，返回保留点的下标（升序）；tolerance_ft为0时不按高度偏差切分"""
+    count = len(e)
+    if count <= 2:
+        return list(range(count))
+
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst_index = -1
+        worst_score = 1.0  # 偏差/容差的最大值，超过1才需要切分
+        for i in range(first + 1, last):
+            horizontal, vertical = segment_deviation(
+                e[i], n[i], alt[i], e[first], n[first], alt[first], e[last], n[last], alt[last])
+            score = horizontal / tolerance_m
+            if tolerance_ft > 0:
+                score = max(score, vertical / tolerance_ft)
+            if score > worst_score:
+                worst_score = score
+                worst_index = i
+        if worst_index >= 0:
+            keep[worst_index] = True
+            stack.append((first, worst_index))
+            stack.append((worst_index, last))
+
+    return [i for i in range(count) if keep[i]]
+
+
+def max_polyline_deviation(points: Sequence[tuple], kept: Sequence[int]) -> Tuple[float, float]:
+    """计算原始点到保留点连线的最大水平偏差（米）和垂直偏差（英尺）"""
+    max_horizontal = max_vertical = 0.0
+    for a, b in zip(kept, kept[1:]):
+        e0, n0, alt0 = points[a][:3]
+        e1, n1, alt1 = points[b][:3]
+        for i in range(a + 1, b):
+            horizontal, vertical = segment_deviation(*points[i][:3], e0, n0, alt0, e1, n1, alt1)
+            max_horizontal = max(max_horizontal, horizontal)
+            max_vertical = max(max_vertical, vertical)
+    return max_horizontal, max_vertical
+
+
+def evaluate_log(log_path: str = 'adsb_decoded.log', tolerance_m: float = 50.0,
+                 tolerance_ft: float = 100.0):
+    """在解码日志上评估在线简化的压缩比和最大偏差"""
+    converter = CoordinateConverter()
+    tracks = {}
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split(',')
+            if len(parts) < 5:
+                continue
+            lat, lon, alt = float(parts[2]), float(parts[3]), int(parts[4])
+            if len(parts) >= 11:
+                e, n = float(parts[8]), float(parts[9])
+            else:
+                e, n, _ = converter.lla_to_enu(lat, lon, alt * 0.3048)
+            track = tracks.setdefault(parts[1], [])
+            track.append((e, n, alt, len(track)))
+
+    total = kept_total = 0
+    max_horizontal = max_vertical = 0.0
+    for points in tracks.values():
+        simplifier = TrackSimplifier(tolerance_m, tolerance_ft)
+        kept = [p[3] for p in map(simplifier.push, points) if p is not None]
+        last = simplifier.flush()
+        if last is not None:
+            kept.append(last[3])
+
+        horizontal, vertical = max_polyline_deviation(points, kept)
+        max_horizontal = max(max_horizontal, horizontal)
+        max_vertical = max(max_vertical, vertical)
+        total += len(points)
+        kept_total += len(kept)
+
+    print(f"航迹简化评估: {log_path} (容差 {tolerance_m}m / {tolerance_ft}ft)")
+    print(f"飞机数: {len(tracks)}, 原始点数: {total}, 保留点数: {kept_total}")
+    print(f"压缩比: {total / kept_total:.2f}x ({(1 - kept_total / total) * 100:.1f}% 点被丢弃)")
+    print(f"最大偏差: 水平 {max_horizontal:.1f} m, 垂直 {max_vertical:.0f} ft")
+
+
+if __name__ == '__main__':
+    evaluate_log()
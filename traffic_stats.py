@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+增量交通统计
+每收到一条消息或位置只做O(1)的计数更新：飞机总数、近5分钟活跃数、高度层分布、
+滑动窗口内的消息和解码速率、每架飞机的消息数；查询时直接读取计数
+"""
+
+import heapq
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# 高度层划分（英尺）：低空 < 10000 <= 中空 < 33000 <= 高空
+LOW_ALTITUDE_FT = 10000
+HIGH_ALTITUDE_FT = 33000
+ALTITUDE_BANDS = ('low', 'medium', 'high')
+
+# 速率统计的滑动窗口（秒）
+RATE_WINDOWS = (10, 60, 300)
+
+
+def altitude_band(alt: float) -> str:
+    """高度层：low / medium / high"""
+    if alt < LOW_ALTITUDE_FT:
+        return 'low'
+    if alt < HIGH_ALTITUDE_FT:
+        return 'medium'
+    return 'high'
+
+
+class SlidingCounter:
+    """按秒分桶的滑动窗口计数器
+
+    环形数组保存最近window秒每秒的计数，过期的桶在写入或读取时清零，
+    每次操作的开销与经过的秒数有关而与事件数量无关
+    """
+
+    def __init__(self, window: int = 300):
+        self.window = window
+        self.buckets = [0] * window
+        self.current = None  # 最新桶对应的整数秒
+        self.started = None  # 第一个事件的整数秒（启动不足一个窗口时按实际时长计算速率）
+        self.total = 0       # 窗口内的总数
+
+    def _advance(self, second: int):
+        if self.current is None:
+            self.current = self.started = second
+            return
+        if second <= self.current:
+            return
+        steps = min(second - self.current, self.window)
+        for offset in range(1, steps + 1):
+            index = (self.current + offset) % self.window
+            self.total -= self.buckets[index]
+            self.buckets[index] = 0
+        self.current = second
+
+    def add(self, count: int = 1, now: Optional[float] = None):
+        """在时刻now记录count个事件"""
+        if now is None:
+            now = time.time()
+        second = int(now)
+        self._advance(second)
+        if second <= self.current - self.window:
+            return  # 早于窗口的事件忽略
+        self.buckets[second % self.window] += count
+        self.total += count
+
+    def count(self, seconds: Optional[int] = None, now: Optional[float] = None) -> int:
+        """最近seconds秒（含当前秒，默认整个窗口）的事件数"""
+        if now is None:
+            now = time.time()
+        self._advance(int(now))
+        if seconds is None or seconds >= self.window:
+            return self.total
+        if self.current is None:
+            return 0
+        return sum(self.buckets[(self.current - offset) % self.window] for offset in range(seconds))
+
+    def rate(self, seconds: Optional[int] = None, now: Optional[float] = None) -> float:
+        """最近seconds秒的平均速率（次/秒）"""
+        seconds = min(seconds or self.window, self.window)
+        count = self.count(seconds, now)
+        if self.started is None:
+            return 0.0
+        return count / min(seconds, self.current - self.started + 1)
+
+
+class TrafficStatistics:
+    """增量维护的交通统计
+
+    活跃飞机按最近更新顺序保存在OrderedDict中，查询时从最旧的一端淘汰超过
+    active_window的飞机（均摊O(1)）；数据时间基本按到达顺序递增，个别乱序的
+    飞机最多延后一个更新周期被淘汰
+    """
+
+    def __init__(self, active_window: float = 300.0):
+        self.active_window = active_window
+        self.aircraft: Dict[str, list] = {}  # ICAO -> [高度层, 消息数, 最近数据时间]
+        self.band_counts = dict.fromkeys(ALTITUDE_BANDS, 0)
+        self.active: 'OrderedDict[str, float]' = OrderedDict()
+        self.messages = SlidingCounter(max(RATE_WINDOWS))
+        self.decodes = SlidingCounter(max(RATE_WINDOWS))
+        self.total_messages = 0
+        self.total_decodes = 0
+
+    def record_messages(self, count: int = 1, now: Optional[float] = None, replayed: bool = False):
+        """记录收到的消息数（原始报文或日志行）
+
+        replayed为True表示启动时重放的历史数据：只计入总数，不计入速率窗口
+        （否则重启后的速率会出现一个并不存在的突增）
+        """
+        if not replayed:
+            self.messages.add(count, now)
+        self.total_messages += count
+
+    def record_position(self, icao: str, alt: float, data_time: float,
+                        now: Optional[float] = None, replayed: bool = False):
+        """记录一次成功解码的位置（replayed同record_messages）"""
+        if not replayed:
+            self.decodes.add(1, now)
+        self.total_decodes += 1
+
+        band = altitude_band(alt)
+        entry = self.aircraft.get(icao)
+        if entry is None:
+            self.aircraft[icao] = [band, 1, data_time]
+            self.band_counts[band] += 1
+        else:
+            if entry[0] != band:
+                self.band_counts[entry[0]] -= 1
+                self.band_counts[band] += 1
+                entry[0] = band
+            entry[1] += 1
+            entry[2] = data_time
+        self.active[icao] = data_time
+        self.active.move_to_end(icao)
+
+    def record_state(self, state, now: Optional[float] = None, replayed: bool = False):
+        """从aircraft_store.AircraftState记录"""
+        self.record_position(state.icao, state.alt, state.time, now, replayed)
+
+    def record_aircraft_position(self, position, now: Optional[float] = None):
+        """从nav.py的AircraftPosition记录"""
+        self.record_position(position.icao, position.altitude, position.timestamp, now)
+
+    def remove(self, icao: str):
+        """移除飞机（过期清理时调用）"""
+        entry = self.aircraft.pop(icao, None)
+        if entry is not None:
+            self.band_counts[entry[0]] -= 1
+        self.active.pop(icao, None)
+
+    def active_count(self, now: Optional[float] = None) -> int:
+        """最近active_window秒内有更新的飞机数"""
+        if now is None:
+            now = time.time()
+        cutoff = now - self.active_window
+        while self.active:
+            icao, data_time = next(iter(self.active.items()))
+            if data_time >= cutoff:
+                break
+            self.active.popitem(last=False)
+        return len(self.active)
+
+    def message_count(self, icao: str) -> int:
+        """单架飞机的消息数"""
+        entry = self.aircraft.get(icao)
+        return entry[1] if entry is not None else 0
+
+    def top_aircraft(self, n: int = 10) -> List[dict]:
+        """消息数最多的n架飞机"""
+        top = heapq.nlargest(n, self.aircraft.items(), key=lambda item: item[1][1])
+        return [{'icao': icao, 'messages': entry[1]} for icao, entry in top]
+
+    def summary(self, now: Optional[float] = None) -> dict:
+        """统计摘要（API输出格式）"""
+        if now is None:
+            now = time.time()
+        return {
+            'total_aircraft': len(self.aircraft),
+            'active_aircraft': self.active_count(now),
+            'active_window': self.active_window,
+            'altitude_distribution': dict(self.band_counts),
+            'message_rate': {f'{w}s': self.messages.rate(w, now) for w in RATE_WINDOWS},
+            'decode_rate': {f'{w}s': self.decodes.rate(w, now) for w in RATE_WINDOWS},
+            'total_messages': self.total_messages,
+            'total_decodes': self.total_decodes,
+        }
+
+
+def benchmark_statistics(aircraft_count: int = 2000, updates: int = 200000):
+    """比较增量统计与每次请求全量重算的耗时"""
+    print(f"统计基准测试: {aircraft_count} 架飞机, {updates} 次更新")
+    rng = random.Random(5)
+    stats = TrafficStatistics()
+    latest = {}
+    now = time.time()
+
+    start = time.perf_counter()
+    for k in range(updates):
+        icao = f"{rng.randrange(aircraft_count):06X}"
+        alt = rng.randrange(0, 45000, 25)
+        t = now - 600 + k * 600 / updates
+        stats.record_messages(3, t)
+        stats.record_position(icao, alt, t, t)
+        latest[icao] = (alt, t)
+    update_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(100):
+        summary = stats.summary(now)
+    summary_time = (time.perf_counter() - start) / 100
+
+    start = time.perf_counter()
+    for _ in range(100):
+        bands = dict.fromkeys(ALTITUDE_BANDS, 0)
+        active = 0
+        for alt, t in latest.values():
+            bands[altitude_band(alt)] += 1
+            active += now - t < 300
+    recompute_time = (time.perf_counter() - start) / 100
+
+    assert bands == summary['altitude_distribution'] and active == summary['active_aircraft']
+    print(f"增量更新: {update_time / updates * 1e6:.2f} us/次")
+    print(f"查询摘要: {summary_time * 1000:.3f} ms, 全量重算高度分布和活跃数: "
+          f"{recompute_time * 1000:.3f} ms")
+    print(f"活跃 {summary['active_aircraft']} 架, 高度分布 {summary['altitude_distribution']}, "
+          f"解码速率(60s) {summary['decode_rate']['60s']:.0f}/s")
+
+
+if __name__ == '__main__':
+    benchmark_statistics()